@@ -0,0 +1,12 @@
+# I wrote this code
+
+import os
+
+
+def setup():
+    """Configure Django for the benchmark scripts, run from the `midterm` folder with `python -m benchmarks.<name>`."""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'midterm.settings')
+    django.setup()
+
+# end of code I wrote
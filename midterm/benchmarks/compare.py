@@ -0,0 +1,53 @@
+# I wrote this code
+
+"""
+Compare two JSON results of `benchmarks.run`, e.g. from two commits:
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+# Measures compared, and whether a higher value is better
+MEASURES = [('throughput', True), ('p50_ms', False), ('p99_ms', False), ('peak_rss_mb', False)]
+
+# Changes (%) for the worse within this are taken as noise rather than regressions
+NOISE_PERCENT = 5
+
+
+def compare(before, after):
+    """
+    Rows of `(scenario, measure, before, after, change %, regression)` for the scenarios of both results,
+    where `regression` is True when the measure got worse by more than `NOISE_PERCENT`.
+    """
+    rows = []
+    for name, result in after['scenarios'].items():
+        previous = before['scenarios'].get(name)
+        if previous is None or 'error' in previous or 'error' in result:
+            continue
+        for measure, higher_is_better in MEASURES:
+            old, new = previous[measure], result[measure]
+            change = (new - old) / old * 100 if old else 0
+            worse = -change if higher_is_better else change
+            rows.append((name, measure, old, new, change, worse > NOISE_PERCENT))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark results.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as before, open(args.after) as after:
+        before, after = json.load(before), json.load(after)
+
+    print('%s -> %s' % (before.get('commit'), after.get('commit')))
+    for name, measure, old, new, change, regression in compare(before, after):
+        print('%-20s %-12s %12s %12s %+8.1f%%%s' % (name, measure, old, new, change, '  REGRESSION' if regression else ''))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
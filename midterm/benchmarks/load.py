@@ -0,0 +1,273 @@
+# I wrote this code
+
+"""
+Load test of the WSGI deployment under mixed read/write traffic, across gunicorn worker and thread configurations.
+
+Requests pick real protein ids and organisms sampled from the configured database with Zipfian popularity
+(a few keys get most requests, like a real audience), and are sent by concurrent keep-alive connections
+of an asyncio HTTP client (`scripts/load_test.py`). Each configuration `<workers>x<threads>` starts gunicorn
+on a free port, with writes serialized or not (`--serialize-writes`), and reports the throughput,
+latency percentiles and `database is locked` errors of every request kind as JSON:
+
+    PROTEINMAP_DB_NAME=bench.sqlite3 python -m benchmarks.load --config 1x8 --config 4x2 --config 8x1
+    # Against a server already running on the same database
+    PROTEINMAP_DB_NAME=bench.sqlite3 python -m benchmarks.load --url http://127.0.0.1:8000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from itertools import accumulate
+from urllib.parse import urlsplit
+
+from scripts.load_test import request
+
+from . import setup
+from .run import CREATED_PREFIX, commit, create_payloads, percentile, sample_keys
+
+# Directory of `manage.py`, where gunicorn is started
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of each request kind in the traffic when `--mix` is not given
+DEFAULT_MIX = {'protein_detail': 60, 'domain_coverage': 10, 'organism_proteins': 10, 'organism_pfams': 10,
+               'protein_create': 10}
+
+# Keys sampled from the database for each kind of key, ranked by popularity
+DEFAULT_KEYS = 10000
+
+# Seconds to wait for a started server to answer
+STARTUP_TIMEOUT = 60
+
+
+def parse_mix(text):
+    """Request kinds and weights from `kind=weight,...`."""
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError('Unknown request kind %s' % kind)
+        mix[kind] = float(weight or 1)
+    return mix
+
+def parse_config(text):
+    """Workers and threads of a `<workers>x<threads>` configuration."""
+    workers, _, threads = text.partition('x')
+    try:
+        return int(workers), int(threads or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Configurations are written <workers>x<threads>, e.g. 4x2')
+
+def ranked_keys(queryset, field, count, rng):
+    """A random sample of at most `count` distinct values of `field` (on every shard), in random order of popularity."""
+    values = sample_keys(queryset, field, count, rng)
+    rng.shuffle(values)
+    return values
+
+class Zipf:
+    """Draws keys where the key of rank `r` is requested in proportion to `1 / r ** exponent`."""
+    def __init__(self, keys, exponent, rng):
+        self.keys = keys
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / rank ** exponent for rank in range(1, len(keys) + 1)))
+
+    def __call__(self):
+        return self.rng.choices(self.keys, cum_weights=self.cumulative)[0]
+
+def plan(mix, count, keys, exponent, seed):
+    """
+    List of `(kind, method, path, body)` requests drawn from the `mix` of request kinds.
+
+    Rational:
+        requests are drawn before the run, so the client only sends them and draws with the same
+        seed give the same traffic to every configuration. Created proteins have new ids on every plan.
+    """
+    from proteinmap.models import Domain, Organism, Protein
+
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    proteins = Zipf(ranked_keys(Protein.objects.all(), 'protein_id', keys, rng), exponent, rng)
+    covered = Zipf(ranked_keys(Domain.objects.all(), 'protein_id', keys, rng), exponent, rng)
+    organisms = Zipf(ranked_keys(Organism.objects.all(), 'taxa_id', keys, rng), exponent, rng)
+    payloads = iter(create_payloads(kinds.count('protein_create'), rng))
+
+    requests = []
+    for kind in kinds:
+        if kind == 'protein_detail':
+            requests.append((kind, 'GET', '/api/protein/%s/' % proteins(), None))
+        elif kind == 'domain_coverage':
+            requests.append((kind, 'GET', '/api/coverage/%s' % covered(), None))
+        elif kind == 'organism_proteins':
+            requests.append((kind, 'GET', '/api/proteins/%s' % organisms(), None))
+        elif kind == 'organism_pfams':
+            requests.append((kind, 'GET', '/api/pfams/%s' % organisms(), None))
+        else:
+            payload = next(payloads)
+            payload['taxonomy'] = {'taxa_id': organisms()}
+            requests.append((kind, 'POST', '/api/protein/', json.dumps(payload).encode()))
+    return requests
+
+async def client(url, requests, jobs, results):
+    """Send requests from the shared `jobs` until they are exhausted, reconnecting when needed."""
+    connection = None
+    while jobs:
+        kind, method, path, body = requests[jobs.pop()]
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(url.hostname, url.port or 80)
+            status, close, content = await request(*connection, url.netloc, path, method, body)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            status, close, content = None, True, b''
+        results.append((kind, time.perf_counter() - start, status, b'database is locked' in content))
+
+        if close and connection is not None:
+            connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+def summary(results, elapsed):
+    latencies = sorted(latency for _, latency, _, _ in results)
+    errors = sum(status is None or status >= 500 for _, _, status, _ in results)
+    locked = sum(locked for _, _, _, locked in results)
+    return {
+        'requests': len(results),
+        'throughput': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'errors': errors,
+        'locked': locked,
+        'locked_rate': round(locked / len(results), 4),
+    }
+
+async def load(base_url, requests, concurrency):
+    """Send the `requests` over `concurrency` connections, returns the summary of all of them and of each kind."""
+    url = urlsplit(base_url)
+    jobs = list(reversed(range(len(requests))))
+    results = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(url, requests, jobs, results) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    kinds = defaultdict(list)
+    for result in results:
+        kinds[result[0]].append(result)
+    return dict(summary(results, elapsed), kinds={kind: summary(rows, elapsed) for kind, rows in sorted(kinds.items())})
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(host, port, server):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited with status %d' % server.returncode)
+        try:
+            with socket.create_connection((host, port), timeout=1) as sock:
+                sock.sendall(b'GET /api/protein/-/ HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if sock.recv(12).startswith(b'HTTP/1.1'):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('gunicorn did not answer in %d seconds' % STARTUP_TIMEOUT)
+
+def start_server(workers, threads, serialize_writes, port):
+    """Start gunicorn on `port` with the environment of this process, plus the write serialization."""
+    env = dict(os.environ, PROTEINMAP_SERIALIZE_WRITES=str(serialize_writes))
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', 'midterm.wsgi', '--workers', str(workers), '--threads', str(threads),
+        '--bind', '127.0.0.1:%d' % port, '--log-level', 'warning',
+    ], cwd=PROJECT_DIR, env=env)
+    try:
+        wait_until_ready('127.0.0.1', port, server)
+    except BaseException:
+        server.terminate()
+        server.wait()
+        raise
+    return server
+
+def delete_created():
+    from proteinmap.models import Protein
+    from proteinmap.sharding import fan_out, model_shards
+
+    fan_out(lambda alias: Protein.objects.filter(protein_id__startswith=CREATED_PREFIX).delete(), model_shards(Protein))
+
+def run(configs, serialize, url, mix, count, concurrency, keys, exponent, seed):
+    """
+    Run the traffic against every configuration (or the server at `url`), returns their results.
+
+    Rational:
+        every configuration gets the same requests, and proteins created by a run are deleted before the next one,
+        so their ids are free again and the database does not grow between configurations.
+        Servers run with the environment of this process, so the same settings apply (e.g. the response cache).
+    """
+    requests = plan(mix, count, keys, exponent, seed)
+    runs = []
+    try:
+        if url is not None:
+            runs.append(dict({'url': url}, **asyncio.run(load(url, requests, concurrency))))
+            return runs
+        for workers, threads in configs:
+            for serialize_writes in serialize:
+                port = free_port()
+                server = start_server(workers, threads, serialize_writes, port)
+                try:
+                    result = asyncio.run(load('http://127.0.0.1:%d' % port, requests, concurrency))
+                finally:
+                    server.terminate()
+                    server.wait()
+                delete_created()
+                runs.append(dict({'workers': workers, 'threads': threads, 'serialize_writes': serialize_writes},
+                                 **result))
+                print(json.dumps(runs[-1]), file=sys.stderr)
+    finally:
+        delete_created()
+    return runs
+
+def main():
+    setup()
+
+    parser = argparse.ArgumentParser(description='Mixed read/write load test of gunicorn configurations.')
+    parser.add_argument('--config', type=parse_config, action='append',
+                        help='Gunicorn <workers>x<threads>, can be repeated (default 1x8, 4x2 and 8x1)')
+    parser.add_argument('--serialize-writes', choices=['off', 'on', 'both'], default='both',
+                        help='Run each configuration without and/or with serialized writes')
+    parser.add_argument('--url', help='Load a running server instead of starting gunicorn')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Weights of the request kinds, e.g. protein_detail=90,protein_create=10')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per configuration')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent connections')
+    parser.add_argument('--keys', type=int, default=DEFAULT_KEYS, help='Keys sampled for each kind of key')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the key popularity')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the traffic')
+    parser.add_argument('--output', help='File where the JSON results are written')
+    args = parser.parse_args()
+
+    serialize = {'off': [False], 'on': [True], 'both': [False, True]}[args.serialize_writes]
+    runs = run(args.config or [(1, 8), (4, 2), (8, 1)], serialize, args.url, args.mix, args.requests,
+               args.concurrency, args.keys, args.zipf, args.seed)
+    results = json.dumps({'commit': commit(), 'seed': args.seed, 'mix': args.mix, 'runs': runs}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results + '\n')
+    print(results)
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
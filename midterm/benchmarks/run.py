@@ -0,0 +1,219 @@
+# I wrote this code
+
+"""
+Scripted benchmark scenarios for every endpoint, run in process against the configured database.
+
+Each scenario samples real keys from the database with a fixed seed, sends warm-up requests,
+then measures `--requests` requests through the full Django stack (middleware, views, serializers).
+Results are printed (or written with `--output`) as JSON, so runs on different commits can be compared:
+
+    PROTEINMAP_DB_NAME=bench.sqlite3 python manage.py migrate
+    PROTEINMAP_DB_NAME=bench.sqlite3 python -m benchmarks.synthetic --proteins 1000000
+    PROTEINMAP_DB_NAME=bench.sqlite3 python -m benchmarks.run --output before.json
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from . import setup
+
+# Scenarios run when none is given on the command line
+DEFAULT_SCENARIOS = ['protein_detail', 'pfam_detail', 'organism_proteins', 'organism_pfams',
+                     'organism_sequences', 'domain_coverage', 'protein_create']
+
+# Prefix of the proteins inserted by the create scenario, deleted once it ends
+CREATED_PREFIX = 'BENCH'
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * rank / 100))]
+
+def peak_rss():
+    """Peak resident memory of this process in megabytes (`ru_maxrss` is in kilobytes on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def reservoir(values, size, rng):
+    """Uniform random sample of at most `size` of the `values`, read once in constant memory."""
+    kept = []
+    for index, value in enumerate(values):
+        if index < size:
+            kept.append(value)
+        else:
+            slot = rng.randrange(index + 1)
+            if slot < size:
+                kept[slot] = value
+    return kept
+
+def sample_keys(queryset, field, size, rng):
+    """
+    Uniform random sample of at most `size` distinct values of `field` of `queryset`, on every shard.
+
+    Rational:
+        values are streamed in `field` order and sampled with the seeded `rng`, so the same seed gives the same keys
+        and keys are spread over the whole table instead of its lowest ids, without loading all of them.
+    """
+    from itertools import chain
+    from proteinmap.sharding import model_shards
+
+    distinct = queryset.order_by(field).values_list(field, flat=True).distinct()
+    return reservoir(chain.from_iterable(distinct.using(alias).iterator() for alias in model_shards(queryset.model)),
+                     size, rng)
+
+def sample(queryset, field, count, rng):
+    """`count` values of `field` drawn with replacement from a random sample of 10000 distinct values of `queryset`."""
+    values = sample_keys(queryset, field, 10000, rng)
+    return [rng.choice(values) for _ in range(count)] if values else []
+
+def create_payloads(count, rng):
+    """Protein payloads for the create endpoint, with existing organisms and pfams."""
+    from django.conf import settings
+    from proteinmap.models import Organism, Pfam
+
+    taxa = sample(Organism.objects.all(), 'taxa_id', count, rng)
+    descriptions = dict(Pfam.objects.values_list('pfam_id', 'description'))
+    pfams = sample(Pfam.objects.all(), 'pfam_id', count * 3, rng)
+    payloads = []
+    for i in range(count):
+        length = rng.randint(100, 600)
+        payloads.append({
+            'protein_id': '%s%07d' % (CREATED_PREFIX, i),
+            'sequence': ''.join(rng.choice(settings.AMINOACIDS) for _ in range(length)),
+            'taxonomy': {'taxa_id': taxa[i]},
+            'length': length,
+            'domains': [{
+                'pfam_id': {'domain_id': pfams[i * 3 + d], 'domain_description': descriptions[pfams[i * 3 + d]]},
+                'description': 'Benchmark domain',
+                'start': d * 30 + 1,
+                'stop': d * 30 + 30,
+            } for d in range(3)],
+        })
+    return payloads
+
+def scenario_requests(name, count, rng):
+    """List of `(method, path, payload)` requests of a scenario."""
+    from proteinmap.models import Domain, Organism, Protein
+
+    if name == 'protein_detail':
+        return [('get', '/api/protein/%s/' % p, None) for p in sample(Protein.objects.all(), 'protein_id', count, rng)]
+    if name == 'pfam_detail':
+        return [('get', '/api/pfam/%s/' % p, None) for p in sample(Domain.objects.all(), 'pfam_id', count, rng)]
+    if name == 'organism_proteins':
+        return [('get', '/api/proteins/%s' % t, None) for t in sample(Organism.objects.all(), 'taxa_id', count, rng)]
+    if name == 'organism_pfams':
+        return [('get', '/api/pfams/%s' % t, None) for t in sample(Organism.objects.all(), 'taxa_id', count, rng)]
+    if name == 'organism_sequences':
+        return [('get', '/api/proteins/%s.fasta' % t, None) for t in sample(Organism.objects.all(), 'taxa_id', count, rng)]
+    if name == 'domain_coverage':
+        return [('get', '/api/coverage/%s' % p, None) for p in sample(Domain.objects.all(), 'protein_id', count, rng)]
+    if name == 'protein_create':
+        return [('post', '/api/protein/', payload) for payload in create_payloads(count, rng)]
+    raise ValueError('Unknown scenario %s' % name)
+
+def send(client, method, path, payload):
+    if method == 'post':
+        response = client.post(path, json.dumps(payload), content_type='application/json')
+    else:
+        response = client.get(path)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response.status_code, size
+
+def run_scenario(client, name, count, warmup, rng):
+    requests = scenario_requests(name, count + warmup, rng)
+    if not requests:
+        return {'error': 'no data'}
+
+    for method, path, payload in requests[:warmup]:
+        send(client, method, path, payload)
+
+    latencies = []
+    errors = 0
+    size = 0
+    start = time.perf_counter()
+    for method, path, payload in requests[warmup:]:
+        request_start = time.perf_counter()
+        status, body = send(client, method, path, payload)
+        latencies.append(time.perf_counter() - request_start)
+        errors += status >= 400
+        size += body
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_bytes': size // len(latencies),
+        'peak_rss_mb': round(peak_rss(), 1),
+    }
+
+def dataset():
+    from proteinmap.models import Domain, Organism, Pfam, Protein, Sequence
+    from proteinmap.sharding import fan_out, model_shards
+    return {
+        model.__name__.lower(): sum(fan_out(lambda alias: model.objects.count(), model_shards(model)))
+        for model in (Organism, Pfam, Protein, Domain, Sequence)
+    }
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(scenarios, count, warmup, seed):
+    """
+    Run the given scenarios and returns their results with the dataset size and the current commit.
+
+    Rational:
+        requests are sent in process with the Django test client, so results measure the application
+        and the database only, without the noise of a server and of the network.
+        Peak RSS is the peak of the process so far, scenarios should be run alone to isolate it.
+    """
+    from django.test import Client
+    from proteinmap.models import Protein
+    from proteinmap.sharding import fan_out, model_shards
+
+    client = Client(HTTP_HOST='localhost')
+    results = {}
+    try:
+        for name in scenarios:
+            results[name] = run_scenario(client, name, count, warmup, random.Random(seed))
+    finally:
+        fan_out(lambda alias: Protein.objects.filter(protein_id__startswith=CREATED_PREFIX).delete(),
+                model_shards(Protein))
+
+    return {'commit': commit(), 'seed': seed, 'dataset': dataset(), 'scenarios': results}
+
+def main():
+    setup()
+
+    parser = argparse.ArgumentParser(description='Run benchmark scenarios against the configured database.')
+    parser.add_argument('scenarios', nargs='*', default=DEFAULT_SCENARIOS, help='Scenarios to run, all by default')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='Requests sent before measuring each scenario')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the sampled keys')
+    parser.add_argument('--output', help='File where the JSON results are written')
+    args = parser.parse_args()
+
+    results = json.dumps(run(args.scenarios, args.requests, args.warmup, args.seed), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results + '\n')
+    print(results)
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
@@ -0,0 +1,103 @@
+# I wrote this code
+
+"""
+Cold start benchmark of settings profiles, each run in a fresh interpreter as a new worker would be.
+
+A run measures the time to load the WSGI application (`django.setup()`, apps and middleware),
+the time of the first request (URLs and views are imported on it), the number of imported
+modules and the peak RSS. Results are the medians of `--runs` runs, printed as JSON:
+
+    PROTEINMAP_DB_NAME=bench.sqlite3 python -m benchmarks.startup midterm.settings midterm.settings_api
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from .run import commit, peak_rss
+
+# Directory of `manage.py`, where the child interpreters are started
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(settings_module, path):
+    """Load the WSGI application with `settings_module` and send it one GET request of `path`."""
+    start = time.perf_counter()
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    loaded = time.perf_counter()
+
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    first = time.perf_counter()
+
+    return {
+        'status': int(statuses[0].split()[0]),
+        'load_ms': round((loaded - start) * 1000, 1),
+        'first_request_ms': round((first - loaded) * 1000, 1),
+        'modules': len(sys.modules),
+        'peak_rss_mb': round(peak_rss(), 1),
+    }
+
+def run(profiles, path, runs):
+    """
+    Measure each settings profile `runs` times and returns the median of every measure.
+
+    Rational:
+        every run is a new interpreter, since modules imported by a previous run would hide their cost.
+        Profiles are interleaved run by run, so changes of the machine load affect all of them alike.
+    """
+    samples = {profile: [] for profile in profiles}
+    for _ in range(runs):
+        for profile in profiles:
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'benchmarks.startup', '--child', '--path', path, profile], cwd=PROJECT_DIR
+            )
+            samples[profile].append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    results = {}
+    for profile, runs_samples in samples.items():
+        results[profile] = {
+            measure: statistics.median(sample[measure] for sample in runs_samples)
+            for measure in ('load_ms', 'first_request_ms', 'modules', 'peak_rss_mb')
+        }
+        results[profile]['status'] = runs_samples[-1]['status']
+        results[profile]['total_ms'] = round(results[profile]['load_ms'] + results[profile]['first_request_ms'], 1)
+    return {'commit': commit(), 'path': path, 'runs': runs, 'profiles': results}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start of settings profiles.')
+    parser.add_argument('profiles', nargs='*', default=['midterm.settings', 'midterm.settings_api'],
+                        help='Settings modules to compare')
+    parser.add_argument('--path', default='/api/pfams/0', help='Path of the first request')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters started per profile')
+    parser.add_argument('--output', help='File where the JSON results are written')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.profiles[0], args.path)))
+        return
+
+    results = json.dumps(run(args.profiles, args.path, args.runs), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results + '\n')
+    print(results)
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
@@ -0,0 +1,129 @@
+# I wrote this code
+
+"""
+Scalable synthetic dataset generator, inserting rows with bulk inserts in batches.
+
+Distributions follow the shape of real proteomes:
+- protein lengths are log-normal around 350 residues;
+- domains per protein are geometric (mean of 2), with lengths around 120 residues;
+- proteins per organism and domains per pfam family follow Zipf laws (a few very large ones);
+- sequence residues follow the UniProt amino acid background frequencies.
+
+    python -m benchmarks.synthetic --proteins 1000000 --seed 1
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+# Background frequency (%) of each residue, in the order of the `AMINOACIDS` setting
+RESIDUE_FREQUENCIES = [8.25, 1.37, 5.45, 6.75, 3.86, 7.07, 2.27, 5.96, 5.84, 9.66,
+                       2.42, 4.06, 4.70, 3.93, 5.53, 6.56, 5.34, 6.87, 1.08, 2.92]
+
+# First `taxa_id` of synthetic organisms, far from real NCBI identifiers
+TAXA_OFFSET = 100000000
+
+
+def zipf_weights(size, exponent=1.1):
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+def dataset_shape(proteins):
+    """Number of organisms and pfams generated for a number of proteins."""
+    return max(1, proteins // 50), min(20000, max(10, proteins // 10))
+
+def generate(proteins, seed=0, batch_size=20000, sequences=True, progress=None):
+    """
+    Insert `proteins` synthetic proteins with their organisms, pfams, domains and (optionally) sequences.
+
+    Rational:
+        each batch of proteins is drawn with vectorized NumPy sampling and inserted in one transaction
+        (per shard) with `bulk_create`, so memory is bounded by the batch size and 10M proteins fit on any machine.
+    """
+    from django.conf import settings
+    from django.db import transaction
+    from proteinmap.models import Domain, Organism, Pfam, Protein, Sequence
+    from proteinmap.routers import shard_for
+    from proteinmap.sharding import reserve_id_ranges, shards, sync_reference_tables
+
+    rng = np.random.default_rng(seed)
+    organisms, pfams = dataset_shape(proteins)
+    organism_weights = zipf_weights(organisms)
+    pfam_weights = zipf_weights(pfams)
+    residues = np.frombuffer(settings.AMINOACIDS.encode(), dtype=np.uint8)
+    residue_weights = np.array(RESIDUE_FREQUENCIES) / sum(RESIDUE_FREQUENCIES)
+
+    with transaction.atomic():
+        Organism.objects.bulk_create([
+            Organism(taxa_id=TAXA_OFFSET + i, clade='E', genus='Synthetica%d' % i, species='synthetica')
+            for i in range(organisms)
+        ], batch_size=batch_size)
+        Pfam.objects.bulk_create([
+            Pfam(pfam_id='SYN%06d' % i, description='Synthetic family %d' % i) for i in range(pfams)
+        ], batch_size=batch_size)
+    sync_reference_tables([Organism, Pfam])
+    reserve_id_ranges()
+
+    for start in range(0, proteins, batch_size):
+        count = min(batch_size, proteins - start)
+        ids = ['SYN%09d' % i for i in range(start, start + count)]
+        lengths = np.clip(rng.lognormal(math.log(350), 0.6, count), 30, 35000).astype(np.int64)
+        taxa = TAXA_OFFSET + rng.choice(organisms, count, p=organism_weights)
+
+        # Domains of each protein, placed at random positions inside it
+        domain_counts = np.minimum(rng.geometric(0.5, count), 50)
+        owners = np.repeat(np.arange(count), domain_counts)
+        domain_lengths = np.minimum(np.clip(rng.normal(120, 60, len(owners)), 20, None).astype(np.int64), lengths[owners])
+        starts = 1 + (rng.random(len(owners)) * (lengths[owners] - domain_lengths + 1)).astype(np.int64)
+        domain_pfams = rng.choice(pfams, len(owners), p=pfam_weights)
+
+        if sequences:
+            letters = residues[rng.choice(len(residues), int(lengths.sum()), p=residue_weights)].tobytes().decode()
+            offsets = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+
+        # Each protein is inserted with its domains and sequence on the shard of its organism
+        protein_shards = [shard_for(t) for t in taxa.tolist()]
+        for alias in shards():
+            members = [i for i in range(count) if protein_shards[i] == alias]
+            with transaction.atomic(using=alias):
+                Protein.objects.using(alias).bulk_create([
+                    Protein(protein_id=ids[i], length=lengths[i], organism_id=taxa[i]) for i in members
+                ], batch_size=batch_size)
+                Domain.objects.using(alias).bulk_create([
+                    Domain(protein_id=ids[p], pfam_id='SYN%06d' % f, description='Synthetic domain %d' % f,
+                           start=s, stop=s + l - 1)
+                    for p, f, s, l in zip(owners.tolist(), domain_pfams.tolist(), starts.tolist(),
+                                          domain_lengths.tolist())
+                    if protein_shards[p] == alias
+                ], batch_size=batch_size)
+
+                if sequences:
+                    Sequence.objects.using(alias).bulk_create([
+                        Sequence(protein_id=ids[i], sequence=letters[offsets[i]:offsets[i + 1]]) for i in members
+                    ], batch_size=batch_size)
+
+        if progress is not None:
+            progress(start + count, proteins)
+
+def main():
+    from . import setup
+    setup()
+
+    parser = argparse.ArgumentParser(description='Insert a synthetic dataset into the configured database.')
+    parser.add_argument('--proteins', type=int, default=10000, help='Number of proteins, e.g. 10000, 1000000')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed generates the same data')
+    parser.add_argument('--batch-size', type=int, default=20000, help='Proteins inserted per transaction')
+    parser.add_argument('--no-sequences', action='store_true', help='Do not generate sequences')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.proteins, args.seed, args.batch_size, not args.no_sequences,
+             lambda done, total: print('%d/%d proteins (%.0fs)' % (done, total, time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'midterm.settings')
+# I wrote this code
+os.environ.setdefault('PROTEINMAP_ASYNC_API', 'True')
+# end of code I wrote
 
 application = get_asgi_application()
@@ -49,10 +49,18 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'proteinmap.throttling.TokenBucketThrottle'
+    ],
+    'EXCEPTION_HANDLER': 'proteinmap.writes.exception_handler',
 }
 
 MIDDLEWARE = [
+# I wrote this code
+    'proteinmap.middleware.PerformanceMiddleware',
+    'proteinmap.middleware.CompressionMiddleware',
+# end of code I wrote
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,13 +94,76 @@ WSGI_APPLICATION = 'midterm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# I wrote this code
+
+# Database backend selected by environment variables, SQLite is the default for single-node installs.
+# Replicas are comma-separated hosts (PostgreSQL) or file paths (SQLite) of read-only copies of `default`.
+# Shards are comma-separated hosts or file paths of the databases partitioning proteins, sequences and domains
+# by organism, created with `manage.py migrate --database shard<N>` and filled by `manage.py sync_shards`.
+DATABASE_ENGINE = os.environ.get('PROTEINMAP_DB_ENGINE', 'sqlite3')
+DATABASE_REPLICAS = [r for r in os.environ.get('PROTEINMAP_DB_REPLICAS', '').split(',') if r]
+DATABASE_SHARDS = [s for s in os.environ.get('PROTEINMAP_DB_SHARDS', '').split(',') if s]
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PROTEINMAP_DB_NAME', 'proteinmap'),
+            'USER': os.environ.get('PROTEINMAP_DB_USER', ''),
+            'PASSWORD': os.environ.get('PROTEINMAP_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PROTEINMAP_DB_HOST', ''),
+            'PORT': os.environ.get('PROTEINMAP_DB_PORT', ''),
+            # Persistent connections reused by each worker thread
+            'CONN_MAX_AGE': int(os.environ.get('PROTEINMAP_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Transaction pooling (PgBouncer) does not support server-side cursors
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('PROTEINMAP_DB_POOLER', 'False') == 'True',
+        }
+    }
+    for i, host in enumerate(DATABASE_REPLICAS):
+        DATABASES['replica%d' % i] = dict(DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    for i, host in enumerate(DATABASE_SHARDS):
+        DATABASES['shard%d' % i] = dict(DATABASES['default'], HOST=host)
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('PROTEINMAP_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            # Seconds a connection waits on a locked database before failing
+            'OPTIONS': {'timeout': 20},
+        }
     }
+    for i, name in enumerate(DATABASE_REPLICAS):
+        DATABASES['replica%d' % i] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    # Shards are mostly queried by the threads of the fan out pool, which keep their connections open
+    for i, name in enumerate(DATABASE_SHARDS):
+        DATABASES['shard%d' % i] = dict(DATABASES['default'], NAME=name, CONN_MAX_AGE=None)
+
+# Aliases of the read replicas and of the shards, used by the routers
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+DATABASE_SHARDS = [alias for alias in DATABASES if alias.startswith('shard')]
+
+DATABASE_ROUTERS = ['proteinmap.routers.ShardRouter', 'proteinmap.routers.PrimaryReplicaRouter']
+
+# Threads of each process running the queries fanned out to every shard
+SHARD_WORKERS = int(os.environ.get('PROTEINMAP_SHARD_WORKERS', 8))
+
+# Run the writes of `ProteinCreate` one at a time per database, across the threads and worker processes of a host,
+# so concurrent SQLite writers queue instead of failing with `database is locked`
+SERIALIZE_WRITES = os.environ.get('PROTEINMAP_SERIALIZE_WRITES', 'False') == 'True'
+
+# Pragmas applied to every new SQLite connection.
+# WAL lets readers run alongside the single writer, and commits only sync the log.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
 }
 
+# end of code I wrote
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -122,8 +193,6 @@ TIME_ZONE = 'UTC'
 
 USE_I18N = True
 
-USE_L10N = True
-
 USE_TZ = True
 
 
@@ -137,4 +206,79 @@ STATIC_URL = '/static/'
 # List of the 20 allowed amino acid characters
 AMINOACIDS = 'ACDEFGHIKLMNPQRSTVWY'
 
+# Serve the read endpoints with async views, enabled by default on `asgi.py`
+ASYNC_API = os.environ.get('PROTEINMAP_ASYNC_API', 'False') == 'True'
+
+# Directory of the read-only snapshot exported by `manage.py export_snapshot`.
+# When set, GET endpoints are served from the snapshot instead of the database.
+SNAPSHOT_DIR = os.environ.get('PROTEINMAP_SNAPSHOT_DIR')
+
+# Directory of the pfam co-occurrence matrix built by `manage.py build_cooccurrence`.
+# When not set, or not built yet, co-occurring pfams are counted by the database on each request.
+COOCCURRENCE_DIR = os.environ.get('PROTEINMAP_COOCCURRENCE_DIR')
+
+# Pre-generated OpenAPI specification (`manage.py generateschema`) served by `/openapi`,
+# the schema is generated on the first request when not set
+OPENAPI_SCHEMA_FILE = os.environ.get('PROTEINMAP_OPENAPI_SCHEMA_FILE')
+
+# Directory of the files that background jobs (`POST /api/jobs`) are allowed to import
+JOB_DATA_DIR = os.environ.get('PROTEINMAP_JOB_DATA_DIR', os.path.join(os.path.dirname(BASE_DIR), 'data'))
+
+# Seconds a running job is kept by its worker without a heartbeat, before it is failed by the next claim
+JOB_LEASE = int(os.environ.get('PROTEINMAP_JOB_LEASE', 60))
+
+# Cache of the compressed read responses, in memory of each process by default.
+# Use a shared backend (e.g. `django.core.cache.backends.redis.RedisCache` with PROTEINMAP_CACHE_LOCATION
+# `redis://127.0.0.1:6379`) so writes invalidate the responses cached by every worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('PROTEINMAP_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PROTEINMAP_CACHE_LOCATION', ''),
+    }
+}
+LOCAL_CACHE = CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache'))
+if LOCAL_CACHE:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+# Views whose responses are cached compressed, for `RESPONSE_CACHE_TIMEOUT` seconds (0 disables the cache).
+# The response cache needs a backend shared by all the workers: it is off by default on a cache local to a process
+# or host, where a write would not invalidate the responses cached by the other workers,
+# set PROTEINMAP_RESPONSE_CACHE_TIMEOUT to cache them anyway (e.g. a single worker).
+RESPONSE_CACHE_VIEWS = ['protein_detail_api', 'pfam_detail_api', 'organism_proteins_api',
+                        'organism_pfams_api', 'domain_coverage_api', 'protein_features_api',
+                        'organism_features_api', 'cooccurring_pfams_api', 'query_api']
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('PROTEINMAP_RESPONSE_CACHE_TIMEOUT', 0 if LOCAL_CACHE else 300))
+
+# Streamed responses larger than this are not cached
+RESPONSE_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+# Seconds concurrent requests of a cached response wait for the one computing it (0 disables the coalescing)
+COALESCE_TIMEOUT = float(os.environ.get('PROTEINMAP_COALESCE_TIMEOUT', 5))
+
+# Token bucket rate `<requests>/<s|m|h|d>` allowed to each client per throttle scope, the `throttle_scope`
+# of the API views (e.g. `protein_detail`, `organism_pfams`) or else `read` and `write` by request method.
+# Scopes without rate are not throttled, e.g. PROTEINMAP_THROTTLE_RATES `read=100/s,write=10/s,organism_pfams=20/m`
+THROTTLE_RATES = dict(rate.split('=') for rate in os.environ.get('PROTEINMAP_THROTTLE_RATES', '').split(',') if rate)
+
+# Store of the token buckets, in the memory of each worker by default.
+# `proteinmap.throttling.CacheBucketStore` shares them between workers through a shared cache backend.
+THROTTLE_BUCKET_STORE = os.environ.get('PROTEINMAP_THROTTLE_BUCKET_STORE', 'proteinmap.throttling.MemoryBucketStore')
+
+# Responses smaller than this are not compressed
+COMPRESSION_MIN_BYTES = 200
+
+# Requests slower than this are logged with their SQL queries on the `proteinmap.performance` logger
+SLOW_REQUEST_SECONDS = float(os.environ.get('PROTEINMAP_SLOW_REQUEST_SECONDS', 1.0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'proteinmap': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # end of code I wrote
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+API-only settings for midterm project, used by the workers serving the REST API.
+
+Extends the default settings without the admin, sessions, messages and static files
+apps and middleware, so workers import and initialize less on a cold start:
+
+    DJANGO_SETTINGS_MODULE=midterm.settings_api gunicorn midterm.wsgi
+
+Migrations and the admin still run with the default settings.
+"""
+
+# I wrote this code
+
+from . import settings as base
+from .settings import *
+
+# Apps and middleware of the admin and the browsable API, not used by the REST API
+WEB_ONLY = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+INSTALLED_APPS = [app for app in base.INSTALLED_APPS if app not in WEB_ONLY]
+
+# Requests are anonymous, DRF is told not to load `django.contrib.auth` for them
+REST_FRAMEWORK = {
+    **base.REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer'
+    ],
+    'UNAUTHENTICATED_USER': None,
+}
+
+MIDDLEWARE = [middleware for middleware in base.MIDDLEWARE if middleware not in WEB_ONLY]
+
+ROOT_URLCONF = 'midterm.urls_api'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+            ],
+        },
+    },
+]
+
+OPENAPI_SCHEMA_FILE = os.environ.get('PROTEINMAP_OPENAPI_SCHEMA_FILE', os.path.join(BASE_DIR, 'openapi-schema.yml'))
+
+# end of code I wrote
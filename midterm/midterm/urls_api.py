@@ -0,0 +1,8 @@
+"""midterm URL Configuration of the API-only settings (`midterm.settings_api`), without the admin."""
+from django.urls import include, path
+
+urlpatterns = [
+# I wrote this code
+    path('', include('proteinmap.urls')),
+# end of code I wrote
+]
@@ -1,31 +1,102 @@
 # I wrote this code
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models.functions import Length, Substr
+from django.utils.functional import cached_property
 
-from .models import *
+from .models import Domain, Job, Organism, Pfam, Protein, Sequence
 
+# Residues shown on the sequence list
+SEQUENCE_PREVIEW_LENGTH = 50
+
+# Rows counted at most to paginate admin lists
+MAX_COUNTED_ROWS = 10000
+
+
+class BoundedCountPaginator(Paginator):
+    """
+    Paginator counting at most `MAX_COUNTED_ROWS` rows, so the count query of
+    large tables stays bounded. Rows beyond it are reached with search or filters.
+    """
+    @cached_property
+    def count(self):
+        return self.object_list.order_by().values('pk')[:MAX_COUNTED_ROWS].count()
 
 class OrganismAdmin(admin.ModelAdmin):
     list_display = ('taxa_id', 'clade', 'genus', 'species')
+    search_fields = ('=taxa_id', 'genus', 'species')
+    ordering = ('taxa_id',)
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
 
 class DomainInline(admin.TabularInline):
+    """
+    Domains of a protein, with an autocomplete input for `pfam` instead of a select of the whole table.
+    """
     model = Domain
     extra = 1
+    autocomplete_fields = ['pfam']
 
 class ProteinAdmin(admin.ModelAdmin):
+    """
+    Rational:
+        `organism` is joined on the list instead of one query per row,
+        and chosen with an autocomplete input instead of a select of the whole table.
+    """
     list_display = ('protein_id', 'length', 'organism')
+    list_select_related = ('organism',)
+    search_fields = ('=protein_id',)
+    autocomplete_fields = ['organism']
     inlines = [DomainInline]
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
 
 class PfamAdmin(admin.ModelAdmin):
     list_display = ('pfam_id', 'description')
+    search_fields = ('=pfam_id', 'description')
+    ordering = ('pfam_id',)
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
 
 class SequenceAdmin(admin.ModelAdmin):
-    list_display = ('protein', 'sequence')
+    """
+    Rational:
+        the list shows a preview and the length of each sequence, computed by the database,
+        so full sequences are neither read nor rendered.
+    """
+    list_display = ('protein_id', 'sequence_preview', 'sequence_length')
+    search_fields = ('=protein__protein_id',)
+    raw_id_fields = ('protein',)
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('sequence').annotate(
+            preview=Substr('sequence', 1, SEQUENCE_PREVIEW_LENGTH), residues=Length('sequence')
+        )
+
+    @admin.display(description='Sequence')
+    def sequence_preview(self, instance):
+        if instance.residues > SEQUENCE_PREVIEW_LENGTH:
+            return instance.preview + '…'
+        return instance.preview
+
+    @admin.display(description='Length')
+    def sequence_length(self, instance):
+        return instance.residues
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'worker', 'created', 'finished')
+    list_filter = ('status', 'kind')
+    show_full_result_count = False
+    paginator = BoundedCountPaginator
 
 
 admin.site.register(Organism, OrganismAdmin)
 admin.site.register(Protein, ProteinAdmin)
 admin.site.register(Pfam, PfamAdmin)
 admin.site.register(Sequence, SequenceAdmin)
+admin.site.register(Job, JobAdmin)
 
-# end of code I wrote
\ No newline at end of file
+# end of code I wrote
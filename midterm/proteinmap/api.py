@@ -1,54 +1,153 @@
 # I wrote this code
 
+import os
+from functools import lru_cache
+
+from django.conf import settings
 from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cooccurrence import DEFAULT_TOP, MAX_TOP, database_cooccurring, get_cooccurrence
+from .export import EXPORTS, FORMATS, cache_path, export_chunks, write_cache
+from .fasta import organism_fasta
+from .features import (HYDROPATHY_WINDOW, MAX_HYDROPATHY_WINDOW, organism_features_csv, organism_features_json,
+                       protein_features)
+from .metrics import render
+from .models import Domain, Job, Pfam, Protein, Sequence
+from .query import QueryError, execute
+from .routers import use_primary
+from .serializers import (DomainListSerializer, JobSerializer, PfamSerializer, ProteinListSerializer,
+                          ProteinSerializer)
+from .sharding import find, gather
+from .snapshot import get_snapshot
+from .streaming import file_response, streaming_response
+from .taxonomy import organism_filter, taxa_shards
+
+class PrimaryDatabaseMixin:
+    """
+    Mixin for API views that write, routing every query of the request to the primary database.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        with use_primary():
+            return super().dispatch(request, *args, **kwargs)
+
+class SnapshotMixin:
+    """
+    Mixin for read API views, serving data from the read-only snapshot when one is configured.
+    `snapshot_method` is the `Snapshot` method called with the URL arguments.
+    """
+    snapshot_method = None
+
+    def get(self, request, *args, **kwargs):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return super().get(request, *args, **kwargs)
 
-from .models import *
-from .serializers import *
+        data = getattr(snapshot, self.snapshot_method)(*kwargs.values())
+        if data is None:
+            raise Http404
+        return Response(data)
 
-class ProteinCreate(generics.CreateAPIView):
+class ProteinCreate(PrimaryDatabaseMixin, generics.CreateAPIView):
     """
     API view for creating a protein instance using the serializer.
     """
+    throttle_scope = 'protein_create'
     queryset = Protein.objects.all()  
     serializer_class = ProteinSerializer
 
-class ProteinDetail(generics.RetrieveAPIView):
+class JobCreate(PrimaryDatabaseMixin, generics.CreateAPIView):
+    """
+    API view for submitting a background job, run by `manage.py run_workers`.
+    """
+    throttle_scope = 'job_create'
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+class JobDetail(PrimaryDatabaseMixin, generics.RetrieveAPIView):
+    """
+    API view for retrieving the status and progress of a job, read on the primary to be up to date.
+    """
+    throttle_scope = 'job_detail'
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+class ProteinDetail(SnapshotMixin, generics.RetrieveAPIView):
     """
     API view for retrieving a protein instance using the serializer.
     """
+    throttle_scope = 'protein_detail'
+    snapshot_method = 'protein'
     queryset = Protein.objects.all()  
     serializer_class = ProteinSerializer
 
-class PfamDetail(generics.RetrieveAPIView):
+    def get_object(self):
+        """Find the protein on every shard, since its organism is unknown, its relations are read from its shard."""
+        protein = find(lambda alias: self.get_queryset().filter(pk=self.kwargs['pk']).first())
+        if protein is None:
+            raise Http404
+        return protein
+
+class PfamDetail(SnapshotMixin, generics.RetrieveAPIView):
     """
     API view for retrieving a pfam instance using the serializer.
     """
+    throttle_scope = 'pfam_detail'
+    snapshot_method = 'pfam'
     queryset = Pfam.objects.all()  
     serializer_class = PfamSerializer
 
-class OrganismProteins(generics.ListAPIView):
+class OrganismProteins(SnapshotMixin, generics.ListAPIView):
     """
-    API view for listing protein instances for a given organism.
+    API view for listing protein instances for a given organism, or all the organisms of a higher rank taxon.
     """
+    throttle_scope = 'organism_proteins'
+    snapshot_method = 'organism_protein_list'
     serializer_class = ProteinListSerializer
 
     def get_queryset(self):
         taxa = self.kwargs.get('taxa')
-        return Protein.objects.filter(organism=taxa)
+        return gather(Protein.objects.filter(organism_filter(taxa)), taxa_shards(taxa))
 
-class OrganismPfams(generics.ListAPIView):
+class OrganismPfams(SnapshotMixin, generics.ListAPIView):
     """
-    API view for listing pfam instances in all the proteins for a given organism.
+    API view for listing pfam instances in all the proteins for a given organism, or higher rank taxon.
     """
+    throttle_scope = 'organism_pfams'
+    snapshot_method = 'organism_pfam_list'
     serializer_class = DomainListSerializer
 
     def get_queryset(self):
         taxa = self.kwargs.get('taxa')
-        return Domain.objects.filter(protein__organism=taxa)
+        queryset = Domain.objects.filter(organism_filter(taxa, 'protein__organism')).select_related('pfam')
+        return gather(queryset, taxa_shards(taxa))
+
+class Query(APIView):
+    """
+    API view running a nested query on organisms, proteins, domains and pfams (see `query.py`),
+    from the `query` parameter on GET or the `query` field of a JSON body on POST.
+    Returns `{"data": ...}`, or `{"errors": [{"message": ...}]}` with a 400 status when the query is invalid.
+    """
+    throttle_scope = 'query'
+
+    def get(self, request):
+        return self.run(request.query_params.get('query'))
+
+    def post(self, request):
+        return self.run(request.data.get('query') if isinstance(request.data, dict) else None)
+
+    def run(self, text):
+        if not isinstance(text, str) or not text.strip():
+            return Response({'errors': [{'message': 'A query is required.'}]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response({'data': execute(text)})
+        except QueryError as error:
+            return Response({'errors': [{'message': str(error)}]}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 def domain_coverage(request, protein_id):
@@ -57,15 +156,166 @@ def domain_coverage(request, protein_id):
 
     Rational:
         filter `Domain` by protein, then subtract the sum of stops from the sum of starts and divide by protein legth.
+        The protein is looked up on every shard, since its organism is unknown.
     """
-    queryset = Domain.objects.filter(protein=protein_id)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        coverage = snapshot.coverage(protein_id)
+        if coverage is None:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        return Response(coverage)
 
-    if not queryset.exists():
-        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    def shard_coverage(alias):
+        queryset = Domain.objects.filter(protein=protein_id)
+
+        if not queryset.exists():
+            return None
 
-    sums = queryset.aggregate(Sum('stop'), Sum('start'))
-    length = queryset.values_list('protein__length')[0][0]
-    coverage = (sums['stop__sum'] - sums['start__sum']) / length
+        sums = queryset.aggregate(Sum('stop'), Sum('start'))
+        length = queryset.values_list('protein__length')[0][0]
+        return (sums['stop__sum'] - sums['start__sum']) / length
+
+    # The protein is on a single shard, the others have no domains for it
+    coverage = find(shard_coverage)
+    if coverage is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
     return Response(coverage)
 
+@api_view(['GET'])
+def sequence_features(request, pk):
+    """
+    API method to return the features computed from the sequence of a protein: length, amino acid composition,
+    molecular weight, isoelectric point, GRAVY and the hydropathy profile over a sliding `window` of residues.
+    """
+    window = request.query_params.get('window', str(HYDROPATHY_WINDOW))
+    if not window.isdigit() or not 1 <= int(window) <= MAX_HYDROPATHY_WINDOW:
+        return Response({'window': ['Window must be an integer from 1 to %d.' % MAX_HYDROPATHY_WINDOW]},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    sequence = find(lambda alias: Sequence.objects.filter(pk=pk).values_list('sequence', flat=True).first())
+    if sequence is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return Response(protein_features(pk, sequence, int(window)))
+
+@api_view(['GET'])
+def cooccurring_pfams(request, pk):
+    """
+    API method to return the `top` pfams found most often in the same proteins as a given pfam,
+    with their number of proteins, optionally in the proteins of one organism (`taxa`).
+
+    Rational:
+        counts are read from the precomputed co-occurrence matrix when built, instead of a self-join on `Domain`.
+        Descriptions of the returned pfams are read with one query.
+    """
+    taxa = request.query_params.get('taxa') or None
+    top = request.query_params.get('top', str(DEFAULT_TOP))
+    errors = {}
+    if taxa is not None and not taxa.isdigit():
+        errors['taxa'] = ['A valid integer is required.']
+    if not top.isdigit() or not 1 <= int(top) <= MAX_TOP:
+        errors['top'] = ['Top must be an integer from 1 to %d.' % MAX_TOP]
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    taxa = None if taxa is None else int(taxa)
+
+    matrix = get_cooccurrence()
+    if matrix is not None:
+        counts = matrix.cooccurring(pk, taxa, int(top))
+    else:
+        counts = database_cooccurring(pk, taxa, int(top))
+
+    pfams = Pfam.objects.in_bulk([pk] + [pfam_id for pfam_id, _ in counts])
+    if pk not in pfams:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return Response([
+        {'pfam_id': PfamSerializer(pfams[pfam_id]).data, 'proteins': proteins}
+        for pfam_id, proteins in counts if pfam_id in pfams
+    ])
+
+@require_GET
+def organism_features(request, taxa):
+    """
+    API method to stream the sequence features of all the proteins for a given organism, as JSON or as a CSV table
+    with one composition column per amino acid.
+
+    Rational:
+        sequences are read with a streaming cursor and computed in vectorized batches, so whole proteomes take seconds.
+    """
+    format = request.GET.get('format', 'json')
+    if format == 'csv':
+        return streaming_response(request, organism_features_csv(taxa), 'text/csv', '%d_features.csv' % taxa)
+    if format != 'json':
+        return JsonResponse({'format': ['Format must be one of: json, csv']}, status=400)
+    return streaming_response(request, organism_features_json(taxa), 'application/json')
+
+@require_GET
+def export_table(request, kind):
+    """
+    API method to export a whole table, or the rows of one organism, as Parquet, Arrow IPC stream or CSV.
+    This is a plain Django view, since DRF reserves the `format` query parameter for its renderers.
+
+    Rational:
+        rows are read with a streaming cursor and written batch by batch, so memory stays bounded.
+        When serving a snapshot, exports are read from it like the other endpoints, and cached as files
+        served while the snapshot is not replaced.
+    """
+    if kind not in EXPORTS:
+        raise Http404
+
+    format = request.GET.get('format', 'csv')
+    taxa = request.GET.get('taxa') or None
+    if format not in FORMATS:
+        return JsonResponse({'format': ['Format must be one of: %s' % ', '.join(FORMATS)]}, status=400)
+    if taxa is not None and not taxa.isdigit():
+        return JsonResponse({'taxa': ['A valid integer is required.']}, status=400)
+
+    filename = '%s.%s' % (kind, format)
+    snapshot = get_snapshot()
+    path = cache_path(snapshot, kind, taxa, format)
+    if path is not None and os.path.exists(path):
+        return file_response(request, path, FORMATS[format], filename)
+
+    chunks = export_chunks(kind, taxa, format, snapshot)
+    if path is not None:
+        chunks = write_cache(path, chunks)
+    return streaming_response(request, chunks, FORMATS[format], filename)
+
+@require_GET
+def organism_sequences(request, taxa):
+    """
+    API method to stream the sequences of all the proteins for a given organism in FASTA format.
+    """
+    return streaming_response(request, organism_fasta(taxa), 'text/x-fasta', '%d.fasta' % taxa)
+
+@lru_cache(maxsize=None)
+def read_schema(path):
+    with open(path, 'rb') as schema_file:
+        return schema_file.read()
+
+@lru_cache(maxsize=None)
+def schema_view():
+    from rest_framework.schemas import get_schema_view
+    return get_schema_view(title="Protein map", description="By Rodrigo Chin", version="0.1.0")
+
+@require_GET
+def openapi_schema(request):
+    """
+    Returns the OpenAPI specification, read from the `OPENAPI_SCHEMA_FILE` setting when set.
+
+    Rational:
+        generating the schema imports the DRF schema generator and introspects every view,
+        so it is only done on the first request instead of when the URLs are loaded,
+        and API-only workers serve the file pre-generated with `manage.py generateschema` instead.
+    """
+    if settings.OPENAPI_SCHEMA_FILE:
+        return HttpResponse(read_schema(settings.OPENAPI_SCHEMA_FILE), content_type='application/vnd.oai.openapi')
+    return schema_view()(request)
+
+@require_GET
+def metrics(request):
+    """
+    Returns the request metrics of this process in the Prometheus text format.
+    """
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4')
+
 # end of code I wrote
\ No newline at end of file
@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 
 class ProteinmapConfig(AppConfig):
+    default_auto_field = 'django.db.models.AutoField'
     name = 'proteinmap'
+
+    # I wrote this code
+    def ready(self):
+        from . import signals
+    # end of code I wrote
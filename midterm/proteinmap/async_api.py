@@ -0,0 +1,176 @@
+# I wrote this code
+
+import json
+
+from django.db.models import Max, Sum
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from .models import Domain, Pfam, Protein
+from .serializers import PfamSerializer, ProteinSerializer
+from .sharding import afind
+from .snapshot import get_snapshot
+from .taxonomy import aorganism_filter, ataxa_shards
+from .throttling import throttled_response
+
+# Number of rows fetched per database round trip and encoded per streamed chunk
+STREAM_CHUNK_SIZE = 500
+
+
+def not_found():
+    """Returns the same 404 payload as the DRF views."""
+    return JsonResponse({'detail': 'Not found.'}, status=404)
+
+def snapshot_response(data):
+    """Returns data read from the snapshot, where None means not found."""
+    if data is None:
+        return not_found()
+    return JsonResponse(data, safe=False)
+
+async def each_shard(rows, aliases):
+    """Asynchronous iterator of the rows of `rows` on each of the shard `aliases`, one shard after the other."""
+    for alias in aliases:
+        async for row in rows.using(alias).aiterator(chunk_size=STREAM_CHUNK_SIZE):
+            yield row
+
+async def stream_json_array(rows, to_json):
+    """
+    Asynchronous generator encoding `rows` as a JSON array, one chunk per `STREAM_CHUNK_SIZE` rows.
+
+    Rational:
+        the response starts as soon as the first rows arrive and memory stays bounded by the chunk size.
+    """
+    separator = '['
+    chunk = []
+    async for row in rows:
+        chunk.append(json.dumps(to_json(row)))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield (separator + ','.join(chunk)).encode()
+            separator = ','
+            chunk = []
+    if chunk:
+        yield (separator + ','.join(chunk)).encode()
+        separator = ','
+    yield (']' if separator == ',' else '[]').encode()
+
+def stream_response(rows, to_json):
+    return StreamingHttpResponse(stream_json_array(rows, to_json), content_type='application/json')
+
+class ThrottledView(View):
+    """
+    Async view throttled like the DRF views, by the rate of its `throttle_scope`.
+    """
+    throttle_scope = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = throttled_response(request, self.throttle_scope)
+        if response is not None:
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+class ProteinDetail(ThrottledView):
+    """
+    Async API view for retrieving a protein instance using the serializer.
+
+    Rational:
+        load the protein and all its relations in one call, so the serializer never touches the database.
+        The protein is looked up on every shard concurrently, since its organism is unknown.
+    """
+    throttle_scope = 'protein_detail'
+
+    async def get(self, request, pk):
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return snapshot_response(snapshot.protein(pk))
+
+        queryset = Protein.objects.select_related('organism', 'sequence').prefetch_related('domains__pfam')
+        protein = await afind(lambda alias: queryset.filter(pk=pk).first())
+        if protein is None:
+            return not_found()
+        return JsonResponse(ProteinSerializer(protein).data)
+
+class PfamDetail(ThrottledView):
+    """
+    Async API view for retrieving a pfam instance using the serializer.
+    """
+    throttle_scope = 'pfam_detail'
+
+    async def get(self, request, pk):
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return snapshot_response(snapshot.pfam(pk))
+
+        try:
+            pfam = await Pfam.objects.aget(pk=pk)
+        except Pfam.DoesNotExist:
+            return not_found()
+        return JsonResponse(PfamSerializer(pfam).data)
+
+class OrganismProteins(ThrottledView):
+    """
+    Async API view streaming protein instances for a given organism, or higher rank taxon.
+    """
+    throttle_scope = 'organism_proteins'
+
+    async def get(self, request, taxa):
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return snapshot_response(snapshot.organism_protein_list(taxa))
+
+        rows = Protein.objects.filter(await aorganism_filter(taxa)).values_list('protein_id', flat=True)
+        return stream_response(
+            each_shard(rows, await ataxa_shards(taxa)),
+            lambda protein_id: {'protein_id': protein_id}
+        )
+
+class OrganismPfams(ThrottledView):
+    """
+    Async API view streaming pfam instances in all the proteins for a given organism, or higher rank taxon.
+    """
+    throttle_scope = 'organism_pfams'
+
+    async def get(self, request, taxa):
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return snapshot_response(snapshot.organism_pfam_list(taxa))
+
+        rows = Domain.objects.filter(await aorganism_filter(taxa, 'protein__organism'))
+        rows = rows.values('id', 'pfam_id', 'pfam__description')
+        return stream_response(
+            each_shard(rows, await ataxa_shards(taxa)),
+            lambda row: {
+                'id': row['id'],
+                'pfam_id': {'domain_id': row['pfam_id'], 'domain_description': row['pfam__description']}
+            }
+        )
+
+async def domain_coverage(request, protein_id):
+    """
+    Async API method to return the domain coverage for a given protein.
+
+    Rational:
+        aggregate the sums of starts and stops together with the protein length in a single query, on every shard.
+        A protein without domains has no sums, which is returned as not found.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    throttled = throttled_response(request, None)
+    if throttled is not None:
+        return throttled
+
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_response(snapshot.coverage(protein_id))
+
+    def shard_coverage(alias):
+        sums = Domain.objects.filter(protein=protein_id).aggregate(Sum('stop'), Sum('start'), Max('protein__length'))
+        if sums['stop__sum'] is None:
+            return None
+        return (sums['stop__sum'] - sums['start__sum']) / sums['protein__length__max']
+
+    coverage = await afind(shard_coverage)
+    if coverage is None:
+        return not_found()
+    return JsonResponse(coverage, safe=False)
+
+# end of code I wrote
@@ -0,0 +1,110 @@
+# I wrote this code
+
+import asyncio
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Prefix of the cache keys marking a response being computed by a worker process
+FLIGHT_PREFIX = 'proteinmap:flight:'
+
+# Seconds between two lookups of a response computed by another process
+POLL_INTERVAL = 0.01
+
+
+class Flight:
+    """
+    Computation of the response of `key` by the leader request, which must `land()` once the response is cached.
+    """
+    def __init__(self, group, key, event):
+        self.group = group
+        self.key = key
+        self.event = event
+        self.shared = False
+        self.landed = False
+
+    def land(self):
+        """Release the requests waiting for this flight, they read the response from the cache."""
+        if self.landed:
+            return
+        self.landed = True
+        if self.shared:
+            cache.delete(FLIGHT_PREFIX + self.key)
+        self.group.remove(self.key, self.event)
+        self.event.set()
+
+class SingleFlight:
+    """
+    Coalesce concurrent requests of the same cached response, so only one of them runs the view.
+
+    Rational:
+        the first request of a key is the leader, the next ones wait for it and then read its response from the cache.
+        Requests of the same process wait on an event, in memory. Leaders of different processes coordinate
+        through the cache: the one adding the flight key computes, the others poll the cache for its response.
+        Waits are bounded by the `COALESCE_TIMEOUT` setting, after which requests compute on their own,
+        and flights expire after it, so a response never sent can not block its key.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def take_off(self, key, event_class):
+        """Returns a new `Flight` when the caller leads, or the event of the flight in progress."""
+        now = time.monotonic()
+        with self.lock:
+            event, deadline = self.flights.get(key, (None, 0))
+            if event is not None and deadline > now:
+                return None, event
+            event = event_class()
+            self.flights[key] = (event, now + settings.COALESCE_TIMEOUT)
+            return Flight(self, key, event), None
+
+    def remove(self, key, event):
+        with self.lock:
+            if self.flights.get(key, (None,))[0] is event:
+                del self.flights[key]
+
+    def lead_processes(self, flight):
+        """Returns True when no other process computes the response, otherwise waits for it to be cached."""
+        flight.shared = cache.add(FLIGHT_PREFIX + flight.key, True, math.ceil(settings.COALESCE_TIMEOUT))
+        return flight.shared
+
+    def join(self, key):
+        """
+        Join the flight of `key`, returns the `Flight` to land when the caller must run the view,
+        or None once the leader landed (the response is then usually cached).
+        """
+        flight, event = self.take_off(key, threading.Event)
+        if flight is None:
+            event.wait(settings.COALESCE_TIMEOUT)
+            return None
+
+        if not self.lead_processes(flight):
+            deadline = time.monotonic() + settings.COALESCE_TIMEOUT
+            while time.monotonic() < deadline and cache.get(key) is None:
+                time.sleep(POLL_INTERVAL)
+        return flight
+
+    async def ajoin(self, key):
+        """Same as `join()` for async requests, waiting without blocking the event loop."""
+        flight, event = self.take_off(key, asyncio.Event)
+        if flight is None:
+            try:
+                await asyncio.wait_for(event.wait(), settings.COALESCE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            return None
+
+        if not self.lead_processes(flight):
+            deadline = time.monotonic() + settings.COALESCE_TIMEOUT
+            while time.monotonic() < deadline and await cache.aget(key) is None:
+                await asyncio.sleep(POLL_INTERVAL)
+        return flight
+
+# Flights of this process
+flights = SingleFlight()
+
+# end of code I wrote
@@ -0,0 +1,166 @@
+# I wrote this code
+
+import hashlib
+import uuid
+import zlib
+
+from django.core.cache import cache
+
+from .snapshot import get_snapshot
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cache key of the version of all the data, part of the key of every cached response
+VERSION_KEY = 'proteinmap:data_version'
+
+# Prefix of the cache keys of the version of each entity, `<prefix><kind>:<id>` with kind `protein`, `pfam` or `taxa`
+ENTITY_VERSION_PREFIX = 'proteinmap:version:'
+
+# Entity whose version is replaced by every write, keying the responses which may read any data (e.g. queries)
+WRITES = ('writes', '')
+
+# Content types worth compressing, binary formats such as Parquet are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/vnd.oai.openapi', 'application/javascript')
+
+
+class GzipStream:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliStream:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+class ZstdStream:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+# Supported encodings in order of preference, as encoding: (stream, level per response, level of cached responses).
+# Cached responses are compressed once and sent many times, so they use higher levels.
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS['br'] = (BrotliStream, 4, 9)
+if zstandard is not None:
+    ENCODINGS['zstd'] = (ZstdStream, 3, 9)
+ENCODINGS['gzip'] = (GzipStream, 6, 9)
+
+
+def negotiate(accept_encoding):
+    """
+    Returns the encoding to use for an `Accept-Encoding` header, None for no compression.
+    The encoding with the highest quality value is chosen, ties are broken by the order of `ENCODINGS`.
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, parameters = part.partition(';')
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compressor(encoding, cached=False):
+    """Returns a new stream compressor for `encoding`, with the level of cached responses when `cached`."""
+    stream, level, cached_level = ENCODINGS[encoding]
+    return stream(cached_level if cached else level)
+
+def compress(data, encoding, cached=False):
+    stream = compressor(encoding, cached)
+    return stream.compress(data) + stream.finish()
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def entity_version_key(kind, id):
+    # Taxa ids are normalized, so `/api/proteins/09606` and writes to organism 9606 share a version
+    if kind == 'taxa' and str(id).isdigit():
+        id = int(id)
+    return '%s%s:%s' % (ENTITY_VERSION_PREFIX, kind, id)
+
+def versions(entities):
+    """
+    Returns the version of all the data, then the version of each `(kind, id)` of `entities`.
+
+    Rational:
+        responses served from a snapshot are immutable for its generation.
+        Otherwise versions are random values stored on the cache, so a cache shared by all workers invalidates
+        their responses at once. The version of all the data is replaced by bulk loads and by changes to organisms,
+        pfams and taxonomy nodes, which are embedded in many responses, and the version of an entity by the writes
+        to it. Missing versions are created, which is a new version if one was evicted from the cache.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return [snapshot.manifest['generation']]
+    keys = [VERSION_KEY] + [entity_version_key(kind, id) for kind, id in entities]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Added only when still missing, so concurrent requests agree on the new version
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+def bump_data_version():
+    """Invalidate all cached responses, called after bulk loads and changes to reference data."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+def bump_versions(entities):
+    """Invalidate the cached responses reading any of the `(kind, id)` entities, and those reading any data."""
+    cache.set_many({entity_version_key(kind, id): uuid.uuid4().hex for kind, id in [WRITES, *entities]}, None)
+
+def response_cache_key(request, encoding, entities=(WRITES,)):
+    """
+    Cache key of a response for the versions of the data and of the `entities` it reads,
+    its path, accepted content type and encoding.
+    """
+    parts = versions(entities) + [request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), encoding or 'identity']
+    return 'proteinmap:response:' + hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+# end of code I wrote
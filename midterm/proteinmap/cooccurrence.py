@@ -0,0 +1,317 @@
+# I wrote this code
+
+import json
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .compression import bump_data_version, bump_versions
+from .models import Domain
+from .routers import shard_for
+from .sharding import fan_out, shards
+from .snapshot import Snapshot
+from .streaming import chunks
+from .taxonomy import with_ancestors
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Names of the matrix and of the log of the proteins inserted since it was built, inside `COOCCURRENCE_DIR`
+MATRIX_FILE = 'cooccurrence.npz'
+DELTA_FILE = 'delta.log'
+
+# Domain rows read per database round trip while building
+BUILD_CHUNK_SIZE = 100000
+
+# Families returned by default, and at most, per query
+DEFAULT_TOP = 20
+MAX_TOP = 1000
+
+
+@contextmanager
+def locked(file, shared=False):
+    """Hold an exclusive or `shared` `flock()` of the open `file`, without locking where `fcntl` is not available."""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(file, fcntl.LOCK_UN)
+
+def domain_marks():
+    """Highest domain id of every shard, None for an empty shard, as `alias: id`."""
+    return {alias: Domain.objects.using(alias).aggregate(mark=Max('id'))['mark'] for alias in shards()}
+
+def read_domains(marks):
+    """
+    Distinct `(protein, pfam)` pairs of the domains up to the `marks` of their shard as integer codes,
+    sorted by protein, with the organism code of each pair, the sorted pfam ids and the sorted organism taxa ids.
+    """
+    import numpy as np
+    rows = Domain.objects.values_list('protein_id', 'pfam_id', 'protein__organism_id')
+    columns = ([np.zeros(0, dtype='S1')], [np.zeros(0, dtype='S1')], [np.zeros(0, dtype=np.int64)])
+    for alias, mark in marks.items():
+        if mark is None:
+            continue
+        shard_rows = rows.using(alias).filter(id__lte=mark)
+        for chunk in chunks(shard_rows.iterator(BUILD_CHUNK_SIZE), BUILD_CHUNK_SIZE):
+            for column, values, dtype in zip(columns, zip(*chunk), (np.bytes_, np.bytes_, np.int64)):
+                column.append(np.array(values, dtype=dtype))
+
+    _, proteins = np.unique(np.concatenate(columns[0]), return_inverse=True)
+    pfam_ids, pfams = np.unique(np.concatenate(columns[1]), return_inverse=True)
+    taxa_ids, organisms = np.unique(np.concatenate(columns[2]), return_inverse=True)
+
+    keys, first = np.unique(proteins * len(pfam_ids) + pfams, return_index=True)
+    return keys // len(pfam_ids), keys % len(pfam_ids), organisms[first], pfam_ids, taxa_ids
+
+def protein_pairs(proteins):
+    """
+    Ordered pairs `(left, right)` of positions of different elements in the same group of `proteins`,
+    which is sorted so every protein is a contiguous group.
+
+    Rational:
+        each element of a group of `k` elements is repeated `k` times and paired with every position of its group,
+        using only `repeat` and `arange` arithmetic, then the pairs of an element with itself are dropped.
+    """
+    import numpy as np
+    starts = np.flatnonzero(np.concatenate([proteins[:1] >= 0, proteins[1:] != proteins[:-1]]))
+    sizes = np.diff(np.append(starts, len(proteins)))
+    size_of = np.repeat(sizes, sizes)
+    start_of = np.repeat(starts, sizes)
+
+    left = np.repeat(np.arange(len(proteins)), size_of)
+    first_pair = np.repeat(np.cumsum(size_of) - size_of, size_of)
+    right = start_of[left] + np.arange(len(left)) - first_pair
+    different = left != right
+    return left[different], right[different]
+
+def csr(rows, columns, size=None):
+    """
+    Count the `(row, column)` pairs into CSR arrays. With `size`, `indptr` has one offset per row `0..size`,
+    otherwise only non-empty rows are kept and their sorted `rows` keys are returned with the offsets.
+    """
+    import numpy as np
+    width = columns.max(initial=0) + 1
+    keys, counts = np.unique(rows * width + columns, return_counts=True)
+    row_of, indices = keys // width, keys % width
+    if size is not None:
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_of, minlength=size), out=indptr[1:])
+        return indptr, indices, counts
+    row_keys, starts = np.unique(row_of, return_index=True)
+    return row_keys, np.append(starts, len(keys)), indices, counts
+
+def build_matrix(path):
+    """
+    Build the global and per-organism pfam co-occurrence matrices and save them on `path`.
+    Two pfams co-occur once per protein having domains of both, the matrices are symmetric.
+
+    Rational:
+        the domains are read once into NumPy arrays, and the pairs of every protein are generated and counted
+        with vectorized `unique` calls, instead of a self-join on `Domain` counting all pairs in the database.
+        Per-organism rows are keyed by `organism * pfams + pfam` and only non-empty rows are stored,
+        since most families are absent from most organisms.
+        The highest domain id of every shard is read first and only the domains up to it are counted,
+        so the delta lines of the proteins inserted meanwhile, whose domains are above it, are kept when publishing
+        and the others are dropped: a protein is counted once, by the matrix or by the log.
+        Both files are replaced under the lock of the delta log, so no line is appended in between.
+    Returns the number of pfams and of non-zero pairs.
+    """
+    import numpy as np
+    os.makedirs(path, exist_ok=True)
+    marks = domain_marks()
+
+    proteins, pfams, organisms, pfam_ids, taxa_ids = read_domains(marks)
+    left, right = protein_pairs(proteins)
+    a, b = pfams[left], pfams[right]
+
+    indptr, indices, data = csr(a, b, size=len(pfam_ids))
+    organism_rows, organism_indptr, organism_indices, organism_data = csr(organisms[left] * len(pfam_ids) + a, b)
+
+    temporary = os.path.join(path, '%s.%s.npz' % (MATRIX_FILE, uuid.uuid4().hex))
+    np.savez(
+        temporary, pfam_ids=pfam_ids, taxa_ids=taxa_ids, indptr=indptr, indices=indices, data=data,
+        organism_rows=organism_rows, organism_indptr=organism_indptr,
+        organism_indices=organism_indices, organism_data=organism_data,
+    )
+    delta = os.path.join(path, DELTA_FILE)
+    with open(delta, 'a+') as delta_file, locked(delta_file):
+        delta_file.seek(0)
+        kept = [line for line in delta_file.read().splitlines(keepends=True)
+                if line.endswith('\n') and not is_counted(json.loads(line), marks)]
+        pending = '%s.%s' % (delta, uuid.uuid4().hex)
+        with open(pending, 'w') as pending_file:
+            pending_file.writelines(kept)
+        os.replace(pending, delta)
+        os.replace(temporary, os.path.join(path, MATRIX_FILE))
+    bump_data_version()
+    return {'pfams': len(pfam_ids), 'pairs': len(indices)}
+
+def is_counted(protein, marks):
+    """
+    Returns True when the protein of a delta line is counted by a matrix built up to the `marks`,
+    its highest domain being at most the mark of its shard. Lines without a domain id, logged before the
+    ids were recorded, were committed before the build and are counted.
+    """
+    mark = marks.get(shard_for(protein['taxa']))
+    return protein.get('domain') is None or mark is not None and protein['domain'] <= mark
+
+def record_protein(taxa, pfam_ids, domain=None):
+    """
+    Append an inserted protein to the delta log, applied by readers on top of the matrix until the next build.
+    Lines are appended under a file lock, so concurrent workers never interleave them,
+    with the highest id of the `domain`s of the protein, which tells a build whether it counts them.
+
+    Rational:
+        the versions of the pfams and of the organism (with the taxa above it) are replaced once the line is appended,
+        even without a matrix, since domains are inserted in bulk without the signals replacing them,
+        and responses cached after the commit of the protein, but before this call, do not count it.
+    """
+    if settings.COOCCURRENCE_DIR and len(set(pfam_ids)) > 1:
+        os.makedirs(settings.COOCCURRENCE_DIR, exist_ok=True)
+        line = json.dumps({'taxa': taxa, 'pfams': sorted(set(pfam_ids)), 'domain': domain}) + '\n'
+        with open(os.path.join(settings.COOCCURRENCE_DIR, DELTA_FILE), 'a') as delta_file, locked(delta_file):
+            delta_file.write(line)
+    bump_versions([('pfam', pfam_id) for pfam_id in pfam_ids] + [('taxa', t) for t in with_ancestors([taxa])])
+
+class Cooccurrence:
+    """
+    Co-occurrence matrices loaded from `build_matrix()`, with the proteins of the delta logs added on top.
+    """
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        matrix = os.path.join(path, MATRIX_FILE)
+        self.mtime = os.stat(matrix).st_mtime_ns
+        with np.load(matrix) as arrays:
+            for name in arrays.files:
+                setattr(self, name, arrays[name])
+
+        # Counts of the delta logs, as `pfam: Counter` globally and `(taxa, pfam): Counter` per organism
+        self.delta = defaultdict(Counter)
+        self.organism_delta = defaultdict(Counter)
+        self.inode = None
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def apply(self, lines):
+        for line in lines.splitlines():
+            protein = json.loads(line)
+            for a in protein['pfams']:
+                for b in protein['pfams']:
+                    if a != b:
+                        self.delta[a][b] += 1
+                        self.organism_delta[protein['taxa'], a][b] += 1
+
+    def refresh(self):
+        """
+        Apply the lines appended to the delta log since the last call.
+        When a build replaced the log, the counts are read again from the new one.
+        """
+        try:
+            delta_file = open(os.path.join(self.path, DELTA_FILE))
+        except FileNotFoundError:
+            return
+        with delta_file, locked(delta_file, shared=True):
+            inode = os.fstat(delta_file.fileno()).st_ino
+            if inode != self.inode:
+                self.delta.clear()
+                self.organism_delta.clear()
+                self.inode, self.offset = inode, 0
+            delta_file.seek(self.offset)
+            lines = delta_file.read()
+        # Only complete lines are applied, a line being appended is read on the next call
+        lines = lines[:lines.rfind('\n') + 1]
+        self.offset += len(lines.encode())
+        self.apply(lines)
+
+    def row(self, pfam_id, taxa=None):
+        """Columns and counts of the matrix row of `pfam_id`, empty when the pfam or the organism has no pairs."""
+        import numpy as np
+        index = Snapshot.find(self.pfam_ids, pfam_id.encode())
+        if index is not None and taxa is None:
+            start, stop = self.indptr[index:index + 2]
+            return self.indices[start:stop], self.data[start:stop]
+
+        organism = None if index is None else Snapshot.find(self.taxa_ids, taxa)
+        row = None if organism is None else Snapshot.find(self.organism_rows, organism * len(self.pfam_ids) + index)
+        if row is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        start, stop = self.organism_indptr[row:row + 2]
+        return self.organism_indices[start:stop], self.organism_data[start:stop]
+
+    def cooccurring(self, pfam_id, taxa=None, top=DEFAULT_TOP):
+        """
+        The `top` pfams co-occurring most often with `pfam_id`, as `(pfam_id, proteins)` sorted by decreasing count
+        then pfam id, optionally in the proteins of one organism.
+        """
+        import numpy as np
+        with self.lock:
+            self.refresh()
+            delta = self.delta.get(pfam_id) if taxa is None else self.organism_delta.get((taxa, pfam_id))
+            delta = Counter(delta)
+
+        indices, counts = self.row(pfam_id, taxa)
+        if not delta:
+            order = np.lexsort((indices, -counts))[:top]
+            return [(self.pfam_ids[i].decode(), int(c)) for i, c in zip(indices[order], counts[order])]
+
+        delta.update({self.pfam_ids[i].decode(): int(c) for i, c in zip(indices, counts)})
+        return sorted(delta.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+def database_cooccurring(pfam_id, taxa=None, top=DEFAULT_TOP):
+    """
+    Same result as `Cooccurrence.cooccurring()` computed by the database, used when no matrix was built.
+
+    Rational:
+        the proteins of an organism are on one shard, which counts alone. Otherwise every shard counts all the
+        pfams of its proteins concurrently, and the counts are added, since a protein is never on two shards.
+    """
+    proteins = Domain.objects.filter(pfam=pfam_id).values('protein')
+    domains = Domain.objects.filter(protein__in=proteins).exclude(pfam=pfam_id)
+    if taxa is not None:
+        domains = domains.filter(protein__organism=taxa)
+    rows = domains.values('pfam').annotate(proteins=Count('protein', distinct=True)).order_by('-proteins', 'pfam')
+    aliases = shards() if taxa is None else [shard_for(taxa)]
+    if len(aliases) == 1:
+        return [(row['pfam'], row['proteins']) for row in rows.using(aliases[0])[:top]]
+
+    counts = Counter()
+    for shard_rows in fan_out(lambda alias: list(rows.values_list('pfam', 'proteins')), aliases):
+        counts.update(dict(shard_rows))
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+def get_cooccurrence():
+    """
+    Returns the matrix on the `COOCCURRENCE_DIR` setting, shared by the whole process, or None when not built.
+    A new build is picked up without restarting workers, like the snapshot.
+    """
+    global _matrix
+    if not settings.COOCCURRENCE_DIR:
+        return None
+
+    try:
+        mtime = os.stat(os.path.join(settings.COOCCURRENCE_DIR, MATRIX_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _matrix_lock:
+        matrix = _matrix
+        if matrix is None or matrix.path != settings.COOCCURRENCE_DIR or matrix.mtime != mtime:
+            matrix = _matrix = Cooccurrence(settings.COOCCURRENCE_DIR)
+    return matrix
+
+# end of code I wrote
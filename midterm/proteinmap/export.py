@@ -0,0 +1,198 @@
+# I wrote this code
+
+import csv
+import io
+import os
+import uuid
+
+from .models import Domain, Organism, Protein
+from .sharding import merge, model_shards
+from .streaming import chunks
+from .taxonomy import organism_filter, taxa_shards
+
+# Number of rows read per database round trip and written per record batch
+BATCH_SIZE = 50000
+
+# Exported tables as (model, taxa lookup, columns), each column is (name, `values_list` lookup, Arrow type)
+EXPORTS = {
+    'proteins': (Protein, 'organism', [
+        ('protein_id', 'protein_id', 'string'),
+        ('length', 'length', 'int64'),
+        ('taxa_id', 'organism_id', 'int64'),
+        ('sequence', 'sequence__sequence', 'string'),
+    ]),
+    'domains': (Domain, 'protein__organism', [
+        ('id', 'id', 'int64'),
+        ('protein_id', 'protein_id', 'string'),
+        ('pfam_id', 'pfam_id', 'string'),
+        ('description', 'description', 'string'),
+        ('start', 'start', 'int64'),
+        ('stop', 'stop', 'int64'),
+    ]),
+    'organisms': (Organism, 'taxa_id', [
+        ('taxa_id', 'taxa_id', 'int64'),
+        ('clade', 'clade', 'string'),
+        ('genus', 'genus', 'string'),
+        ('species', 'species', 'string'),
+    ]),
+}
+
+# Content type of each export format
+FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'csv': 'text/csv',
+}
+
+
+class BufferSink(io.RawIOBase):
+    """Write-only file collecting the bytes written since the last `drain()`."""
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def row_batches(kind, taxa=None):
+    """
+    Rows of an export in batches of `BATCH_SIZE`, read with a streaming database cursor.
+
+    Rational:
+        the rows of an organism are read from its shard, and those of the organisms below a higher rank taxon
+        from every shard. A whole sharded table is read from every shard concurrently, and batches are written
+        as they arrive, so rows are ordered by key within each shard only.
+    """
+    model, taxa_lookup, columns = EXPORTS[kind]
+    queryset = model.objects.order_by('pk')
+    if taxa is not None:
+        queryset = queryset.filter(organism_filter(taxa, taxa_lookup))
+    rows = queryset.values_list(*[lookup for _, lookup, _ in columns])
+
+    def shard_batches(alias):
+        return chunks(rows.using(alias).iterator(BATCH_SIZE), BATCH_SIZE)
+
+    aliases = model_shards(model)
+    if len(aliases) > 1 and taxa is not None:
+        aliases = taxa_shards(taxa)
+    return merge(shard_batches, aliases)
+
+def write_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _, _ in columns])
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def write_arrow(columns, batches, format):
+    """
+    Encode batches of rows as Arrow record batches, written either as an Arrow IPC stream or as Parquet row groups.
+
+    Rational:
+        each batch is converted column by column and flushed before the next one is read,
+        so memory is bounded by the batch size whatever the size of the export.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, getattr(pa, type)()) for name, _, type in columns])
+    sink = BufferSink()
+    writer = pa.ipc.new_stream(sink, schema) if format == 'arrow' else pq.ParquetWriter(sink, schema)
+
+    for rows in batches:
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+
+    writer.close()
+    yield sink.drain()
+
+def snapshot_rows(snapshot, kind, taxa=None):
+    """
+    Rows of an export read from the arrays of a snapshot, with the columns and the order of `row_batches()`.
+    `taxa` selects an organism, or all the organisms below a higher rank taxon.
+    """
+    import numpy as np
+
+    if kind == 'organisms':
+        for o in range(len(snapshot.taxa_ids)) if taxa is None else snapshot.organism_indices(taxa):
+            yield (int(snapshot.taxa_ids[o]), snapshot.organism_clades[o], snapshot.organism_genera[o],
+                   snapshot.organism_species[o])
+    elif kind == 'proteins':
+        if taxa is None:
+            proteins = range(len(snapshot.protein_keys))
+        else:
+            proteins = snapshot.organism_rows(snapshot.organism_proteins, snapshot.organism_protein_offsets, taxa)
+        for p in proteins:
+            yield (snapshot.protein_ids[p], int(snapshot.protein_lengths[p]),
+                   int(snapshot.taxa_ids[snapshot.protein_organisms[p]]), snapshot.protein_sequences[p])
+    else:
+        # Domains are stored grouped by protein, the protein of each one is recovered from the offsets
+        domain_proteins = np.repeat(np.arange(len(snapshot.protein_keys)), np.diff(snapshot.protein_domain_offsets))
+        if taxa is None:
+            domains = np.argsort(snapshot.domain_ids, kind='stable')
+        else:
+            domains = snapshot.organism_rows(snapshot.organism_domains, snapshot.organism_domain_offsets, taxa)
+        for d in domains:
+            yield (int(snapshot.domain_ids[d]), snapshot.protein_ids[domain_proteins[d]],
+                   snapshot.pfam_ids[snapshot.domain_pfams[d]], snapshot.domain_descriptions[d],
+                   int(snapshot.domain_starts[d]), int(snapshot.domain_stops[d]))
+
+def export_chunks(kind, taxa, format, snapshot=None):
+    """Encoded chunks of an export in the given `format`, read from the `snapshot` when given."""
+    columns = EXPORTS[kind][2]
+    if snapshot is not None:
+        batches = chunks(snapshot_rows(snapshot, kind, taxa), BATCH_SIZE)
+    else:
+        batches = row_batches(kind, taxa)
+    if format == 'csv':
+        return write_csv(columns, batches)
+    return write_arrow(columns, batches, format)
+
+def cache_path(snapshot, kind, taxa, format):
+    """
+    Path of the cached export of a `snapshot`, None without a snapshot.
+
+    Rational:
+        exports of a snapshot are read from its arrays, so they never change until it is replaced.
+        They are cached inside the snapshot directory and named by its generation,
+        so exporting a new snapshot invalidates them.
+    """
+    if snapshot is None:
+        return None
+    name = '%s-%s-%s.%s' % (snapshot.manifest['generation'], kind, taxa or 'all', format)
+    return os.path.join(snapshot.path, 'exports', name)
+
+def write_cache(path, chunks):
+    """Copy streamed `chunks` into a temporary file, which becomes the cached export at `path` once complete."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    complete = False
+    try:
+        with open(temp, 'wb') as cache_file:
+            for chunk in chunks:
+                cache_file.write(chunk)
+                yield chunk
+        os.replace(temp, path)
+        complete = True
+    finally:
+        if not complete and os.path.exists(temp):
+            os.remove(temp)
+
+# end of code I wrote
@@ -0,0 +1,120 @@
+# I wrote this code
+
+import gzip
+
+from django.conf import settings
+
+from .compression import bump_data_version
+from .models import Protein, Sequence
+from .sharding import merge, shards
+from .streaming import chunks
+from .taxonomy import organism_filter, taxa_shards
+
+# Residues per line on written FASTA records
+LINE_WIDTH = 60
+
+
+def open_fasta(path):
+    """Open a FASTA file for reading as text, gzip compressed files end with `.gz`."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path)
+
+def read_fasta(lines):
+    """
+    Generator of `(header, sequence)` records from the lines of a FASTA file.
+
+    Rational:
+        only the lines of the current record are kept, so files of any size are read in constant memory.
+    """
+    header = None
+    sequence = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('>'):
+            if header is not None:
+                yield header, ''.join(sequence)
+            header = line[1:]
+            sequence = []
+        elif line and header is not None:
+            sequence.append(line)
+    if header is not None:
+        yield header, ''.join(sequence)
+
+def parse_protein_id(header):
+    """Returns the protein accession of a header, either UniProt style (`sp|P12345|NAME`) or its first word."""
+    identifier = header.split(None, 1)[0] if header.strip() else ''
+    parts = identifier.split('|')
+    if len(parts) >= 3 and parts[0] in ('sp', 'tr'):
+        return parts[1]
+    return identifier
+
+def format_fasta(header, sequence):
+    """Returns a FASTA record, with the sequence wrapped at `LINE_WIDTH` residues per line."""
+    lines = [sequence[i:i + LINE_WIDTH] for i in range(0, len(sequence), LINE_WIDTH)]
+    return '>%s\n%s\n' % (header, '\n'.join(lines))
+
+def valid_sequence(sequence, length, residues):
+    """Returns True when `sequence` has only allowed `residues` and the `length` of its protein, like posted ones."""
+    return len(sequence) == length and residues.issuperset(sequence)
+
+def load_sequences(records, batch_size=5000, update=False, progress=None):
+    """
+    Save the sequences of `(header, sequence)` records for the proteins already in the database.
+
+    Rational:
+        records are saved in batches, with one query to find the proteins and sequences
+        of a batch and one bulk insert (and update) to save it, on each shard.
+        Records of unknown proteins are skipped. Records failing the checks of posted proteins (amino acids
+        of the `AMINOACIDS` setting, same length as the protein) are counted as invalid, and records repeating
+        a protein of their batch are counted as duplicates, only the first one is saved.
+        `progress` is called with the counts after each batch.
+    Returns the number of created, updated, skipped, invalid and duplicate sequences.
+    """
+    residues = frozenset(settings.AMINOACIDS)
+    counts = {'created': 0, 'updated': 0, 'skipped': 0, 'invalid': 0, 'duplicates': 0}
+    for batch in chunks(records, batch_size):
+        sequences = {}
+        for header, sequence in batch:
+            sequences.setdefault(parse_protein_id(header), sequence)
+        counts['duplicates'] += len(batch) - len(sequences)
+
+        saved = invalid = 0
+        for alias in shards():
+            lengths = dict(Protein.objects.using(alias).filter(pk__in=sequences).values_list('pk', 'length'))
+            proteins = [p for p, length in lengths.items() if valid_sequence(sequences[p], length, residues)]
+            invalid += len(lengths) - len(proteins)
+            existing = Sequence.objects.using(alias).in_bulk(proteins)
+
+            created = [Sequence(protein_id=p, sequence=sequences[p]) for p in proteins if p not in existing]
+            Sequence.objects.using(alias).bulk_create(created)
+            counts['created'] += len(created)
+            saved += len(created)
+
+            if update:
+                for protein_id, instance in existing.items():
+                    instance.sequence = sequences[protein_id]
+                Sequence.objects.using(alias).bulk_update(existing.values(), ['sequence'])
+                counts['updated'] += len(existing)
+                saved += len(existing)
+
+        counts['invalid'] += invalid
+        counts['skipped'] += len(sequences) - saved - invalid
+        if progress is not None:
+            progress(counts)
+
+    # Bulk inserts and updates do not send the signals invalidating cached responses
+    bump_data_version()
+    return counts
+
+def organism_fasta(taxa, chunk_size=2000):
+    """
+    Generator of encoded FASTA chunks with the sequences of an organism, or of all the organisms below
+    a higher rank taxon, read with a streaming cursor on each shard holding them.
+    """
+    rows = Sequence.objects.filter(organism_filter(taxa, 'protein__organism'))
+    rows = rows.values_list('protein_id', 'protein__organism_id', 'sequence')
+    for chunk in merge(lambda alias: chunks(rows.using(alias).iterator(chunk_size), chunk_size), taxa_shards(taxa)):
+        yield ''.join(format_fasta('%s OX=%s' % (p, o), s) for p, o, s in chunk).encode()
+
+# end of code I wrote
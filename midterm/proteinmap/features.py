@@ -0,0 +1,196 @@
+# I wrote this code
+
+import csv
+import io
+import json
+
+from django.conf import settings
+
+from .models import Sequence
+from .sharding import merge
+from .streaming import chunks
+from .taxonomy import organism_filter, taxa_shards
+
+# Average mass (Da) of each residue inside a peptide chain, a water molecule is added per chain
+RESIDUE_MASSES = {
+    'A': 71.0788, 'C': 103.1388, 'D': 115.0886, 'E': 129.1155, 'F': 147.1766,
+    'G': 57.0519, 'H': 137.1411, 'I': 113.1594, 'K': 128.1741, 'L': 113.1594,
+    'M': 131.1926, 'N': 114.1038, 'P': 97.1167, 'Q': 128.1307, 'R': 156.1875,
+    'S': 87.0782, 'T': 101.1051, 'V': 99.1326, 'W': 186.2132, 'Y': 163.1760,
+}
+WATER_MASS = 18.01524
+
+# Kyte-Doolittle hydropathy index of each residue
+HYDROPATHY = {
+    'A': 1.8, 'C': 2.5, 'D': -3.5, 'E': -3.5, 'F': 2.8, 'G': -0.4, 'H': -3.2, 'I': 4.5, 'K': -3.9, 'L': 3.8,
+    'M': 1.9, 'N': -3.5, 'P': -1.6, 'Q': -3.5, 'R': -4.5, 'S': -0.8, 'T': -0.7, 'V': 4.2, 'W': -0.9, 'Y': -1.3,
+}
+
+# pKa of the ionizable side chains and termini (EMBOSS values), used for the isoelectric point
+POSITIVE_PKA = {'H': 6.5, 'K': 10.8, 'R': 12.5}
+NEGATIVE_PKA = {'C': 8.5, 'D': 3.9, 'E': 4.1, 'Y': 10.1}
+N_TERMINUS_PKA = 8.6
+C_TERMINUS_PKA = 3.6
+
+# Bisection steps of the isoelectric point search, each halves the pH interval (14 / 2^20 < 0.0001)
+PI_ITERATIONS = 20
+
+# Residues of the sliding window of the hydropathy profile, and its allowed range
+HYDROPATHY_WINDOW = 9
+MAX_HYDROPATHY_WINDOW = 101
+
+# Sequences computed together per vectorized batch, and read per database round trip
+BATCH_SIZE = 10000
+
+# Columns of the per-organism features table, followed by the fraction of each residue
+COLUMNS = ['protein_id', 'length', 'molecular_weight', 'isoelectric_point', 'gravy']
+
+
+def residue_table(values, default=0):
+    """Array of a per-residue table in the order of the `AMINOACIDS` setting, with `default` for unknown residues."""
+    import numpy as np
+    return np.array([values.get(a, default) for a in settings.AMINOACIDS] + [default], dtype=np.float64)
+
+def encode(sequences):
+    """
+    Map the residues of `sequences` to their index on the `AMINOACIDS` setting, with one lookup on a 256 entry table.
+    Unknown characters (e.g. `X` or `U`) get the index `len(AMINOACIDS)`.
+    Returns the concatenated `uint8` codes and the length of each sequence.
+    """
+    import numpy as np
+    lookup = np.full(256, len(settings.AMINOACIDS), dtype=np.uint8)
+    lookup[np.frombuffer(settings.AMINOACIDS.encode(), dtype=np.uint8)] = np.arange(len(settings.AMINOACIDS))
+    data = ''.join(sequences).encode('ascii', 'replace')
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    return lookup[np.frombuffer(data, dtype=np.uint8)], lengths
+
+def isoelectric_points(counts):
+    """
+    Isoelectric point of each row of residue `counts`, found by bisection on all the rows at once.
+    The net charge decreases with the pH, so the point is where it changes sign.
+    """
+    import numpy as np
+    positive = np.stack([counts[:, settings.AMINOACIDS.index(a)] for a in POSITIVE_PKA], axis=1)
+    negative = np.stack([counts[:, settings.AMINOACIDS.index(a)] for a in NEGATIVE_PKA], axis=1)
+    positive_pka = np.array(list(POSITIVE_PKA.values()))
+    negative_pka = np.array(list(NEGATIVE_PKA.values()))
+
+    low = np.zeros(len(counts))
+    high = np.full(len(counts), 14.0)
+    for _ in range(PI_ITERATIONS):
+        ph = (low + high) / 2
+        column = ph[:, None]
+        charge = (
+            1 / (1 + 10 ** (ph - N_TERMINUS_PKA))
+            + (positive / (1 + 10 ** (column - positive_pka))).sum(axis=1)
+            - 1 / (1 + 10 ** (C_TERMINUS_PKA - ph))
+            - (negative / (1 + 10 ** (negative_pka - column))).sum(axis=1)
+        )
+        low = np.where(charge > 0, ph, low)
+        high = np.where(charge > 0, high, ph)
+    return (low + high) / 2
+
+def compute_features(sequences):
+    """
+    Length, residue counts, molecular weight, isoelectric point and GRAVY of a batch of sequences.
+
+    Rational:
+        residues are encoded once into a `uint8` array, and counted per sequence with a single `bincount`
+        on `sequence index * residues + residue index`. Every other feature is a product of the counts
+        with a per-residue table, so no Python code runs per residue.
+        Unknown residues are counted in the length only.
+    """
+    import numpy as np
+    codes, lengths = encode(sequences)
+    size = len(settings.AMINOACIDS) + 1
+    owners = np.repeat(np.arange(len(sequences)), lengths)
+    counts = np.bincount(owners * size + codes, minlength=len(sequences) * size).reshape(len(sequences), size)[:, :-1]
+
+    known = counts.sum(axis=1)
+    return {
+        'length': lengths,
+        'known': known,
+        'counts': counts,
+        'molecular_weight': counts @ residue_table(RESIDUE_MASSES)[:-1] + WATER_MASS,
+        'isoelectric_point': isoelectric_points(counts),
+        'gravy': counts @ residue_table(HYDROPATHY)[:-1] / np.maximum(known, 1),
+    }
+
+def hydropathy_profile(sequence, window=HYDROPATHY_WINDOW):
+    """Mean hydropathy of each `window` residues of `sequence`, computed with a cumulative sum (unknown residues are 0)."""
+    import numpy as np
+    codes, _ = encode([sequence])
+    if len(codes) < window:
+        return []
+    totals = np.concatenate([[0], np.cumsum(residue_table(HYDROPATHY)[codes])])
+    return np.round((totals[window:] - totals[:-window]) / window, 3).tolist()
+
+def feature_columns(sequences):
+    """
+    Rounded features of a batch of sequences as lists: length, molecular weight, isoelectric point, GRAVY
+    and the fraction of each residue. Features are None for sequences without any known residue.
+    """
+    import numpy as np
+    features = compute_features(sequences)
+    known = features['known'] > 0
+    rounded = lambda values, digits: np.where(known, np.round(values, digits), None).tolist()
+    return (
+        features['length'].tolist(),
+        rounded(features['molecular_weight'], 2),
+        rounded(features['isoelectric_point'], 2),
+        rounded(features['gravy'], 4),
+        np.round(features['counts'] / np.maximum(features['length'], 1)[:, None], 4).tolist(),
+    )
+
+def feature_rows(protein_ids, sequences):
+    """Features of a batch of sequences as JSON serializable dictionaries."""
+    aminoacids = settings.AMINOACIDS
+    return [{
+        'protein_id': protein_id,
+        'length': length,
+        'molecular_weight': weight,
+        'isoelectric_point': point,
+        'gravy': gravy,
+        'composition': dict(zip(aminoacids, composition)) if length else {},
+    } for protein_id, length, weight, point, gravy, composition in zip(protein_ids, *feature_columns(sequences))]
+
+def protein_features(protein_id, sequence, window=HYDROPATHY_WINDOW):
+    """Features of one protein, with its hydropathy profile."""
+    row = feature_rows([protein_id], [sequence])[0]
+    row['hydropathy'] = {'window': window, 'values': hydropathy_profile(sequence, window)}
+    return row
+
+def organism_sequence_batches(taxa):
+    """
+    Generator of `(protein_ids, sequences)` of the proteins of an organism, or of all the organisms below
+    a higher rank taxon, per batch of `BATCH_SIZE`.
+    """
+    rows = Sequence.objects.filter(organism_filter(taxa, 'protein__organism')).order_by('pk')
+    rows = rows.values_list('protein_id', 'sequence')
+    for chunk in merge(lambda alias: chunks(rows.using(alias).iterator(BATCH_SIZE), BATCH_SIZE), taxa_shards(taxa)):
+        yield zip(*chunk)
+
+def organism_features_json(taxa):
+    """Generator of encoded chunks of the JSON array of the features of an organism."""
+    separator = '['
+    for protein_ids, sequences in organism_sequence_batches(taxa):
+        yield (separator + ','.join(json.dumps(row) for row in feature_rows(protein_ids, sequences))).encode()
+        separator = ','
+    yield (']' if separator == ',' else '[]').encode()
+
+def organism_features_csv(taxa):
+    """Generator of encoded chunks of the CSV table of the features of an organism, with one column per residue."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS + list(settings.AMINOACIDS))
+    for protein_ids, sequences in organism_sequence_batches(taxa):
+        lengths, weights, points, gravies, compositions = feature_columns(sequences)
+        writer.writerows((p, l, w, i, g, *c) for p, l, w, i, g, c in
+                         zip(protein_ids, lengths, weights, points, gravies, compositions))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+# end of code I wrote
@@ -0,0 +1,200 @@
+# I wrote this code
+
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cooccurrence import build_matrix
+from .fasta import load_sequences, open_fasta, read_fasta
+from .models import Job
+from .routers import use_primary
+from .snapshot import write_snapshot
+
+
+class LoadFastaArguments(serializers.Serializer):
+    """Arguments of the `load_fasta` job, `path` is relative to the `JOB_DATA_DIR` setting."""
+    path = serializers.CharField()
+    batch_size = serializers.IntegerField(default=5000, min_value=1)
+    update = serializers.BooleanField(default=False)
+
+    def validate_path(self, value):
+        """Validate that `path` is an existing file inside `JOB_DATA_DIR`."""
+        root = os.path.realpath(settings.JOB_DATA_DIR)
+        path = os.path.realpath(os.path.join(root, value))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise serializers.ValidationError('File not found in the job data directory')
+        return value
+
+class ExportSnapshotArguments(serializers.Serializer):
+    """The `export_snapshot` job has no arguments, it writes to the `SNAPSHOT_DIR` setting."""
+
+    def validate(self, data):
+        if not settings.SNAPSHOT_DIR:
+            raise serializers.ValidationError('SNAPSHOT_DIR is not configured')
+        return data
+
+class BuildCooccurrenceArguments(serializers.Serializer):
+    """The `build_cooccurrence` job has no arguments, it writes to the `COOCCURRENCE_DIR` setting."""
+
+    def validate(self, data):
+        if not settings.COOCCURRENCE_DIR:
+            raise serializers.ValidationError('COOCCURRENCE_DIR is not configured')
+        return data
+
+def load_fasta(progress, path, batch_size, update):
+    """Load sequences of existing proteins from a FASTA file, reporting the share of the file read."""
+    path = os.path.join(settings.JOB_DATA_DIR, path)
+    size = os.path.getsize(path) or 1
+    with open_fasta(path) as fasta_file:
+        # Position on the file on disk, which is the compressed file for gzip files
+        raw = getattr(fasta_file.buffer, 'fileobj', fasta_file.buffer)
+        report = lambda counts: progress(raw.tell() / size, '%(created)d created, %(updated)d updated, '
+                                                            '%(skipped)d skipped' % counts)
+        return load_sequences(read_fasta(fasta_file), batch_size, update, report)
+
+def export_snapshot(progress):
+    """Export the read-only snapshot into the `SNAPSHOT_DIR` setting."""
+    progress(0, 'Exporting snapshot')
+    return write_snapshot(settings.SNAPSHOT_DIR)
+
+def build_cooccurrence(progress):
+    """Build the pfam co-occurrence matrix into the `COOCCURRENCE_DIR` setting."""
+    progress(0, 'Building co-occurrence matrix')
+    return build_matrix(settings.COOCCURRENCE_DIR)
+
+# Jobs that can be submitted, as kind: (function, arguments serializer).
+# Functions are called with a `progress(fraction, message)` callback and the validated arguments,
+# and return a JSON serializable result.
+JOBS = {
+    'load_fasta': (load_fasta, LoadFastaArguments),
+    'export_snapshot': (export_snapshot, ExportSnapshotArguments),
+    'build_cooccurrence': (build_cooccurrence, BuildCooccurrenceArguments),
+}
+
+
+def worker_name(pid=None):
+    return '%s:%d' % (socket.gethostname(), pid or os.getpid())
+
+def fail_running(jobs, error):
+    """Mark the `jobs` still running as failed with `error`, returns how many were."""
+    return jobs.filter(status=Job.RUNNING).update(status=Job.FAILED, error=error, finished=timezone.now())
+
+def fail_workers(workers):
+    """Fail the jobs left running by the stopped `workers`."""
+    with use_primary():
+        return fail_running(Job.objects.filter(worker__in=workers), 'The worker was stopped before the job finished')
+
+def claim(worker):
+    """
+    Claim the oldest pending job for `worker`, returns None when the queue is empty.
+    Running jobs without a heartbeat for `JOB_LEASE` seconds are failed first.
+
+    Rational:
+        the candidate row is locked with `SELECT ... FOR UPDATE SKIP LOCKED` where the database supports it,
+        so concurrent workers pick different jobs instead of waiting on each other.
+        The conditional update only succeeds for one worker, which keeps claims exclusive
+        on databases without row locks such as SQLite. There it runs outside a transaction,
+        since upgrading a read transaction to a write one fails with "database is locked".
+        Expired jobs are failed rather than queued again, since a job which killed its worker would kill the next one.
+    """
+    row_locks = connection.features.has_select_for_update_skip_locked
+    with use_primary():
+        expired = timezone.now() - timedelta(seconds=settings.JOB_LEASE)
+        fail_running(Job.objects.filter(heartbeat__lt=expired), 'The worker stopped sending heartbeats')
+        while True:
+            with transaction.atomic() if row_locks else nullcontext():
+                pending = Job.objects.filter(status=Job.PENDING).order_by('id')
+                if row_locks:
+                    pending = pending.select_for_update(skip_locked=True)
+                job = pending.first()
+                if job is None:
+                    return None
+
+                now = timezone.now()
+                claimed = Job.objects.filter(pk=job.pk, status=Job.PENDING).update(
+                    status=Job.RUNNING, worker=worker, started=now, heartbeat=now
+                )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+@contextmanager
+def heartbeat(job):
+    """
+    Context manager renewing the lease of a running `job` every third of `JOB_LEASE` from a thread,
+    so jobs which do not report progress for a while are not failed.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        with use_primary():
+            while not stopped.wait(settings.JOB_LEASE / 3):
+                try:
+                    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(heartbeat=timezone.now())
+                except DatabaseError:
+                    # Missed beats are made up by the next one, a lease lasts three of them
+                    pass
+        connection.close()
+
+    thread = threading.Thread(target=beat, name='heartbeat-%d' % job.pk, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def run(job):
+    """
+    Run a claimed job, saving its progress while it runs and its result or error once finished.
+
+    Rational:
+        the job is failed before an interruption (`KeyboardInterrupt`, `SystemExit`) is raised again,
+        so it is not left running.
+    """
+    function, arguments = JOBS[job.kind]
+    arguments = arguments(data=job.arguments)
+
+    def progress(fraction, message=''):
+        Job.objects.filter(pk=job.pk).update(progress=min(fraction, 1), message=message[:200],
+                                             heartbeat=timezone.now())
+
+    with use_primary(), heartbeat(job):
+        try:
+            arguments.is_valid(raise_exception=True)
+            result = function(progress, **arguments.validated_data)
+        except BaseException as exception:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, error=traceback.format_exc(), finished=timezone.now()
+            )
+            if not isinstance(exception, Exception):
+                raise
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.DONE, progress=1, result=result, finished=timezone.now()
+            )
+
+def work(poll_interval=1, burst=False):
+    """
+    Claim and run jobs until stopped, or until the queue is empty with `burst`.
+    """
+    worker = worker_name()
+    while True:
+        job = claim(worker)
+        if job is not None:
+            run(job)
+        elif burst:
+            return
+        else:
+            time.sleep(poll_interval)
+
+# end of code I wrote
@@ -0,0 +1,26 @@
+# I wrote this code
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from proteinmap.cooccurrence import build_matrix
+
+
+class Command(BaseCommand):
+    """
+    Build the pfam co-occurrence matrix served by `GET /api/pfam/<id>/cooccurring`.
+    """
+    help = 'Count the pfams co-occurring in the same proteins, globally and per organism.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=settings.COOCCURRENCE_DIR,
+                            help='Matrix directory, defaults to the COOCCURRENCE_DIR setting')
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Provide a matrix path or set PROTEINMAP_COOCCURRENCE_DIR.')
+
+        result = build_matrix(options['path'])
+        self.stdout.write('Counted %(pairs)d co-occurring pairs of %(pfams)d pfams' % result)
+
+# end of code I wrote
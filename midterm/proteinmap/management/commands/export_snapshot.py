@@ -0,0 +1,27 @@
+# I wrote this code
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from proteinmap.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Export the whole dataset into the read-only, memory-mapped snapshot served by the API.
+    """
+    help = 'Export proteins, organisms, domains, pfams and sequences into a memory-mapped snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=settings.SNAPSHOT_DIR,
+                            help='Snapshot directory, defaults to the SNAPSHOT_DIR setting')
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Provide a snapshot path or set PROTEINMAP_SNAPSHOT_DIR.')
+
+        manifest = write_snapshot(options['path'])
+        self.stdout.write('Exported %(proteins)d proteins, %(domains)d domains, %(organisms)d organisms '
+                          'and %(pfams)d pfams' % manifest)
+
+# end of code I wrote
@@ -0,0 +1,26 @@
+# I wrote this code
+
+from django.core.management.base import BaseCommand
+
+from proteinmap.fasta import load_sequences, open_fasta, read_fasta
+from proteinmap.routers import use_primary
+
+
+class Command(BaseCommand):
+    """
+    Load protein sequences from a FASTA file, streaming it in batches.
+    """
+    help = 'Load sequences of existing proteins from a FASTA file (optionally gzip compressed).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='FASTA file, compressed files end with .gz')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Records saved per batch')
+        parser.add_argument('--update', action='store_true', help='Replace sequences that already exist')
+
+    def handle(self, *args, **options):
+        with use_primary(), open_fasta(options['path']) as fasta_file:
+            counts = load_sequences(read_fasta(fasta_file), options['batch_size'], options['update'])
+        self.stdout.write('Created %(created)d, updated %(updated)d and skipped %(skipped)d sequences, '
+                          '%(invalid)d invalid and %(duplicates)d duplicates' % counts)
+
+# end of code I wrote
@@ -0,0 +1,27 @@
+# I wrote this code
+
+from django.core.management.base import BaseCommand
+
+from proteinmap.routers import use_primary
+from proteinmap.taxonomy import load_taxonomy
+
+
+class Command(BaseCommand):
+    """
+    Load the taxonomy used to query organisms by higher ranks, replacing the previous one.
+    """
+    help = 'Load the taxonomy tree from NCBI nodes.dmp and names.dmp files (optionally gzip compressed).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', help='nodes.dmp file, compressed files end with .gz')
+        parser.add_argument('names', help='names.dmp file, compressed files end with .gz')
+        parser.add_argument('--prune', action='store_true',
+                            help='Keep only the organisms of the database and their ancestors')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Nodes saved per batch')
+
+    def handle(self, *args, **options):
+        with use_primary():
+            counts = load_taxonomy(options['nodes'], options['names'], options['prune'], options['batch_size'])
+        self.stdout.write('Loaded %(nodes)d taxonomy nodes, covering %(organisms)d organisms' % counts)
+
+# end of code I wrote
@@ -0,0 +1,66 @@
+# I wrote this code
+
+import multiprocessing
+import os
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """
+    Run a pool of worker processes claiming and running the background jobs queued with `POST /api/jobs`.
+    """
+    help = 'Run worker processes for the background job queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds between polls of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        # Imported here, since spawned workers import this module before Django is set up
+        from proteinmap.jobs import fail_workers, work, worker_name
+
+        if options['processes'] == 1:
+            work(options['poll_interval'], options['burst'])
+            return
+
+        # Every process opens its own database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=start_worker, args=(options['poll_interval'], options['burst']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write('Started %d workers' % len(processes))
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
+        finally:
+            # Workers which were terminated or died leave their job running
+            failed = fail_workers([worker_name(process.pid) for process in processes])
+            if failed:
+                self.stdout.write('Failed %d jobs of stopped workers' % failed)
+
+def start_worker(poll_interval, burst):
+    """
+    Entry point of a worker process.
+
+    Rational:
+        with the `spawn` start method (default on macOS and Windows) the child starts a new interpreter,
+        so Django is set up before the jobs, and their models, are imported.
+    """
+    django.setup()
+    from proteinmap.jobs import work
+
+    work(poll_interval, burst)
+
+# end of code I wrote
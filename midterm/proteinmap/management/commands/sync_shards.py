@@ -0,0 +1,37 @@
+# I wrote this code
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from proteinmap.sharding import partition_tables, reserve_id_ranges, sync_reference_tables
+
+
+class Command(BaseCommand):
+    """
+    Copy the organisms, pfams and taxonomy of the primary into every shard, and start the domain ids of each shard
+    at its own range. With `--partition`, the proteins, sequences and domains of the primary are copied too,
+    each into the shard of its organism, to shard an existing database.
+
+    Rational:
+        shards join their proteins with the organisms, pfams and taxonomy, so each shard holds a copy of them.
+        Writes through the models are copied by signals, this copies bulk loads such as `load_taxonomy`.
+    """
+    help = 'Copy the reference tables of the primary into the shard databases set on PROTEINMAP_DB_SHARDS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partition', action='store_true',
+                            help='Also copy the proteins, sequences and domains of the primary into their shard')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_SHARDS:
+            raise CommandError('No shard databases are set on PROTEINMAP_DB_SHARDS.')
+
+        counts = sync_reference_tables()
+        if options['partition']:
+            counts.update(partition_tables())
+        reserve_id_ranges()
+        self.stdout.write('Copied %s into %d shards' % (
+            ', '.join('%d %s' % (count, name) for name, count in counts.items()), len(settings.DATABASE_SHARDS)
+        ))
+
+# end of code I wrote
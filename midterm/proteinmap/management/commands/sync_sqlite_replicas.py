@@ -0,0 +1,33 @@
+# I wrote this code
+
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """
+    Copy the primary SQLite database into every configured replica file.
+
+    Rational:
+        SQLite has no replication, so a local replica is refreshed with the online backup API,
+        which produces a consistent copy even while the primary is being written in WAL mode.
+    """
+    help = 'Copy the primary SQLite database into the replica files set on PROTEINMAP_DB_REPLICAS.'
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Replicas can only be synchronized for SQLite databases.')
+
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+            target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            source.backup(target)
+            target.close()
+            self.stdout.write('Synchronized %s' % settings.DATABASES[alias]['NAME'])
+        source.close()
+
+# end of code I wrote
@@ -0,0 +1,135 @@
+# I wrote this code
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Metrics of the request being handled, propagated to the threads running its database queries
+_current = ContextVar('request_metrics', default=None)
+
+# Upper bounds of the histogram buckets of each measure
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Number of queries of a request kept for the slow request log
+MAX_RECORDED_QUERIES = 500
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus format, with one series per label value.
+    """
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            counts, total = self.series.get(label, ([0] * (len(self.buckets) + 1), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.series[label] = (counts, total + value)
+
+    def render(self, label_name):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            series = sorted(self.series.items())
+        for label, (counts, total) in series:
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                lines.append('%s_bucket{%s="%s",le="%s"} %d' % (self.name, label_name, label, bound, count))
+            lines.append('%s_sum{%s="%s"} %s' % (self.name, label_name, label, repr(float(total))))
+            lines.append('%s_count{%s="%s"} %d' % (self.name, label_name, label, counts[-1]))
+        return lines
+
+REQUEST_DURATION = Histogram('proteinmap_request_duration_seconds', 'Wall time of requests.', DURATION_BUCKETS)
+SQL_QUERIES = Histogram('proteinmap_sql_queries', 'SQL queries executed per request.', COUNT_BUCKETS)
+SQL_DURATION = Histogram('proteinmap_sql_duration_seconds', 'Time spent on SQL queries per request.', DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram(
+    'proteinmap_serializer_duration_seconds', 'Time spent on serializers per request.', DURATION_BUCKETS
+)
+RESPONSE_BYTES = Histogram('proteinmap_response_bytes', 'Size of response bodies.', BYTES_BUCKETS)
+HISTOGRAMS = [REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, SERIALIZER_DURATION, RESPONSE_BYTES]
+
+class RequestMetrics:
+    """
+    Measures of a single request, filled by the middleware, the SQL wrapper and the serializers.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0
+        self.sql_count = 0
+        self.sql_time = 0
+        self.serializer_time = 0
+        self.bytes = 0
+        self.queries = []
+
+    def observe(self, view):
+        self.duration = time.perf_counter() - self.start
+        REQUEST_DURATION.observe(view, self.duration)
+        SQL_QUERIES.observe(view, self.sql_count)
+        SQL_DURATION.observe(view, self.sql_time)
+        SERIALIZER_DURATION.observe(view, self.serializer_time)
+        RESPONSE_BYTES.observe(view, self.bytes)
+
+    def slowest_queries(self, count=5):
+        return sorted(self.queries, reverse=True)[:count]
+
+    def repeated_queries(self, count=3):
+        """Queries run more than once with the same SQL, which usually is an N+1 pattern."""
+        repeated = Counter(sql for _, sql in self.queries).most_common(count)
+        return [(times, sql) for sql, times in repeated if times > 1]
+
+@contextmanager
+def activate(metrics):
+    """Context manager making `metrics` the measures of the current request."""
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def measure_serializer():
+    """Context manager adding the time spent inside it to the serializer time of the current request."""
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serializer_time += time.perf_counter() - start
+
+def record_sql(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting and timing the queries of the current request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.sql_count += 1
+        metrics.sql_time += elapsed
+        if len(metrics.queries) < MAX_RECORDED_QUERIES:
+            metrics.queries.append((elapsed, sql))
+
+def render():
+    """Returns all the histograms in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render('view'))
+    return '\n'.join(lines) + '\n'
+
+# end of code I wrote
@@ -0,0 +1,333 @@
+# I wrote this code
+
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+
+from .coalescing import flights
+from .compression import WRITES, compress, compressor, is_compressible, negotiate, response_cache_key
+from .metrics import RequestMetrics, activate
+from .throttling import throttled_response
+
+logger = logging.getLogger('proteinmap.performance')
+
+# Entities whose versions key the cached responses of each view, as `(kind, URL argument)`.
+# The responses of the other views are keyed by the version replaced by every write.
+RESPONSE_ENTITIES = {
+    'protein_detail_api': [('protein', 'pk')],
+    'protein_features_api': [('protein', 'pk')],
+    'domain_coverage_api': [('protein', 'protein_id')],
+    'pfam_detail_api': [('pfam', 'pk')],
+    'cooccurring_pfams_api': [('pfam', 'pk')],
+    'organism_proteins_api': [('taxa', 'taxa')],
+    'organism_pfams_api': [('taxa', 'taxa')],
+    'organism_features_api': [('taxa', 'taxa')],
+}
+
+
+def response_entities(url_name, kwargs):
+    """The `(kind, id)` entities read by a cached response of the view `url_name` with the URL `kwargs`."""
+    if url_name not in RESPONSE_ENTITIES:
+        return [WRITES]
+    return [(kind, kwargs[argument]) for kind, argument in RESPONSE_ENTITIES[url_name]]
+
+def throttle_scope(view_func):
+    """The `throttle_scope` of the class of a DRF or class-based view, None for a function view."""
+    return getattr(getattr(view_func, 'view_class', None), 'throttle_scope', None)
+
+class PerformanceMiddleware:
+    """
+    Middleware measuring wall time, SQL queries and time, serializer time and response bytes
+    of every request, recorded on histograms labelled by URL name and exposed at `/metrics`.
+    Requests slower than the `SLOW_REQUEST_SECONDS` setting are logged with their SQL.
+
+    Rational:
+        streamed responses are measured once their content has been sent,
+        since their queries run while the response is iterated.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        with activate(metrics):
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        with activate(metrics):
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if not response.streaming:
+            metrics.bytes = len(response.content)
+            self.observe(request, response, metrics)
+        elif isinstance(response, FileResponse) or response.has_header('Content-Length'):
+            metrics.bytes = int(response.get('Content-Length', 0))
+            self.observe(request, response, metrics)
+        elif response.is_async:
+            content = aiter(response.streaming_content)
+            response.streaming_content = self.measure_async_stream(request, response, metrics, content)
+        else:
+            content = response.streaming_content
+            response.streaming_content = self.measure_stream(request, response, metrics, content)
+        return response
+
+    def measure_stream(self, request, response, metrics, content):
+        try:
+            while True:
+                with activate(metrics):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                metrics.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.observe(request, response, metrics)
+
+    async def measure_async_stream(self, request, response, metrics, content):
+        try:
+            while True:
+                with activate(metrics):
+                    chunk = await anext(content, None)
+                if chunk is None:
+                    break
+                metrics.bytes += len(chunk)
+                yield chunk
+        finally:
+            self.observe(request, response, metrics)
+
+    def observe(self, request, response, metrics):
+        view = getattr(request.resolver_match, 'url_name', None) or 'unmatched'
+        metrics.observe(view)
+
+        if metrics.duration >= settings.SLOW_REQUEST_SECONDS:
+            lines = ['Slow request %s %s (%s) %d: %.3fs, %d queries in %.3fs, serializer %.3fs, %d bytes' % (
+                request.method, request.get_full_path(), view, response.status_code, metrics.duration,
+                metrics.sql_count, metrics.sql_time, metrics.serializer_time, metrics.bytes
+            )]
+            lines += ['  slow query %.3fs: %s' % query for query in metrics.slowest_queries()]
+            lines += ['  repeated query x%d: %s' % query for query in metrics.repeated_queries()]
+            logger.warning('\n'.join(lines))
+
+class CompressionMiddleware:
+    """
+    Middleware compressing responses with the best encoding accepted by the client (brotli, zstd or gzip),
+    and caching the compressed responses of the views listed in the `RESPONSE_CACHE_VIEWS` setting.
+
+    Rational:
+        cached responses are looked up before the view is called, so hits skip both
+        serialization and compression, and are throttled like the view. They are keyed by the versions
+        of the entities they read (see `RESPONSE_ENTITIES`), so a write only invalidates the responses reading it.
+        Streamed responses are compressed chunk by chunk, and cached once sent when small enough.
+        Concurrent misses of the same response are coalesced (see `coalescing.SingleFlight`):
+        one request runs the view while the others wait, then are served from the cache.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        key = self.flight_key(request)
+        flight = flights.join(key) if key is not None else None
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            if flight is not None:
+                flight.land()
+            raise
+        return self.finish(request, response, flight)
+
+    async def __acall__(self, request):
+        key = self.flight_key(request)
+        flight = await flights.ajoin(key) if key is not None else None
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            if flight is not None:
+                flight.land()
+            raise
+        return self.finish(request, response, flight)
+
+    def is_cached(self, request, url_name):
+        return request.method == 'GET' and settings.RESPONSE_CACHE_TIMEOUT and url_name in settings.RESPONSE_CACHE_VIEWS
+
+    def flight_key(self, request):
+        """Cache key of the response when concurrent requests of it are coalesced, None otherwise."""
+        if not settings.COALESCE_TIMEOUT or request.method != 'GET':
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if not self.is_cached(request, match.url_name):
+            return None
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        entities = response_entities(match.url_name, match.kwargs)
+        request.response_cache_key = response_cache_key(request, encoding, entities)
+        return request.response_cache_key
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.is_cached(request, request.resolver_match.url_name):
+            return None
+
+        if getattr(request, 'response_cache_key', None) is None:
+            encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            entities = response_entities(request.resolver_match.url_name, view_kwargs)
+            request.response_cache_key = response_cache_key(request, encoding, entities)
+        cached = cache.get(request.response_cache_key)
+        if cached is None:
+            return None
+        # Hits skip the view and its throttle, the client is throttled here instead
+        throttled = throttled_response(request, throttle_scope(view_func))
+        if throttled is not None:
+            return throttled
+
+        content_type, encoding, body = cached
+        response = HttpResponse(body, content_type=content_type)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    def finish(self, request, response, flight=None):
+        """Compress and cache the response, then land its flight, once sent when it is streamed."""
+        if flight is None:
+            return self.encode(request, response)
+        try:
+            response = self.encode(request, response)
+        except BaseException:
+            flight.land()
+            raise
+
+        if not response.streaming:
+            flight.land()
+        elif response.is_async:
+            response.streaming_content = self.land_async_stream(aiter(response.streaming_content), flight)
+        else:
+            response.streaming_content = self.land_stream(response.streaming_content, flight)
+        return response
+
+    def encode(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if response.get('X-Cache') == 'HIT' or not is_compressible(content_type):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.has_header('Content-Encoding'):
+            return response
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        key = getattr(request, 'response_cache_key', None) if response.status_code == 200 else None
+        if key is not None:
+            response.headers['X-Cache'] = 'MISS'
+
+        if response.streaming:
+            if encoding is None and key is None:
+                return response
+            stream = compressor(encoding, key is not None) if encoding else None
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+                del response.headers['Content-Length']
+            if response.is_async:
+                content = aiter(response.streaming_content)
+                response.streaming_content = self.compress_async_stream(content, stream, key, content_type, encoding)
+            else:
+                content = response.streaming_content
+                response.streaming_content = self.compress_stream(content, stream, key, content_type, encoding)
+            return response
+
+        body = response.content
+        if encoding is not None and len(body) >= settings.COMPRESSION_MIN_BYTES:
+            compressed = compress(body, encoding, key is not None)
+            if len(compressed) < len(body):
+                response.content = body = compressed
+                response.headers['Content-Encoding'] = encoding
+                response.headers['Content-Length'] = str(len(body))
+            else:
+                encoding = None
+        else:
+            encoding = None
+
+        if key is not None:
+            cache.set(key, (content_type, encoding, body), settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def compress_stream(self, content, stream, key, content_type, encoding):
+        collected = bytearray() if key is not None else None
+        for chunk in content:
+            chunk = stream.compress(chunk) + stream.flush() if stream else chunk
+            collected = self.collect(collected, chunk)
+            yield chunk
+        if stream:
+            chunk = stream.finish()
+            collected = self.collect(collected, chunk)
+            yield chunk
+        if collected is not None:
+            cache.set(key, (content_type, encoding, bytes(collected)), settings.RESPONSE_CACHE_TIMEOUT)
+
+    async def compress_async_stream(self, content, stream, key, content_type, encoding):
+        collected = bytearray() if key is not None else None
+        async for chunk in content:
+            chunk = stream.compress(chunk) + stream.flush() if stream else chunk
+            collected = self.collect(collected, chunk)
+            yield chunk
+        if stream:
+            chunk = stream.finish()
+            collected = self.collect(collected, chunk)
+            yield chunk
+        if collected is not None:
+            cache.set(key, (content_type, encoding, bytes(collected)), settings.RESPONSE_CACHE_TIMEOUT)
+
+    def land_stream(self, content, flight):
+        try:
+            yield from content
+        finally:
+            flight.land()
+
+    async def land_async_stream(self, content, flight):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            flight.land()
+
+    def collect(self, collected, chunk):
+        """
+        Add a chunk to the collected stream, which stops being cached past `RESPONSE_CACHE_MAX_BYTES`.
+
+        Rational:
+            chunks are appended to a single buffer, whose length is the running total of the stream,
+            instead of summing the chunks collected so far on every chunk.
+        """
+        if collected is None:
+            return None
+        collected += chunk
+        if len(collected) > settings.RESPONSE_CACHE_MAX_BYTES:
+            return None
+        return collected
+
+# end of code I wrote
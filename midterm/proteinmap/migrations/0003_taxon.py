@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proteinmap', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Taxon',
+            fields=[
+                ('taxa_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('rank', models.CharField(blank=True, max_length=50)),
+                ('lft', models.IntegerField(db_index=True)),
+                ('rgt', models.IntegerField()),
+                ('parent', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='children', to='proteinmap.taxon')),
+            ],
+        ),
+    ]
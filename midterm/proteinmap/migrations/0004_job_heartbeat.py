@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proteinmap', '0003_taxon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -4,8 +4,7 @@ from django.conf import settings
 from random import choices, randint
 import factory
 
-from .models import *
-from .serializers import *
+from .models import Domain, Organism, Pfam, Protein, Sequence
 
 class OrganismFactory(factory.django.DjangoModelFactory):
     """
@@ -41,4 +41,48 @@ class Domain(models.Model):
     start = models.IntegerField(null=False, blank=False)
     stop = models.IntegerField(null=False, blank=False)
 
+class Taxon(models.Model):
+    """
+    Node of the NCBI taxonomy, loaded by `manage.py load_taxonomy`, stored as nested set intervals:
+    the descendants of a node, itself included, are the nodes whose `lft` is between its `lft` and `rgt`.
+    Organisms are the nodes with the same `taxa_id`.
+    """
+    taxa_id = models.IntegerField(primary_key=True)
+    parent = models.ForeignKey('self', null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                               related_name='children')
+    name = models.CharField(max_length=200, blank=True)
+    rank = models.CharField(max_length=50, blank=True)
+    lft = models.IntegerField(db_index=True)
+    rgt = models.IntegerField()
+
+    def __str__(self):
+        return self.name
+
+class Job(models.Model):
+    """
+    Background job, queued by the API and run by `manage.py run_workers`.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50, null=False, blank=False)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, db_index=True)
+    progress = models.FloatField(default=0)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # Last time the worker running the job reported it was alive, the job is failed once it is older than `JOB_LEASE`
+    heartbeat = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return '%s #%d' % (self.kind, self.pk)
+
 # end of code I wrote
\ No newline at end of file
@@ -0,0 +1,396 @@
+# I wrote this code
+
+"""
+Nested queries on organisms, proteins, domains and pfams, with a subset of the GraphQL syntax:
+
+    {
+      organism(taxa_id: 53326) {
+        genus species
+        proteins(limit: 10) { protein_id length domains { start stop pfam { pfam_id } } }
+      }
+    }
+
+Fields can be aliased (`human: organism(taxa_id: 9606) { ... }`), and every alias or field name is selected
+once per selection set. Variables, fragments and directives are not supported.
+Each relation of the query is loaded for all its parents at once, see `execute()`.
+"""
+
+import re
+import threading
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Domain, Organism, Pfam, Protein, Sequence
+from .routers import shard_for
+from .sharding import fan_out, model_shards, shards
+
+# Nested selections allowed below the root fields
+MAX_DEPTH = 5
+
+# Cost allowed per query, where each returned object costs 1, SQL queries are limited by `max_queries()`
+MAX_COST = 20000
+
+# Parent keys per `IN` query, below the default limit of 999 variables per statement of SQLite
+BATCH_SIZE = 900
+
+TOKEN = re.compile(r'(?P<skip>[\s,]+|#[^\n]*)|(?P<name>[_A-Za-z][_0-9A-Za-z]*)|(?P<int>-?\d+)'
+                   r'|(?P<string>"(?:[^"\\\n]|\\.)*")|(?P<punctuation>[{}():])')
+
+
+class QueryError(Exception):
+    """Invalid query, or query exceeding the depth or cost limits, returned to the client as a 400 response."""
+
+class Relation:
+    """
+    Field of `type` objects loaded from the rows of `model` whose `key` column is in the `parent_key` values
+    of the parent rows, as a list when `many`. With `column`, the value of that column is returned instead.
+    """
+    def __init__(self, type, model, key, parent_key, many=False, column=None, arguments=None):
+        self.type = type
+        self.model = model
+        self.key = key
+        self.parent_key = parent_key
+        self.many = many
+        self.column = column
+        self.arguments = arguments or {}
+
+# Scalar fields (field: column) and relations of each type
+SCALARS = {
+    'Organism': {'taxa_id': 'taxa_id', 'clade': 'clade', 'genus': 'genus', 'species': 'species'},
+    'Protein': {'protein_id': 'protein_id', 'length': 'length'},
+    'Domain': {'id': 'id', 'description': 'description', 'start': 'start', 'stop': 'stop'},
+    'Pfam': {'pfam_id': 'pfam_id', 'description': 'description'},
+}
+RELATIONS = {
+    'Organism': {
+        'proteins': Relation('Protein', Protein, 'organism_id', 'taxa_id', many=True,
+                             arguments={'limit': int, 'offset': int}),
+    },
+    'Protein': {
+        'organism': Relation('Organism', Organism, 'taxa_id', 'organism_id'),
+        'sequence': Relation(None, Sequence, 'protein_id', 'protein_id', column='sequence'),
+        'domains': Relation('Domain', Domain, 'protein_id', 'protein_id', many=True),
+    },
+    'Domain': {
+        'protein': Relation('Protein', Protein, 'protein_id', 'protein_id'),
+        'pfam': Relation('Pfam', Pfam, 'pfam_id', 'pfam_id'),
+    },
+    'Pfam': {},
+}
+
+# Root fields, each loading one object by its primary key argument
+ROOT = {
+    'organism': (Relation('Organism', Organism, 'taxa_id', None), 'taxa_id', int),
+    'protein': (Relation('Protein', Protein, 'protein_id', None), 'protein_id', str),
+    'pfam': (Relation('Pfam', Pfam, 'pfam_id', None), 'pfam_id', str),
+}
+
+
+class Field:
+    def __init__(self, alias, name, arguments, selections):
+        self.alias = alias
+        self.name = name
+        self.arguments = arguments
+        self.selections = selections
+
+class Parser:
+    """Recursive descent parser of the query text into a list of `Field`."""
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = TOKEN.match(text, position)
+            if match is None:
+                raise QueryError('Unexpected character %r at position %d.' % (text[position], position))
+            if match.lastgroup != 'skip':
+                self.tokens.append((match.lastgroup, match.group()))
+            position = match.end()
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind, value=None):
+        token_kind, token_value = self.peek()
+        if token_kind != kind or (value is not None and token_value != value):
+            raise QueryError('Expected %s, found %s.' % (value or kind, token_value or 'end of query'))
+        self.position += 1
+        return token_value
+
+    def document(self):
+        if self.peek() == ('name', 'query'):
+            self.position += 1
+            if self.peek()[0] == 'name':
+                self.position += 1
+        selections = self.selections()
+        if self.peek()[0] is not None:
+            raise QueryError('Unexpected %s after the query.' % self.peek()[1])
+        return selections
+
+    def selections(self, depth=0):
+        # Checked while parsing too, so deeply nested braces never reach the recursion limit
+        if depth > MAX_DEPTH + 1:
+            raise QueryError('Query depth exceeds the maximum of %d.' % MAX_DEPTH)
+        self.take('punctuation', '{')
+        selections = []
+        while self.peek() != ('punctuation', '}'):
+            selections.append(self.field(depth))
+        self.take('punctuation', '}')
+        if not selections:
+            raise QueryError('Selections can not be empty.')
+        aliases = set()
+        for field in selections:
+            if field.alias in aliases:
+                raise QueryError('Field or alias %r is selected more than once.' % field.alias)
+            aliases.add(field.alias)
+        return selections
+
+    def field(self, depth):
+        alias = name = self.take('name')
+        if self.peek() == ('punctuation', ':'):
+            self.position += 1
+            name = self.take('name')
+
+        arguments = {}
+        if self.peek() == ('punctuation', '('):
+            self.position += 1
+            while self.peek() != ('punctuation', ')'):
+                argument = self.take('name')
+                self.take('punctuation', ':')
+                arguments[argument] = self.value()
+            self.position += 1
+
+        selections = self.selections(depth + 1) if self.peek() == ('punctuation', '{') else None
+        return Field(alias, name, arguments, selections)
+
+    def value(self):
+        kind, value = self.peek()
+        self.position += 1
+        if kind == 'int':
+            return int(value)
+        if kind == 'string':
+            return re.sub(r'\\(.)', r'\1', value[1:-1])
+        raise QueryError('Expected a value, found %s.' % (value or 'end of query'))
+
+def check_arguments(field, types):
+    """Check the arguments of `field` against `types` (name: Python type)."""
+    for name, value in field.arguments.items():
+        if name not in types:
+            raise QueryError('Unknown argument %r on field %r.' % (name, field.name))
+        if not isinstance(value, types[name]):
+            raise QueryError('Argument %r of field %r must be %s.' % (
+                name, field.name, 'an integer' if types[name] is int else 'a string'))
+        if types[name] is int and value < 0:
+            raise QueryError('Argument %r of field %r can not be negative.' % (name, field.name))
+
+def validate(selections, type, depth=0):
+    """Check the fields, arguments and depth of the selections of a `type` object."""
+    if depth > MAX_DEPTH:
+        raise QueryError('Query depth exceeds the maximum of %d.' % MAX_DEPTH)
+    for field in selections:
+        relation = RELATIONS[type].get(field.name)
+        if field.name not in SCALARS[type] and relation is None:
+            raise QueryError('Unknown field %r on type %s.' % (field.name, type))
+        check_arguments(field, relation.arguments if relation is not None else {})
+        if relation is not None and relation.type is not None:
+            if field.selections is None:
+                raise QueryError('Field %r of type %s must have a selection.' % (field.name, relation.type))
+            validate(field.selections, relation.type, depth + 1)
+        elif field.selections is not None:
+            raise QueryError('Field %r of type %s can not have a selection.' % (field.name, type))
+
+def max_queries():
+    """SQL queries allowed per query: one per shard for the root fields and each nested level, and one per root type."""
+    return (MAX_DEPTH + 1) * len(shards()) + len(ROOT)
+
+def planned_queries(selections, type):
+    """SQL queries loading the relations of the `selections` of a `type` object, one per shard they are read from."""
+    count = 0
+    for field in selections:
+        relation = RELATIONS[type].get(field.name)
+        if relation is not None:
+            count += len(model_shards(relation.model))
+            if relation.type is not None:
+                count += planned_queries(field.selections, relation.type)
+    return count
+
+class Cost:
+    """
+    Running cost of a query, failing it once `MAX_COST` objects or `max_queries()` SQL queries are exceeded,
+    charged by the threads of every shard.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = MAX_COST
+        self.max_queries = max_queries()
+        self.queries = 0
+
+    def charge(self, cost):
+        with self.lock:
+            self.remaining -= cost
+            if self.remaining < 0:
+                raise QueryError('Query cost exceeds the maximum of %d.' % MAX_COST)
+
+    def charge_queries(self, count=1):
+        with self.lock:
+            self.queries += count
+            if self.queries > self.max_queries:
+                raise QueryError('Query needs more than the maximum of %d SQL queries.' % self.max_queries)
+
+def shard_keys(relation, keys):
+    """
+    Parent keys of `relation` to query on each shard: rows keyed by organism are on the shard of the organism,
+    other partitioned rows may be on any shard, and the other models are queried as usual.
+    """
+    aliases = model_shards(relation.model)
+    if len(aliases) == 1 or relation.key != 'organism_id':
+        return {alias: keys for alias in aliases}
+    grouped = defaultdict(list)
+    for key in keys:
+        grouped[shard_for(key)].append(key)
+    return grouped
+
+def fetch(relation, keys, columns, arguments, cost):
+    """
+    Rows of `relation` for the parent `keys`, as dictionaries of `columns`, in batches of `BATCH_SIZE` keys,
+    read from the shards concurrently.
+    `limit` and `offset` apply to the rows of each parent, ordered by primary key.
+    """
+    targets = shard_keys(relation, keys)
+    shard_rows = fan_out(lambda alias: fetch_shard(relation, targets[alias], columns, arguments, cost), list(targets))
+    return [row for rows in shard_rows for row in rows]
+
+def fetch_shard(relation, keys, columns, arguments, cost):
+    pk = relation.model._meta.pk.attname
+    limit, offset = arguments.get('limit'), arguments.get('offset', 0)
+    rows = []
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        cost.charge_queries()
+        queryset = relation.model.objects.filter(**{relation.key + '__in': batch})
+        if (limit is not None or offset) and len(batch) > 1:
+            queryset = queryset.annotate(row=Window(RowNumber(), partition_by=F(relation.key), order_by=F(pk).asc()))
+            queryset = queryset.filter(row__gt=offset)
+            if limit is not None:
+                queryset = queryset.filter(row__lte=offset + limit)
+        queryset = queryset.order_by(relation.key, pk).values(*columns)
+        if len(batch) == 1:
+            queryset = queryset[offset:None if limit is None else offset + limit]
+
+        # One more row than the remaining cost is read, so a too large level fails without being read whole
+        fetched = list(queryset[:max(cost.remaining, 0) + 1])
+        cost.charge(len(fetched))
+        rows += fetched
+    return rows
+
+def load(relation, keys, selections, arguments, cost):
+    """
+    Load the objects of `relation` for the parent `keys`, with their selected fields and relations.
+
+    Rational:
+        like a dataloader, each relation of the query is loaded for all the parents of its level with
+        `IN` queries on its key, instead of one query per parent. The children relations are then loaded
+        for all the loaded rows at once, so the number of queries depends on the query and not on the data.
+        Rows are read with `values()`, only with the selected columns and the keys of the selected relations.
+    Returns the output objects, or column values, by key (lists of them when the relation is `many`).
+    """
+    if relation.column is not None:
+        rows = fetch(relation, sorted(keys), [relation.key, relation.column], arguments, cost)
+        return {row[relation.key]: row[relation.column] for row in rows}
+
+    rows = fetch(relation, sorted(keys), selected_columns(relation, [selections]), arguments, cost)
+    grouped = {}
+    for row, output in zip(rows, build_outputs(relation, rows, selections, cost)):
+        if relation.many:
+            grouped.setdefault(row[relation.key], []).append(output)
+        else:
+            grouped[row[relation.key]] = output
+    return grouped
+
+def selected_columns(relation, selection_sets):
+    """Columns of `relation` read for any of the `selection_sets`: its key, selected scalars and relation keys."""
+    scalars, relations = SCALARS[relation.type], RELATIONS[relation.type]
+    columns = {relation.key}
+    for selections in selection_sets:
+        columns.update(scalars[field.name] for field in selections if field.name in scalars)
+        columns.update(relations[field.name].parent_key for field in selections if field.name in relations)
+    return sorted(columns)
+
+def build_outputs(relation, rows, selections, cost):
+    """Output objects of the `rows` of `relation`, the selected relations being loaded for all the rows at once."""
+    scalars, relations = SCALARS[relation.type], RELATIONS[relation.type]
+    outputs = [{} for _ in rows]
+    for field in selections:
+        if field.name in scalars:
+            for row, output in zip(rows, outputs):
+                output[field.alias] = row[scalars[field.name]]
+            continue
+
+        child = relations[field.name]
+        loaded = load(child, {row[child.parent_key] for row in rows}, field.selections, field.arguments, cost)
+        for row, output in zip(rows, outputs):
+            output[field.alias] = loaded.get(row[child.parent_key], [] if child.many else None)
+    return outputs
+
+def signature(selections):
+    """Hashable form of `selections`, equal for root fields whose objects are built the same way."""
+    return tuple((field.alias, field.name, tuple(sorted(field.arguments.items())),
+                  None if field.selections is None else signature(field.selections)) for field in selections)
+
+def execute(text):
+    """
+    Parse, validate and run a query, returns its data by root field alias.
+    Raises `QueryError` on invalid queries, or when the depth, cost or SQL queries limits are exceeded.
+
+    Rational:
+        the root fields of a type are loaded together by one `IN` query on their keys, and the fields with the
+        same selections share the loads of their relations, so aliases do not add queries per object.
+        The SQL queries of the whole query are counted from its fields and checked before running any,
+        then charged again while running, since more than `BATCH_SIZE` parents take several batches.
+    """
+    selections = Parser(text).document()
+    for field in selections:
+        if field.name not in ROOT:
+            raise QueryError('Unknown root field %r, expected one of: %s.' % (field.name, ', '.join(ROOT)))
+        relation, argument, argument_type = ROOT[field.name]
+        check_arguments(field, {argument: argument_type})
+        if argument not in field.arguments:
+            raise QueryError('Field %r requires the argument %r.' % (field.name, argument))
+        if field.selections is None:
+            raise QueryError('Field %r of type %s must have a selection.' % (field.name, relation.type))
+        validate(field.selections, relation.type, 1)
+
+    roots = defaultdict(list)
+    for field in selections:
+        roots[field.name].append(field)
+    groups = {name: defaultdict(list) for name in roots}
+    planned = 0
+    for name, fields in roots.items():
+        relation, argument, _ = ROOT[name]
+        batches = -(-len({field.arguments[argument] for field in fields}) // BATCH_SIZE)
+        planned += batches * len(model_shards(relation.model))
+        for field in fields:
+            groups[name][signature(field.selections)].append(field)
+        planned += sum(planned_queries(group[0].selections, relation.type) for group in groups[name].values())
+
+    cost = Cost()
+    if planned > cost.max_queries:
+        raise QueryError('Query needs more than the maximum of %d SQL queries.' % cost.max_queries)
+
+    data = {}
+    for name, fields in roots.items():
+        relation, argument, _ = ROOT[name]
+        keys = sorted({field.arguments[argument] for field in fields})
+        rows = fetch(relation, keys, selected_columns(relation, [field.selections for field in fields]), {}, cost)
+        for group in groups[name].values():
+            group_keys = {field.arguments[argument] for field in group}
+            group_rows = [row for row in rows if row[relation.key] in group_keys]
+            loaded = dict(zip([row[relation.key] for row in group_rows],
+                              build_outputs(relation, group_rows, group[0].selections, cost)))
+            for field in group:
+                data[field.alias] = loaded.get(field.arguments[argument])
+    return {field.alias: data[field.alias] for field in selections}
+
+# end of code I wrote
@@ -0,0 +1,110 @@
+# I wrote this code
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set while a request or task must read and write on the primary database
+_use_primary = ContextVar('use_primary', default=False)
+
+# Shard database pinned for the partitioned models while a query runs on it
+_shard = ContextVar('shard', default=None)
+
+# Models partitioned on the shard databases by the organism of their protein,
+# the other models stay on the primary and are copied to every shard (see `sharding.py`)
+SHARDED_MODELS = {'proteinmap.protein', 'proteinmap.sequence', 'proteinmap.domain'}
+
+
+@contextmanager
+def use_primary():
+    """Context manager routing all reads inside it to the primary database."""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+@contextmanager
+def use_shard(alias):
+    """Context manager routing the partitioned models to the shard database `alias` (None routes as usual)."""
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+def shard_for(taxa):
+    """Alias of the shard database of the proteins of the organism `taxa`, None when sharding is disabled."""
+    if not settings.DATABASE_SHARDS:
+        return None
+    return settings.DATABASE_SHARDS[int(taxa) % len(settings.DATABASE_SHARDS)]
+
+def is_sharded(model):
+    """Returns True when the rows of `model` are partitioned on the shard databases."""
+    return bool(settings.DATABASE_SHARDS) and model._meta.label_lower in SHARDED_MODELS
+
+def instance_shard(instance):
+    """Shard database of an instance: the one it was read from, or else the one of the organism of its protein."""
+    if instance._state.db in settings.DATABASE_SHARDS:
+        return instance._state.db
+    if instance._meta.label_lower == 'proteinmap.protein':
+        return shard_for(instance.organism_id) if instance.organism_id is not None else None
+    if instance._meta.label_lower in SHARDED_MODELS and instance._meta.get_field('protein').is_cached(instance):
+        return instance_shard(instance.protein)
+    return None
+
+class ShardRouter:
+    """
+    Database router sending proteins, sequences and domains to the shard database of their organism,
+    set with the `PROTEINMAP_DB_SHARDS` environment variable. Other models are left to the next router.
+
+    Rational:
+        a query can not tell which organisms it reads, so queries run on the shard pinned with `use_shard()`,
+        which views select from the organism of the request or fan out to every shard (see `sharding.py`).
+        Instances are saved on the shard of their organism, and their relations are read from their shard.
+        Queries on a partitioned model outside `use_shard()` run on the primary, which has none of their rows.
+    """
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        return _shard.get() or (instance_shard(instance) if instance is not None else None)
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Shards hold the tables of proteinmap models, except jobs which only live on the primary."""
+        if db not in settings.DATABASE_SHARDS:
+            return None
+        return app_label == 'proteinmap' and model_name != 'job'
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending writes to the primary (`default`) database and reads to a random replica.
+
+    Rational:
+        related objects are read from the database of the instance they come from,
+        so a freshly written instance is never read back from a replica that is lagging behind.
+    """
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if _use_primary.get() or not settings.DATABASE_REPLICAS:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations between any of the primary and replica databases, since they hold the same data."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only migrate the primary, replicas receive the schema by replication."""
+        return db == 'default'
+
+# end of code I wrote
@@ -3,8 +3,35 @@
 from rest_framework import serializers
 
 from django.conf import settings
-from .models import *
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from .cooccurrence import record_protein
+from .jobs import JOBS
+from .metrics import measure_serializer
+from .models import Domain, Job, Organism, Pfam, Protein, Sequence
+from .routers import shard_for, use_shard
+from .sharding import find
+from .writes import serialized_writes
+
+
+class MeasuredListSerializer(serializers.ListSerializer):
+    """
+    List serializer recording the time spent producing `data` on the request metrics.
+    """
+    @property
+    def data(self):
+        with measure_serializer():
+            return super().data
 
+class MeasuredModelSerializer(serializers.ModelSerializer):
+    """
+    Model serializer recording the time spent producing `data` on the request metrics.
+    Used by serializers returned by the API views, nested serializers are measured by their parent.
+    """
+    @property
+    def data(self):
+        with measure_serializer():
+            return super().data
 
 class OrganismSerializer(serializers.ModelSerializer):
     """
@@ -21,7 +48,7 @@ class OrganismSerializer(serializers.ModelSerializer):
         model = Organism
         fields = ['taxa_id', 'clade', 'genus', 'species']
 
-class PfamSerializer(serializers.ModelSerializer):
+class PfamSerializer(MeasuredModelSerializer):
     """
     Serializer for `Pfam` used by the pfam endpoint.
     Exposes two properties with different names on source model.
@@ -44,7 +71,7 @@ class DomainSerializer(serializers.ModelSerializer):
         model = Domain
         fields = ['pfam_id', 'description', 'start', 'stop']
 
-class DomainListSerializer(serializers.ModelSerializer):
+class DomainListSerializer(MeasuredModelSerializer):
     """
     Serializer for `Domain` used by the organism pfams endpoint.
     Exposes `pfam_id` as an object named `pfam` on source model.
@@ -54,8 +81,9 @@ class DomainListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Domain
         fields = ['id', 'pfam_id']
+        list_serializer_class = MeasuredListSerializer
 
-class ProteinSerializer(serializers.ModelSerializer):
+class ProteinSerializer(MeasuredModelSerializer):
     """
     Serializer for `Protein` used by protein endpoints.
     Exposes `sequence` and `domains` as reverse relations using `related_name`.
@@ -68,6 +96,8 @@ class ProteinSerializer(serializers.ModelSerializer):
     class Meta:
         model = Protein
         fields = ['protein_id', 'sequence', 'taxonomy', 'length', 'domains']
+        # Uniqueness is checked on every shard by `validate_protein_id()`
+        extra_kwargs = {'protein_id': {'validators': []}}
 
     def create(self, validated_data):
         """
@@ -76,23 +106,47 @@ class ProteinSerializer(serializers.ModelSerializer):
 
         Rational:
             Remove related objects from data payload, then save `Sequence` and `Domains` fixing relations.
+            Everything is saved in one transaction, with all pfams read by one query and all domains
+            inserted by one bulk insert, so the number of queries does not depend on the number of domains.
+            Unknown organism or pfams are validation errors, returned as 400 responses.
+            The protein, sequence and domains are saved on the shard of the organism,
+            one writer at a time when writes are serialized (see `writes.py`).
         """
         sequence = validated_data.pop('sequence')
         domains = validated_data.pop('domains')
         taxa_id = validated_data.pop('organism')['taxa_id']
+        shard = shard_for(taxa_id)
 
-        organism = Organism.objects.get(pk=taxa_id)
-        protein = Protein.objects.create(organism=organism, **validated_data)
+        with serialized_writes(shard or DEFAULT_DB_ALIAS), use_shard(shard), transaction.atomic(using=shard):
+            organism = Organism.objects.filter(pk=taxa_id).first()
+            if organism is None:
+                raise serializers.ValidationError({'taxonomy': {'taxa_id': ['Organism %s does not exist' % taxa_id]}})
 
-        if sequence is not None:
-            Sequence.objects.create(protein=protein, sequence=sequence)
+            pfams = Pfam.objects.in_bulk({domain['pfam']['pfam_id'] for domain in domains})
+            missing = sorted({domain['pfam']['pfam_id'] for domain in domains} - pfams.keys())
+            if missing:
+                raise serializers.ValidationError({'domains': ['Pfam %s does not exist' % p for p in missing]})
 
-        for domain in domains:
-            pfam = Pfam.objects.get(pk=domain.pop('pfam')['pfam_id'])
-            Domain.objects.create(protein=protein, pfam=pfam, **domain)
+            protein = Protein.objects.create(organism=organism, **validated_data)
 
+            if sequence is not None:
+                Sequence.objects.create(protein=protein, sequence=sequence)
+
+            created = Domain.objects.bulk_create([
+                Domain(protein=protein, pfam=pfams[domain.pop('pfam')['pfam_id']], **domain) for domain in domains
+            ])
+            last = max((domain.pk for domain in created if domain.pk is not None), default=None)
+            transaction.on_commit(lambda: record_protein(organism.taxa_id, list(pfams), last), using=shard)
+
+        prefetch_related_objects([protein], Prefetch('domains', queryset=Domain.objects.select_related('pfam')))
         return protein
 
+    def validate_protein_id(self, value):
+        """Validate that no protein with `protein_id` exists, on any shard since the organism is not validated yet."""
+        if find(lambda alias: Protein.objects.filter(pk=value).exists() or None):
+            raise serializers.ValidationError('protein with this protein id already exists.', code='unique')
+        return value
+
     def validate_sequence(self, value):
         """Validate if `sequence` contains only allowed amino acid characters."""
         if not all(a in settings.AMINOACIDS for a in value):
@@ -112,12 +166,36 @@ class ProteinSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError('Domain stop must be greaten than start')
         return value
 
-class ProteinListSerializer(serializers.ModelSerializer):
+class ProteinListSerializer(MeasuredModelSerializer):
     """
     Serializer for `Protein` used by the organism proteins endpoint.
     """
     class Meta:
         model = Protein
         fields = ['protein_id']
+        list_serializer_class = MeasuredListSerializer
+
+class JobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for `Job` used by the jobs endpoints.
+    Only `kind` and `arguments` are posted, arguments are validated by the serializer of the job kind.
+    """
+    kind = serializers.ChoiceField(choices=sorted(JOBS))
+    arguments = serializers.JSONField(default=dict)
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'arguments', 'status', 'progress', 'message', 'result', 'error',
+                  'worker', 'created', 'started', 'finished', 'heartbeat']
+        read_only_fields = ['status', 'progress', 'message', 'result', 'error', 'worker', 'started', 'finished',
+                            'heartbeat']
+
+    def validate(self, data):
+        """Validate `arguments` with the serializer of the job kind, keeping their defaults."""
+        arguments = JOBS[data['kind']][1](data=data['arguments'])
+        if not arguments.is_valid():
+            raise serializers.ValidationError({'arguments': arguments.errors})
+        data['arguments'] = arguments.validated_data
+        return data
 
 # end of code I wrote
\ No newline at end of file
@@ -0,0 +1,287 @@
+# I wrote this code
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import copy_context
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import Max
+
+from .models import Domain, Organism, Pfam, Protein, Sequence, Taxon
+from .routers import is_sharded, shard_for, use_shard
+from .streaming import chunks
+
+# Models kept on the primary and copied to every shard, so the queries of a shard can join them
+REFERENCE_MODELS = [Organism, Pfam, Taxon]
+
+# Partitioned models, with the lookup of the organism of their rows
+PARTITIONED_MODELS = [(Protein, 'organism_id'), (Sequence, 'protein__organism_id'), (Domain, 'protein__organism_id')]
+
+# Domain ids allocated by shard N start at (N + 1) times this, so ids are unique across shards,
+# ids below it are kept for the domains partitioned from the primary
+SHARD_ID_RANGE = 10 ** 8
+
+# Rows copied per insert by `sync_reference_tables()`
+SYNC_BATCH_SIZE = 10000
+
+# Items produced ahead by each shard of `merge()` while the consumer is busy
+MERGE_BUFFER = 2
+
+# Seconds between two checks of a stopped `merge()` by a producer waiting on a full buffer
+MERGE_POLL_INTERVAL = 0.1
+
+
+def shards():
+    """Aliases of the shard databases, or `[None]` (routed as usual) when sharding is disabled."""
+    return settings.DATABASE_SHARDS or [None]
+
+def model_shards(model):
+    """Shards holding the rows of `model`: every shard for a partitioned model, else `[None]` (routed as usual)."""
+    return shards() if is_sharded(model) else [None]
+
+def in_transaction(aliases):
+    """Returns True when the calling thread is in a transaction on one of the `aliases`."""
+    return any(connections[alias or DEFAULT_DB_ALIAS].in_atomic_block for alias in aliases)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Returns the thread pool of the fanned out queries, shared by the whole process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.SHARD_WORKERS, thread_name_prefix='proteinmap-shard')
+    return _executor
+
+def call_on_shard(function, alias):
+    """Call `function(alias)` with the shard `alias` pinned."""
+    with use_shard(alias):
+        return function(alias)
+
+def run_on_shard(function, alias):
+    """
+    Call `function(alias)` on a thread of the pool, whose connections are closed afterwards like after a request,
+    unless persistent (`CONN_MAX_AGE`).
+    """
+    close_old_connections()
+    try:
+        return call_on_shard(function, alias)
+    finally:
+        close_old_connections()
+
+def submit(function, alias):
+    # Each call runs in a copy of the context of the caller, so `use_primary()` applies to it too
+    return get_executor().submit(copy_context().run, run_on_shard, function, alias)
+
+def fan_out(function, aliases=None):
+    """
+    Call `function(alias)` on every shard (or on the `aliases`) with the shard pinned, returns the results in order.
+
+    Rational:
+        each shard is queried on a thread of the pool and has its own connection, so a fanned out query
+        takes about as long as the slowest shard instead of the sum of all of them.
+        A single shard, or a caller in a transaction, runs inline, since a thread would not see uncommitted rows.
+    """
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1 or in_transaction(aliases):
+        return [call_on_shard(function, alias) for alias in aliases]
+    return [future.result() for future in [submit(function, alias) for alias in aliases]]
+
+async def afan_out(function, aliases=None):
+    """Same as `fan_out()` for async views, `function` is still synchronous."""
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1:
+        return [await sync_to_async(call_on_shard)(function, aliases[0])]
+    return await asyncio.gather(*[asyncio.wrap_future(submit(function, alias)) for alias in aliases])
+
+def find(function, aliases=None):
+    """
+    Fan out `function(alias)`, returns the first result which is not None, or None.
+    Used to find rows without their organism, such as a protein by its id, which live on a single shard.
+    """
+    return next((result for result in fan_out(function, aliases) if result is not None), None)
+
+async def afind(function, aliases=None):
+    """Same as `find()` for async views."""
+    return next((result for result in await afan_out(function, aliases) if result is not None), None)
+
+def gather(queryset, aliases=None):
+    """
+    Rows of `queryset` on every shard (or on the `aliases`) as a list, or the queryset pinned with `using()`
+    when a single shard is queried, so it stays lazy.
+    """
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1:
+        return queryset.using(aliases[0])
+    return [row for rows in fan_out(lambda alias: list(queryset.all()), aliases) for row in rows]
+
+def merge(function, aliases=None):
+    """
+    Generator of the items of the iterables `function(alias)` of every shard, produced concurrently by
+    one thread per shard and yielded as soon as they arrive, so items of different shards are interleaved.
+
+    Rational:
+        streamed responses read shards for as long as the client reads the response, so producers have their
+        own threads instead of holding the pool. Each one is at most `MERGE_BUFFER` items ahead of the consumer,
+        and stops once the consumer stops, so memory stays bounded and an interrupted response frees its threads.
+        `function` must select its shard with `using(alias)`, since a shard can not be pinned across `yield`.
+    """
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1 or in_transaction(aliases):
+        for alias in aliases:
+            yield from function(alias)
+        return
+
+    items = queue.Queue(MERGE_BUFFER * len(aliases))
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=MERGE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(alias):
+        error = iterable = None
+        try:
+            iterable = function(alias)
+            for item in iterable:
+                if not put((None, item)):
+                    return
+        except Exception as exception:
+            error = exception
+        finally:
+            # Closes the cursor of an interrupted generator before the connection
+            if hasattr(iterable, 'close'):
+                iterable.close()
+            close_old_connections()
+        put((error, StopIteration))
+
+    for alias in aliases:
+        threading.Thread(target=copy_context().run, args=(produce, alias), daemon=True).start()
+    try:
+        running = len(aliases)
+        while running:
+            error, item = items.get()
+            if error is not None:
+                raise error
+            if item is StopIteration:
+                running -= 1
+            else:
+                yield item
+    finally:
+        stopped.set()
+
+def insert_sql(model):
+    """Returns the columns and the `INSERT` statement of the rows of `model`, for `executemany()`."""
+    quote = connections[DEFAULT_DB_ALIAS].ops.quote_name
+    fields = model._meta.concrete_fields
+    return [f.attname for f in fields], 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(model._meta.db_table), ', '.join(quote(f.column) for f in fields), ', '.join(['%s'] * len(fields))
+    )
+
+def shard_cursors(stack):
+    """Returns a cursor on every shard, each in a transaction ending with `stack`."""
+    cursors = {}
+    for alias in settings.DATABASE_SHARDS:
+        stack.enter_context(transaction.atomic(using=alias))
+        cursors[alias] = stack.enter_context(connections[alias].cursor())
+    return cursors
+
+def sync_reference_tables(models=None):
+    """
+    Copy the organisms, pfams and taxonomy (or the given `models`) of the primary into every shard,
+    in one transaction per shard. Writes through the models are copied by signals, this copies bulk loads.
+
+    Rational:
+        rows are read once with a streaming cursor and each batch is inserted into every shard
+        with `executemany()`, so memory is bounded by the batch size whatever the size of the taxonomy.
+    Returns the number of rows copied per table.
+    """
+    counts = {}
+    if not settings.DATABASE_SHARDS:
+        return counts
+    with ExitStack() as stack:
+        cursors = shard_cursors(stack)
+        for model in REFERENCE_MODELS if models is None else models:
+            columns, insert = insert_sql(model)
+            for cursor in cursors.values():
+                cursor.execute('DELETE FROM %s' % connections[DEFAULT_DB_ALIAS].ops.quote_name(model._meta.db_table))
+
+            rows = model.objects.using(DEFAULT_DB_ALIAS).values_list(*columns)
+            counts[model._meta.model_name] = 0
+            for batch in chunks(rows.iterator(SYNC_BATCH_SIZE), SYNC_BATCH_SIZE):
+                for cursor in cursors.values():
+                    cursor.executemany(insert, batch)
+                counts[model._meta.model_name] += len(batch)
+    return counts
+
+def partition_tables():
+    """
+    Copy the proteins, sequences and domains of the primary into the shard of their organism,
+    to shard a database which was not, in one transaction per shard. The primary keeps its rows, which are unused.
+    Returns the number of rows copied per table.
+    """
+    counts = {}
+    if not settings.DATABASE_SHARDS:
+        return counts
+    with ExitStack() as stack:
+        cursors = shard_cursors(stack)
+        for model, organism in PARTITIONED_MODELS:
+            columns, insert = insert_sql(model)
+            rows = model.objects.using(DEFAULT_DB_ALIAS).values_list(organism, *columns)
+            counts[model._meta.model_name] = 0
+            for batch in chunks(rows.iterator(SYNC_BATCH_SIZE), SYNC_BATCH_SIZE):
+                shard_rows = defaultdict(list)
+                for row in batch:
+                    shard_rows[shard_for(row[0])].append(row[1:])
+                for alias, values in shard_rows.items():
+                    cursors[alias].executemany(insert, values)
+                counts[model._meta.model_name] += len(batch)
+    return counts
+
+def reserve_id_ranges():
+    """
+    Start the domain ids allocated by each shard at its own range, unless it already reached it,
+    so domains of different shards never share an id. Returns the start of the range of each shard.
+    """
+    starts = {}
+    for index, alias in enumerate(settings.DATABASE_SHARDS):
+        starts[alias] = start = (index + 1) * SHARD_ID_RANGE
+        if (Domain.objects.using(alias).aggregate(Max('id'))['id__max'] or 0) >= start:
+            continue
+        table = Domain._meta.db_table
+        with connections[alias].cursor() as cursor:
+            if connections[alias].vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            else:
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, start])
+    return starts
+
+def copy_reference(instance):
+    """Save a copy of a reference instance of the primary on every shard, without sending signals."""
+    model = type(instance)
+    fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+    for alias in settings.DATABASE_SHARDS:
+        instance_copy = model(**{f.attname: getattr(instance, f.attname) for f in model._meta.concrete_fields})
+        model.objects.using(alias).bulk_create(
+            [instance_copy], update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields
+        )
+
+def delete_reference(instance):
+    """Delete a reference instance on every shard, with the proteins or domains cascading from it."""
+    for alias in settings.DATABASE_SHARDS:
+        type(instance).objects.using(alias).filter(pk=instance.pk).delete()
+
+# end of code I wrote
@@ -0,0 +1,97 @@
+# I wrote this code
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .compression import bump_data_version, bump_versions
+from .metrics import record_sql
+from .models import Domain, Organism, Pfam, Protein, Sequence, Taxon
+from .sharding import REFERENCE_MODELS, copy_reference, delete_reference
+from .taxonomy import with_ancestors
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Apply the `SQLITE_PRAGMAS` setting to every new SQLite connection.
+
+    Rational:
+        replicas are only read, so they skip table locks on a shared cache,
+        which is how a replica mirrors the in-memory primary during tests.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        if connection.alias in settings.DATABASE_REPLICAS:
+            cursor.execute('PRAGMA read_uncommitted = 1')
+
+@receiver(connection_created)
+def install_sql_metrics(sender, connection, **kwargs):
+    """
+    Install the execute wrapper measuring queries on every new connection.
+
+    Rational:
+        it is installed once per connection instead of per request with `connection.execute_wrapper()`,
+        so queries of streamed responses and of async views running on other threads are measured too.
+    """
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+def protein_entities(protein_id, using, organism_id=None, pfam_ids=()):
+    """
+    Entities read by the cached responses which include a protein: the protein, the pfams of its domains
+    (whose co-occurring pfams it counts) and its organism with the taxa above it.
+    """
+    if organism_id is None:
+        organism_id = Protein.objects.using(using).filter(pk=protein_id).values_list('organism_id', flat=True).first()
+    pfam_ids = set(pfam_ids)
+    pfam_ids.update(Domain.objects.using(using).filter(protein_id=protein_id).values_list('pfam_id', flat=True))
+    taxa_ids = with_ancestors([organism_id], using) if organism_id is not None else ()
+    return [('protein', protein_id)] + [('pfam', p) for p in pfam_ids] + [('taxa', t) for t in taxa_ids]
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_responses(sender, instance, using, **kwargs):
+    """
+    Invalidate the cached responses reading a protein, domain or sequence whenever it is saved or deleted,
+    by replacing the versions of the entities of its protein. Organisms, pfams and taxonomy nodes are embedded
+    in many responses, their changes replace the version of all the data.
+
+    Rational:
+        versions are replaced right away and again once the transaction commits,
+        so a response cached by a concurrent request before the commit is not kept.
+    """
+    if sender in (Organism, Pfam, Taxon):
+        bump_data_version()
+        transaction.on_commit(bump_data_version, using=using)
+    elif sender in (Domain, Protein, Sequence):
+        if sender is Protein:
+            entities = protein_entities(instance.pk, using, organism_id=instance.organism_id)
+        else:
+            entities = protein_entities(instance.protein_id, using,
+                                        pfam_ids=[instance.pfam_id] if sender is Domain else ())
+        bump_versions(entities)
+        transaction.on_commit(lambda: bump_versions(entities), using=using)
+
+@receiver(post_save)
+def copy_reference_to_shards(sender, instance, using, raw=False, **kwargs):
+    """
+    Copy organisms, pfams and taxonomy nodes saved on the primary into every shard, once committed,
+    so the shards can join them with their proteins and domains.
+    """
+    if settings.DATABASE_SHARDS and sender in REFERENCE_MODELS and using == DEFAULT_DB_ALIAS and not raw:
+        transaction.on_commit(lambda: copy_reference(instance), using=using)
+
+@receiver(post_delete)
+def delete_reference_on_shards(sender, instance, using, **kwargs):
+    """Delete organisms, pfams and taxonomy nodes deleted on the primary from every shard, once committed."""
+    if settings.DATABASE_SHARDS and sender in REFERENCE_MODELS and using == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: delete_reference(instance), using=using)
+
+# end of code I wrote
@@ -0,0 +1,389 @@
+# I wrote this code
+
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .models import Domain, Organism, Pfam, Protein, Taxon
+from .sharding import shards
+from .streaming import chunks
+
+# Number of rows read per database round trip while exporting
+EXPORT_CHUNK_SIZE = 100000
+
+# NumPy is imported by the functions using it, so workers serving without a snapshot never load it
+
+
+def load_blob(path):
+    """Memory-map a raw byte file, an empty file can not be mapped so it becomes an empty array."""
+    import numpy as np
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+class StringColumnWriter:
+    """
+    Writes a column of strings to a raw byte file, recording the `(start, end)` offsets of each value.
+    Missing values (`None`) are recorded with a start of -1.
+    """
+    def __init__(self, path, name):
+        self.path = os.path.join(path, name)
+        self.file = open(self.path + '.bin', 'wb')
+        self.size = 0
+        self.bounds = []
+
+    def write(self, values):
+        import numpy as np
+        bounds = np.empty((len(values), 2), dtype=np.int64)
+        for i, value in enumerate(values):
+            if value is None:
+                bounds[i] = (-1, -1)
+                continue
+            data = value.encode()
+            self.file.write(data)
+            bounds[i] = (self.size, self.size + len(data))
+            self.size += len(data)
+        self.bounds.append(bounds)
+
+    def close(self, order=None):
+        """Save the offsets, permuted by `order` when the rows were written in a different order."""
+        import numpy as np
+        self.file.close()
+        bounds = np.concatenate(self.bounds) if self.bounds else np.zeros((0, 2), dtype=np.int64)
+        np.save(self.path + '.npy', bounds if order is None else bounds[order])
+
+class StringColumn:
+    """
+    Memory-mapped column of strings, only the requested value is copied out of the page cache.
+    """
+    def __init__(self, path, name):
+        import numpy as np
+        self.bounds = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        self.data = load_blob(os.path.join(path, name + '.bin'))
+
+    def __getitem__(self, index):
+        start, end = self.bounds[index]
+        if start < 0:
+            return None
+        return self.data[start:end].tobytes().decode()
+
+def write_columns(path, name, rows, columns, dtypes):
+    """
+    Export `rows` of a `values_list` query chunk by chunk, strings go to string columns and numbers to arrays.
+    Returns the numeric arrays, string columns are left open so they can be saved in their final order.
+    """
+    import numpy as np
+    strings = {c: StringColumnWriter(path, '%s_%s' % (name, c)) for c, dtype in zip(columns, dtypes) if dtype is str}
+    numbers = {c: [] for c, dtype in zip(columns, dtypes) if dtype is not str}
+
+    for chunk in chunks(rows, EXPORT_CHUNK_SIZE):
+        for i, column in enumerate(columns):
+            values = [row[i] for row in chunk]
+            if column in strings:
+                strings[column].write(values)
+            else:
+                numbers[column].append(np.array(values, dtype=dtypes[i]))
+
+    arrays = {
+        c: np.concatenate(v) if v else np.zeros(0, dtype=dtypes[columns.index(c)])
+        for c, v in numbers.items()
+    }
+    return arrays, strings
+
+def csr_offsets(groups, size):
+    """Offsets of each group on an array sorted by the `groups` indices, group `i` spans `[offsets[i], offsets[i+1])`."""
+    import numpy as np
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=size), out=offsets[1:])
+    return offsets
+
+def each_shard(queryset):
+    """Rows of `queryset` on every shard, one shard after the other, read with a streaming cursor."""
+    for alias in shards():
+        yield from queryset.using(alias).iterator(EXPORT_CHUNK_SIZE)
+
+def write_snapshot(path):
+    """
+    Export organisms, pfams, proteins, sequences and domains into a columnar snapshot directory on `path`.
+
+    Rational:
+        every table is read once with a streaming iterator and saved as NumPy arrays sorted by key,
+        so lookups are binary searches, and relations are index arrays with CSR-style offsets.
+        The snapshot is built on a temporary directory and swapped in place,
+        so readers never see a partially written snapshot.
+    """
+    import numpy as np
+    path = os.path.abspath(path)
+    build = '%s.build-%s' % (path, uuid.uuid4().hex)
+    os.makedirs(build)
+
+    # Organisms sorted by `taxa_id`
+    organisms, organism_strings = write_columns(
+        build, 'organism',
+        Organism.objects.values_list('taxa_id', 'clade', 'genus', 'species').iterator(EXPORT_CHUNK_SIZE),
+        ['taxa_id', 'clade', 'genus', 'species'], [np.int64, str, str, str]
+    )
+    organism_order = np.argsort(organisms['taxa_id'], kind='stable')
+    taxa_ids = organisms['taxa_id'][organism_order]
+    np.save(os.path.join(build, 'organism_taxa_ids.npy'), taxa_ids)
+    for column in organism_strings.values():
+        column.close(organism_order)
+
+    # Intervals of the higher rank taxa sorted by `taxa_id`, and organisms of the taxonomy sorted by `lft`
+    nodes, _ = write_columns(
+        build, 'taxon', Taxon.objects.values_list('taxa_id', 'lft', 'rgt').iterator(EXPORT_CHUNK_SIZE),
+        ['taxa_id', 'lft', 'rgt'], [np.int64, np.int64, np.int64]
+    )
+    higher = np.flatnonzero(nodes['rgt'] > nodes['lft'] + 1)
+    higher = higher[np.argsort(nodes['taxa_id'][higher], kind='stable')]
+    np.save(os.path.join(build, 'taxon_keys.npy'), nodes['taxa_id'][higher])
+    np.save(os.path.join(build, 'taxon_intervals.npy'), np.stack([nodes['lft'][higher], nodes['rgt'][higher]], axis=1))
+    node_order = np.argsort(nodes['taxa_id'], kind='stable')
+    node_keys = nodes['taxa_id'][node_order]
+    in_taxonomy = np.flatnonzero(np.isin(taxa_ids, node_keys))
+    organism_lfts = nodes['lft'][node_order][np.searchsorted(node_keys, taxa_ids[in_taxonomy])]
+    lft_order = np.argsort(organism_lfts, kind='stable')
+    np.save(os.path.join(build, 'organism_lfts.npy'), organism_lfts[lft_order])
+    np.save(os.path.join(build, 'organism_by_lft.npy'), in_taxonomy[lft_order])
+
+    # Pfams sorted by `pfam_id`
+    pfams, pfam_strings = write_columns(
+        build, 'pfam',
+        Pfam.objects.values_list('pfam_id', 'pfam_id', 'description').iterator(EXPORT_CHUNK_SIZE),
+        ['key', 'pfam_id', 'description'], ['S20', str, str]
+    )
+    pfam_order = np.argsort(pfams['key'], kind='stable')
+    pfam_ids = pfams['key'][pfam_order]
+    np.save(os.path.join(build, 'pfam_keys.npy'), pfam_ids)
+    for column in pfam_strings.values():
+        column.close(pfam_order)
+
+    # Proteins sorted by `protein_id`, with their organism index and sequence
+    proteins, protein_strings = write_columns(
+        build, 'protein',
+        each_shard(Protein.objects.values_list('protein_id', 'protein_id', 'length', 'organism_id',
+                                               'sequence__sequence')),
+        ['key', 'protein_id', 'length', 'organism', 'sequence'], ['S12', str, np.int64, np.int64, str]
+    )
+    protein_order = np.argsort(proteins['key'], kind='stable')
+    protein_ids = proteins['key'][protein_order]
+    protein_organisms = np.searchsorted(taxa_ids, proteins['organism'][protein_order])
+    np.save(os.path.join(build, 'protein_keys.npy'), protein_ids)
+    np.save(os.path.join(build, 'protein_lengths.npy'), proteins['length'][protein_order])
+    np.save(os.path.join(build, 'protein_organisms.npy'), protein_organisms)
+    for column in protein_strings.values():
+        column.close(protein_order)
+
+    # Domains sorted by protein then `id`, with offsets of the domains of each protein
+    domains, domain_strings = write_columns(
+        build, 'domain',
+        each_shard(Domain.objects.values_list('id', 'protein_id', 'pfam_id', 'start', 'stop', 'description')),
+        ['id', 'protein', 'pfam', 'start', 'stop', 'description'], [np.int64, 'S12', 'S20', np.int64, np.int64, str]
+    )
+    domain_proteins = np.searchsorted(protein_ids, domains['protein'])
+    domain_order = np.lexsort((domains['id'], domain_proteins))
+    domain_proteins = domain_proteins[domain_order]
+    np.save(os.path.join(build, 'domain_ids.npy'), domains['id'][domain_order])
+    np.save(os.path.join(build, 'domain_pfams.npy'), np.searchsorted(pfam_ids, domains['pfam'][domain_order]))
+    np.save(os.path.join(build, 'domain_starts.npy'), domains['start'][domain_order])
+    np.save(os.path.join(build, 'domain_stops.npy'), domains['stop'][domain_order])
+    np.save(os.path.join(build, 'protein_domain_offsets.npy'), csr_offsets(domain_proteins, len(protein_ids)))
+    for column in domain_strings.values():
+        column.close(domain_order)
+
+    # Proteins and domains of each organism, in `protein_id` and domain `id` order
+    np.save(os.path.join(build, 'organism_proteins.npy'), np.argsort(protein_organisms, kind='stable'))
+    np.save(os.path.join(build, 'organism_protein_offsets.npy'), csr_offsets(protein_organisms, len(taxa_ids)))
+    domain_organisms = protein_organisms[domain_proteins]
+    np.save(os.path.join(build, 'organism_domains.npy'),
+            np.lexsort((domains['id'][domain_order], domain_organisms)))
+    np.save(os.path.join(build, 'organism_domain_offsets.npy'), csr_offsets(domain_organisms, len(taxa_ids)))
+
+    manifest = {
+        'generation': uuid.uuid4().hex,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'organisms': len(taxa_ids),
+        'pfams': len(pfam_ids),
+        'proteins': len(protein_ids),
+        'domains': len(domain_proteins),
+    }
+    with open(os.path.join(build, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    # Swap the new snapshot in, mapped files of the old one stay valid for the processes still reading them
+    if os.path.exists(path):
+        old = '%s.old-%s' % (path, uuid.uuid4().hex)
+        os.rename(path, old)
+        os.rename(build, path)
+        shutil.rmtree(old)
+    else:
+        os.rename(build, path)
+    return manifest
+
+class Snapshot:
+    """
+    Read-only, memory-mapped snapshot of the whole dataset written by `write_snapshot()`.
+    Methods return the same data as the serializers of the matching API views.
+    """
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        manifest = os.path.join(path, 'manifest.json')
+        self.mtime = os.stat(manifest).st_mtime_ns
+        with open(manifest) as manifest_file:
+            self.manifest = json.load(manifest_file)
+
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        self.taxa_ids = load('organism_taxa_ids')
+        self.organism_clades = StringColumn(path, 'organism_clade')
+        self.organism_genera = StringColumn(path, 'organism_genus')
+        self.organism_species = StringColumn(path, 'organism_species')
+        self.organism_proteins = load('organism_proteins')
+        self.organism_protein_offsets = load('organism_protein_offsets')
+        self.organism_domains = load('organism_domains')
+        self.organism_domain_offsets = load('organism_domain_offsets')
+        self.organism_lfts = load('organism_lfts')
+        self.organism_by_lft = load('organism_by_lft')
+        self.taxon_keys = load('taxon_keys')
+        self.taxon_intervals = load('taxon_intervals')
+
+        self.pfam_keys = load('pfam_keys')
+        self.pfam_ids = StringColumn(path, 'pfam_pfam_id')
+        self.pfam_descriptions = StringColumn(path, 'pfam_description')
+
+        self.protein_keys = load('protein_keys')
+        self.protein_ids = StringColumn(path, 'protein_protein_id')
+        self.protein_lengths = load('protein_lengths')
+        self.protein_organisms = load('protein_organisms')
+        self.protein_sequences = StringColumn(path, 'protein_sequence')
+        self.protein_domain_offsets = load('protein_domain_offsets')
+
+        self.domain_ids = load('domain_ids')
+        self.domain_pfams = load('domain_pfams')
+        self.domain_starts = load('domain_starts')
+        self.domain_stops = load('domain_stops')
+        self.domain_descriptions = StringColumn(path, 'domain_description')
+
+    @staticmethod
+    def find(keys, value):
+        """Binary search of `value` on the sorted `keys` array, returns its index or None if missing."""
+        import numpy as np
+        index = int(np.searchsorted(keys, value))
+        if index < len(keys) and keys[index] == value:
+            return index
+        return None
+
+    def find_organism(self, taxa):
+        try:
+            return self.find(self.taxa_ids, int(taxa))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def organism_indices(self, taxa):
+        """
+        Indexes of the organism `taxa`, or of all the organisms below it when it is a higher rank of the taxonomy,
+        like `organism_filter()`: the organisms whose node `lft` is inside its interval, in `taxa_id` order.
+        """
+        import numpy as np
+        try:
+            taxon = self.find(self.taxon_keys, int(taxa))
+        except (TypeError, ValueError, OverflowError):
+            return []
+        if taxon is None:
+            index = self.find_organism(taxa)
+            return [] if index is None else [index]
+        lft, rgt = self.taxon_intervals[taxon]
+        start, stop = np.searchsorted(self.organism_lfts, lft), np.searchsorted(self.organism_lfts, rgt, side='right')
+        return np.sort(self.organism_by_lft[start:stop])
+
+    def organism_rows(self, rows, offsets, taxa):
+        """Rows of the organism `taxa`, or of the organisms below it, from the CSR `rows` and `offsets` arrays."""
+        for index in self.organism_indices(taxa):
+            start, stop = offsets[index:index + 2]
+            yield from rows[start:stop]
+
+    def pfam_data(self, index):
+        return {'domain_id': self.pfam_ids[index], 'domain_description': self.pfam_descriptions[index]}
+
+    def organism_data(self, index):
+        return {
+            'taxa_id': int(self.taxa_ids[index]),
+            'clade': self.organism_clades[index],
+            'genus': self.organism_genera[index],
+            'species': self.organism_species[index],
+        }
+
+    def pfam(self, pfam_id):
+        index = self.find(self.pfam_keys, str(pfam_id).encode())
+        return None if index is None else self.pfam_data(index)
+
+    def protein(self, protein_id):
+        index = self.find(self.protein_keys, str(protein_id).encode())
+        if index is None:
+            return None
+
+        start, stop = self.protein_domain_offsets[index:index + 2]
+        return {
+            'protein_id': self.protein_ids[index],
+            'sequence': self.protein_sequences[index],
+            'taxonomy': self.organism_data(self.protein_organisms[index]),
+            'length': int(self.protein_lengths[index]),
+            'domains': [{
+                'pfam_id': self.pfam_data(self.domain_pfams[d]),
+                'description': self.domain_descriptions[d],
+                'start': int(self.domain_starts[d]),
+                'stop': int(self.domain_stops[d]),
+            } for d in range(start, stop)],
+        }
+
+    def coverage(self, protein_id):
+        """Domain coverage of a protein, None when the protein is missing or has no domains."""
+        index = self.find(self.protein_keys, str(protein_id).encode())
+        if index is None:
+            return None
+
+        start, stop = self.protein_domain_offsets[index:index + 2]
+        if start == stop:
+            return None
+        covered = self.domain_stops[start:stop].sum() - self.domain_starts[start:stop].sum()
+        return int(covered) / int(self.protein_lengths[index])
+
+    def organism_protein_list(self, taxa):
+        proteins = self.organism_rows(self.organism_proteins, self.organism_protein_offsets, taxa)
+        return [{'protein_id': self.protein_ids[p]} for p in proteins]
+
+    def organism_pfam_list(self, taxa):
+        domains = self.organism_rows(self.organism_domains, self.organism_domain_offsets, taxa)
+        return [{'id': int(self.domain_ids[d]), 'pfam_id': self.pfam_data(self.domain_pfams[d])} for d in domains]
+
+_snapshot = None
+
+def get_snapshot():
+    """
+    Returns the snapshot on the `SNAPSHOT_DIR` setting, shared by the whole process, or None when not available.
+
+    Rational:
+        arrays are memory-mapped, so every worker shares the same pages through the OS page cache.
+        The manifest is checked on each call, so a new export is picked up without restarting workers.
+    """
+    global _snapshot
+    if not settings.SNAPSHOT_DIR:
+        return None
+
+    try:
+        mtime = os.stat(os.path.join(settings.SNAPSHOT_DIR, 'manifest.json')).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    snapshot = _snapshot
+    if snapshot is None or snapshot.path != settings.SNAPSHOT_DIR or snapshot.mtime != mtime:
+        snapshot = _snapshot = Snapshot(settings.SNAPSHOT_DIR)
+    return snapshot
+
+# end of code I wrote
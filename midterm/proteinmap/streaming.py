@@ -0,0 +1,65 @@
+# I wrote this code
+
+import os
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+
+# Bytes read per chunk when streaming a file under ASGI
+FILE_BLOCK_SIZE = 1024 * 1024
+
+
+def chunks(rows, size):
+    """Split an iterator of rows into lists of at most `size` rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def iterate_async(iterator):
+    """
+    Asynchronous generator over a synchronous `iterator`, advancing it one chunk at a time on the database thread.
+
+    Rational:
+        under ASGI Django consumes synchronous iterators into memory before sending them,
+        so each chunk is fetched with `sync_to_async` instead to keep memory bounded.
+    """
+    sentinel = object()
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(iterator, sentinel)
+        if chunk is sentinel:
+            return
+        yield chunk
+
+def streaming_response(request, iterator, content_type, filename=None):
+    """Stream the chunks of `iterator`, adapting it to the server interface handling `request`."""
+    if isinstance(request, ASGIRequest):
+        iterator = iterate_async(iterator)
+
+    response = StreamingHttpResponse(iterator, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+def read_blocks(path):
+    with open(path, 'rb') as file:
+        yield from iter(lambda: file.read(FILE_BLOCK_SIZE), b'')
+
+def file_response(request, path, content_type, filename):
+    """
+    Send a file as an attachment, using the WSGI file wrapper (`sendfile`) when available
+    and streaming it in blocks under ASGI.
+    """
+    if isinstance(request, ASGIRequest):
+        response = streaming_response(request, read_blocks(path), content_type, filename)
+        response['Content-Length'] = os.path.getsize(path)
+        return response
+    return FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+
+# end of code I wrote
@@ -0,0 +1,191 @@
+# I wrote this code
+
+import gzip
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .compression import bump_data_version
+from .models import Organism, Taxon
+from .routers import shard_for
+from .sharding import shards, sync_reference_tables
+from .streaming import chunks
+
+# Field separator and line terminator of the NCBI taxonomy dump files
+DMP_SEPARATOR = '\t|\t'
+DMP_TERMINATOR = '\t|'
+
+# Name class of the names kept from `names.dmp`
+SCIENTIFIC_NAME = 'scientific name'
+
+
+def open_dmp(path):
+    """Open a taxonomy dump file for reading as text, gzip compressed files end with `.gz`."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path)
+
+def read_dmp(lines):
+    """Generator of the fields of each line of a `nodes.dmp` or `names.dmp` file."""
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.endswith(DMP_TERMINATOR):
+            line = line[:-len(DMP_TERMINATOR)]
+        if line:
+            yield line.split(DMP_SEPARATOR)
+
+def read_nodes(lines):
+    """Returns the parent and the rank of every node of a `nodes.dmp` file, as `taxa: (parent, rank)`."""
+    return {int(fields[0]): (int(fields[1]), fields[2]) for fields in read_dmp(lines)}
+
+def read_names(lines, nodes):
+    """Returns the scientific name of the `nodes` from a `names.dmp` file."""
+    names = {}
+    for fields in read_dmp(lines):
+        if fields[3] == SCIENTIFIC_NAME:
+            taxa = int(fields[0])
+            if taxa in nodes:
+                names[taxa] = fields[1]
+    return names
+
+def prune(nodes, taxa_ids):
+    """Keep only the nodes of `taxa_ids` and their ancestors."""
+    kept = {}
+    for taxa in taxa_ids:
+        while taxa in nodes and taxa not in kept:
+            kept[taxa] = nodes[taxa]
+            taxa = nodes[taxa][0]
+    return kept
+
+def nested_set(nodes):
+    """
+    Number the nodes of a tree depth first, returns `taxa: (lft, rgt)`.
+
+    Rational:
+        each node gets `lft` when first visited and `rgt` once all its descendants are numbered,
+        so the interval of a node contains exactly the intervals of its descendants.
+        The tree is walked with an explicit stack, since real taxonomies are deeper than the recursion limit
+        allows, and children are visited by taxa id so reloading the same file gives the same intervals.
+        A node whose parent is itself (the NCBI root) or missing is a root, nodes on a cycle are skipped.
+    """
+    children = defaultdict(list)
+    roots = []
+    for taxa in sorted(nodes):
+        parent = nodes[taxa][0]
+        if parent == taxa or parent not in nodes:
+            roots.append(taxa)
+        else:
+            children[parent].append(taxa)
+
+    intervals = {}
+    counter = 1
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            taxa, visited = stack.pop()
+            if visited:
+                intervals[taxa] = (intervals[taxa], counter)
+            else:
+                intervals[taxa] = counter
+                stack.append((taxa, True))
+                stack.extend((child, False) for child in reversed(children.get(taxa, ())))
+            counter += 1
+    return intervals
+
+def load_taxonomy(nodes_path, names_path, pruned=False, batch_size=10000):
+    """
+    Replace the taxonomy with the nodes of `nodes_path` named from `names_path`, in one transaction.
+    With `pruned`, only the organisms of the database and their ancestors are kept.
+
+    Rational:
+        a full NCBI taxonomy has millions of nodes, so rows are inserted with `executemany()` instead of
+        `bulk_create()`, which builds a model instance per node and splits its inserts to a few hundred rows
+        on SQLite (6 times slower), and the previous nodes are deleted with SQL, since `QuerySet.delete()`
+        loads every node to send `post_delete`. The taxonomy is then copied into every shard.
+    Returns the number of loaded nodes and of organisms found in the taxonomy.
+    """
+    with open_dmp(nodes_path) as nodes_file:
+        nodes = read_nodes(nodes_file)
+    if pruned:
+        nodes = prune(nodes, Organism.objects.values_list('taxa_id', flat=True).iterator())
+    with open_dmp(names_path) as names_file:
+        names = read_names(names_file, nodes)
+
+    intervals = nested_set(nodes)
+    taxa = sorted(intervals, key=lambda t: intervals[t][0])
+    quote = connection.ops.quote_name
+    columns = [Taxon._meta.get_field(name).column for name in ('taxa_id', 'parent', 'name', 'rank', 'lft', 'rgt')]
+    insert = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote(Taxon._meta.db_table), ', '.join(quote(c) for c in columns), ', '.join(['%s'] * len(columns))
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % quote(Taxon._meta.db_table))
+        for batch in chunks(taxa, batch_size):
+            cursor.executemany(insert, [(
+                t, nodes[t][0] if nodes[t][0] != t and nodes[t][0] in intervals else None,
+                names.get(t, ''), nodes[t][1], intervals[t][0], intervals[t][1],
+            ) for t in batch])
+    sync_reference_tables([Taxon])
+    bump_data_version()
+    return {'nodes': len(taxa), 'organisms': Organism.objects.filter(taxa_id__in=Taxon.objects.values('pk')).count()}
+
+def is_organism(interval):
+    """Returns True for the interval of a leaf, or of a taxon missing from the taxonomy (None)."""
+    return interval is None or interval[1] == interval[0] + 1
+
+def descendants_filter(taxa, interval, field):
+    if is_organism(interval):
+        return Q(**{field: taxa})
+    return Q(**{field + '__in': Taxon.objects.filter(lft__range=interval).values('taxa_id')})
+
+def organism_filter(taxa, field='organism'):
+    """
+    Filter on the organism `taxa`, and on all the organisms below it when it is a higher rank of the taxonomy.
+
+    Rational:
+        the organisms below a taxon are the nodes of its interval, selected with one range predicate
+        on the `lft` index in a subquery, instead of walking the tree level by level.
+        Leaves, and taxa missing from the taxonomy, keep the equality filter on the organism.
+    """
+    return descendants_filter(taxa, Taxon.objects.filter(pk=taxa).values_list('lft', 'rgt').first(), field)
+
+async def aorganism_filter(taxa, field='organism'):
+    """Same as `organism_filter()` for async views."""
+    return descendants_filter(taxa, await Taxon.objects.filter(pk=taxa).values_list('lft', 'rgt').afirst(), field)
+
+def taxa_shards(taxa):
+    """
+    Shards holding the proteins of the organism `taxa`, or of all the organisms below it for a higher rank,
+    which are spread over every shard.
+    """
+    if len(shards()) == 1:
+        return [shard_for(taxa)]
+    if is_organism(Taxon.objects.filter(pk=taxa).values_list('lft', 'rgt').first()):
+        return [shard_for(taxa)]
+    return shards()
+
+def with_ancestors(taxa_ids, using=None):
+    """
+    The organisms `taxa_ids` and all the taxa above them, whose listings include their proteins,
+    read from the database `using` when given (the taxonomy is copied to every shard).
+    The ancestors of a node are the intervals containing its own.
+    """
+    taxa_ids = set(taxa_ids)
+    taxa = Taxon.objects.using(using) if using is not None else Taxon.objects.all()
+    ancestors = Q()
+    for lft, rgt in taxa.filter(pk__in=taxa_ids).values_list('lft', 'rgt'):
+        ancestors |= Q(lft__lt=lft, rgt__gt=rgt)
+    if ancestors:
+        taxa_ids.update(taxa.filter(ancestors).values_list('taxa_id', flat=True))
+    return taxa_ids
+
+async def ataxa_shards(taxa):
+    """Same as `taxa_shards()` for async views."""
+    if len(shards()) == 1:
+        return [shard_for(taxa)]
+    if is_organism(await Taxon.objects.filter(pk=taxa).values_list('lft', 'rgt').afirst()):
+        return [shard_for(taxa)]
+    return shards()
+
+# end of code I wrote
@@ -1,16 +1,56 @@
 # I wrote this code
 
+import asyncio
+import csv
+import gzip
+import io
 import json
-from django.test import TestCase
-from django.urls import reverse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import JsonResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+import factory
+import pyarrow as pa
+import pyarrow.parquet as pq
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from .model_factories import *
-from .serializers import *
+from benchmarks import compare, load, run, startup, synthetic
+
+from . import (async_api, coalescing, compression, cooccurrence, features, jobs, query, sharding, taxonomy,
+               throttling)
+from .fasta import format_fasta, load_sequences, parse_protein_id, read_fasta
+from .middleware import CompressionMiddleware
+from .metrics import REQUEST_DURATION, SERIALIZER_DURATION, SQL_QUERIES
+from .model_factories import (DomainFactory, OrganismFactory, PfamFactory, ProteinFactory, ProteinSerializerFactory,
+                              SequenceFactory)
+from .models import Domain, Job, Organism, Pfam, Protein, Sequence, Taxon
+from .routers import PrimaryReplicaRouter, shard_for, use_primary
+from .snapshot import write_snapshot
+from .serializers import DomainSerializer, OrganismSerializer, PfamSerializer, ProteinSerializer
+from .writes import serialized_writes
 
 
 class OrganismSerializerTest(TestCase):
+    databases = '__all__'
     organism = None
     serializer = None
 
@@ -31,6 +71,7 @@ class OrganismSerializerTest(TestCase):
         self.assertEqual(data['genus'], self.organism.genus)
 
 class PfamSerializerTest(TestCase):
+    databases = '__all__'
     pfam = None
     serializer = None
 
@@ -51,6 +92,7 @@ class PfamSerializerTest(TestCase):
         self.assertEqual(data['domain_description'], self.pfam.description)
 
 class DomainSerializerTest(TestCase):
+    databases = '__all__'
     domain = None
     pfam = None
     serializer = None
@@ -77,6 +119,7 @@ class DomainSerializerTest(TestCase):
         self.assertEqual(data['pfam_id']['domain_id'], 'A')
 
 class ProteinSerializerRetrieveTest(TestCase):
+    databases = '__all__'
     protein = None
     sequence = None
     domain = None
@@ -117,6 +160,7 @@ class ProteinSerializerRetrieveTest(TestCase):
         self.assertEqual(data['domains'][0]['pfam_id']['domain_id'], self.domain.pfam.pfam_id)
 
 class ProteinSerializerValidateTest(TestCase):
+    databases = '__all__'
     def test_proteinSerializerValidData(self):
         data = ProteinSerializerFactory.build()
         serializer = ProteinSerializer(data=data)
@@ -145,6 +189,7 @@ class ProteinSerializerValidateTest(TestCase):
         self.assertIn('domains', serializer.errors)
 
 class ProteinSerializerCreateTest(TestCase):
+    databases = '__all__'
     data = None
 
     def setUp(self):
@@ -184,6 +229,7 @@ class ProteinSerializerCreateTest(TestCase):
         self.assertListEqual([protein.protein_id] * 3, [d.protein.protein_id for d in domain])
 
 class ProteinCreateAPITest(APITestCase):
+    databases = '__all__'
     url = reverse('protein_create_api')
 
     def tearDown(self):
@@ -208,7 +254,43 @@ class ProteinCreateAPITest(APITestCase):
         response = self.client.post(self.url, data, format='json')
         self.assertContains(response, '', status_code=status.HTTP_400_BAD_REQUEST)
 
+    def payload(self, domains):
+        organism = Organism.objects.first() or OrganismFactory.create()
+        pfams = PfamFactory.create_batch(domains)
+        data = dict(ProteinSerializerFactory.build(), taxonomy={'taxa_id': organism.taxa_id})
+        data['domains'] = [{
+            'description': 'Domain', 'start': 1, 'stop': 10,
+            'pfam_id': {'domain_id': pfam.pfam_id, 'domain_description': pfam.description}
+        } for pfam in pfams]
+        return data
+
+    def test_proteinCreateReturnBadRequestWithUnknownPfam(self):
+        data = self.payload(2)
+        data['domains'][1]['pfam_id']['domain_id'] = 'PF_UNKNOWN'
+        response = self.client.post(self.url, data, format='json')
+        self.assertContains(response, 'PF_UNKNOWN', status_code=status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Protein.objects.exists())
+
+    def test_proteinCreateReturnBadRequestWithUnknownOrganism(self):
+        data = self.payload(1)
+        data['taxonomy'] = {'taxa_id': 0}
+        response = self.client.post(self.url, data, format='json')
+        self.assertContains(response, 'taxa_id', status_code=status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Protein.objects.exists())
+
+    def test_proteinCreateQueriesDoNotDependOnDomains(self):
+        queries = []
+        for domains in (1, 10):
+            data = self.payload(domains)
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.post(self.url, data, format='json')
+            self.assertEqual(len(response.data['domains']), domains)
+            queries.append(len(captured))
+            Protein.objects.all().delete()
+        self.assertEqual(queries[0], queries[1])
+
 class ProteinDetailApiTest(APITestCase):
+    databases = '__all__'
     protein = None
     sequence = None
     url = None
@@ -247,6 +329,7 @@ class ProteinDetailApiTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 class PfamDetailApiTest(APITestCase):
+    databases = '__all__'
     pfam = None
     url = None
 
@@ -274,6 +357,7 @@ class PfamDetailApiTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 class OrganismProteinsApiTest(APITestCase):
+    databases = '__all__'
     proteins = None
     url = None
 
@@ -301,13 +385,14 @@ class OrganismProteinsApiTest(APITestCase):
         self.assertContains(response, '[]', 1, status.HTTP_200_OK)
 
 class OrganismPfamsApiTest(APITestCase):
+    databases = '__all__'
     pfams = None
     url = None
 
     def setUp(self):
         organism = OrganismFactory.create()
         proteins = ProteinFactory.create_batch(3, organism=organism)
-        domains = DomainFactory.create_batch(3, protein=factory.Sequence(lambda n: proteins[(n-1) % 3]))
+        domains = DomainFactory.create_batch(3, protein=factory.Iterator(proteins))
         self.pfams = [d.pfam for d in domains]
         self.url = reverse('organism_pfams_api', kwargs={'taxa': organism.taxa_id})
 
@@ -332,6 +417,7 @@ class OrganismPfamsApiTest(APITestCase):
         self.assertContains(response, '[]', 1, status.HTTP_200_OK)
 
 class DomainCoverageApiTest(APITestCase):
+    databases = '__all__'
     def tearDown(self):
         Domain.objects.all().delete()
         Protein.objects.all().delete()
@@ -359,4 +445,1353 @@ class DomainCoverageApiTest(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+class AsyncReadApiTest(TestCase):
+    databases = '__all__'
+    protein = None
+    sequence = None
+    domain = None
+    factory = AsyncRequestFactory()
+
+    def setUp(self):
+        self.protein = ProteinFactory.create(length=4)
+        self.sequence = SequenceFactory.create(protein=self.protein)
+        self.domain = DomainFactory.create(protein=self.protein, start=1, stop=3)
+
+    def tearDown(self):
+        Domain.objects.all().delete()
+        Organism.objects.all().delete()
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    async def read_stream(self, response):
+        return json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+
+    async def test_asyncProteinDetailReturnCorrectContent(self):
+        request = self.factory.get('/')
+        response = await async_api.ProteinDetail.as_view()(request, pk=self.protein.protein_id)
+        data = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['sequence'], self.sequence.sequence)
+        self.assertEqual(data['taxonomy']['taxa_id'], self.protein.organism.taxa_id)
+        self.assertEqual(data['domains'][0]['pfam_id']['domain_id'], self.domain.pfam.pfam_id)
+
+    async def test_asyncProteinDetailReturnNotFoundOnBadPk(self):
+        request = self.factory.get('/')
+        response = await async_api.ProteinDetail.as_view()(request, pk='x')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_asyncPfamDetailReturnCorrectContent(self):
+        request = self.factory.get('/')
+        response = await async_api.PfamDetail.as_view()(request, pk=self.domain.pfam.pfam_id)
+        data = json.loads(response.content)
+        self.assertEqual(data['domain_id'], self.domain.pfam.pfam_id)
+        self.assertEqual(data['domain_description'], self.domain.pfam.description)
+
+    async def test_asyncOrganismProteinsStreamsContent(self):
+        request = self.factory.get('/')
+        response = await async_api.OrganismProteins.as_view()(request, taxa=self.protein.organism.taxa_id)
+        self.assertListEqual(await self.read_stream(response), [{'protein_id': self.protein.protein_id}])
+
+    async def test_asyncOrganismPfamsStreamsContent(self):
+        request = self.factory.get('/')
+        response = await async_api.OrganismPfams.as_view()(request, taxa=self.protein.organism.taxa_id)
+        data = await self.read_stream(response)
+        self.assertEqual(data[0]['id'], self.domain.id)
+        self.assertEqual(data[0]['pfam_id']['domain_description'], self.domain.pfam.description)
+
+    async def test_asyncOrganismPfamsReturnEmptyOnBadTaxa(self):
+        request = self.factory.get('/')
+        response = await async_api.OrganismPfams.as_view()(request, taxa=0)
+        self.assertListEqual(await self.read_stream(response), [])
+
+    async def test_asyncDomainCoverage(self):
+        request = self.factory.get('/')
+        response = await async_api.domain_coverage(request, protein_id=self.protein.protein_id)
+        self.assertEqual(json.loads(response.content), 0.5)
+
+    async def test_asyncDomainCoverageReturnNotFoundOnBadProtein(self):
+        request = self.factory.get('/')
+        response = await async_api.domain_coverage(request, protein_id=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class PrimaryReplicaRouterTest(TestCase):
+    databases = '__all__'
+    router = PrimaryReplicaRouter()
+
+    def test_routerSendsWritesToPrimary(self):
+        self.assertEqual(self.router.db_for_write(Protein), 'default')
+
+    def test_routerSendsReadsToReplica(self):
+        self.assertEqual(self.router.db_for_read(Protein), 'replica0')
+
+    def test_routerReadsRelationsFromInstanceDatabase(self):
+        protein = ProteinFactory.create()
+        self.assertEqual(self.router.db_for_read(Domain, instance=protein), 'default')
+
+    def test_routerSendsReadsToPrimaryWhenRequired(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Protein), 'default')
+
+    def test_routerOnlyMigratesPrimary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'proteinmap'))
+        self.assertFalse(self.router.allow_migrate('replica0', 'proteinmap'))
+
+class SqlitePragmasTest(TestCase):
+    databases = '__all__'
+    def test_sqlitePragmasAreApplied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+class SnapshotApiTest(APITestCase):
+    databases = '__all__'
+    protein = None
+    domains = None
+    path = None
+
+    def setUp(self):
+        organism = OrganismFactory.create()
+        # Ids sort in insertion order, which is the order of unordered database listings
+        self.protein = ProteinFactory.create(protein_id='SNAPSHOT1', organism=organism, length=10)
+        SequenceFactory.create(protein=self.protein)
+        ProteinFactory.create(protein_id='SNAPSHOT2', organism=organism)
+        self.domains = DomainFactory.create_batch(2, protein=self.protein, start=2, stop=5)
+        self.path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+        Domain.objects.all().delete()
+        Organism.objects.all().delete()
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def assertSameResponse(self, url):
+        """Assert that the response is the same when served from the database and from the snapshot."""
+        expected = self.client.get(url, format='json')
+        write_snapshot(self.path)
+        with self.settings(SNAPSHOT_DIR=self.path):
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+
+    def test_snapshotProteinDetail(self):
+        self.assertSameResponse(reverse('protein_detail_api', kwargs={'pk': self.protein.protein_id}))
+
+    def test_snapshotProteinDetailWithoutSequence(self):
+        protein = Protein.objects.exclude(pk=self.protein.pk).get()
+        self.assertSameResponse(reverse('protein_detail_api', kwargs={'pk': protein.protein_id}))
+
+    def test_snapshotProteinDetailReturnNotFoundOnBadPk(self):
+        self.assertSameResponse(reverse('protein_detail_api', kwargs={'pk': 'x'}))
+
+    def test_snapshotPfamDetail(self):
+        self.assertSameResponse(reverse('pfam_detail_api', kwargs={'pk': self.domains[0].pfam.pfam_id}))
+
+    def test_snapshotOrganismProteins(self):
+        self.assertSameResponse(reverse('organism_proteins_api', kwargs={'taxa': self.protein.organism.taxa_id}))
+
+    def test_snapshotOrganismPfams(self):
+        self.assertSameResponse(reverse('organism_pfams_api', kwargs={'taxa': self.protein.organism.taxa_id}))
+
+    def test_snapshotOrganismPfamsReturnEmptyOnBadTaxa(self):
+        self.assertSameResponse(reverse('organism_pfams_api', kwargs={'taxa': 0}))
+
+    def test_snapshotDomainCoverage(self):
+        self.assertSameResponse(reverse('domain_coverage_api', kwargs={'protein_id': self.protein.protein_id}))
+
+    def test_snapshotDomainCoverageReturnNotFoundOnBadProtein(self):
+        self.assertSameResponse(reverse('domain_coverage_api', kwargs={'protein_id': 0}))
+
+class ExportApiTest(APITestCase):
+    databases = '__all__'
+    proteins = None
+    url = reverse('export_api', kwargs={'kind': 'proteins'})
+
+    def setUp(self):
+        organism = OrganismFactory.create()
+        self.proteins = ProteinFactory.create_batch(3, organism=organism)
+        ProteinFactory.create(organism=OrganismFactory.create(taxa_id=organism.taxa_id + 1))
+
+    def tearDown(self):
+        Organism.objects.all().delete()
+        Protein.objects.all().delete()
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def test_exportCsv(self):
+        rows = list(csv.reader(io.StringIO(self.export(self.url, format='csv').decode())))
+        self.assertListEqual(rows[0], ['protein_id', 'length', 'taxa_id', 'sequence'])
+        self.assertEqual(len(rows), 5)
+
+    def test_exportParquetFilteredByTaxa(self):
+        taxa = self.proteins[0].organism.taxa_id
+        table = pq.read_table(io.BytesIO(self.export(self.url, format='parquet', taxa=taxa)))
+        self.assertListEqual(table.column('protein_id').to_pylist(), [p.protein_id for p in self.proteins])
+        self.assertListEqual(table.column('taxa_id').to_pylist(), [taxa] * 3)
+
+    def test_exportArrowStream(self):
+        url = reverse('export_api', kwargs={'kind': 'organisms'})
+        table = pa.ipc.open_stream(self.export(url, format='arrow')).read_all()
+        self.assertEqual(table.num_rows, 2)
+        self.assertListEqual(table.schema.names, ['taxa_id', 'clade', 'genus', 'species'])
+
+    def test_exportReturnBadRequestOnBadFormat(self):
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_exportReturnNotFoundOnBadKind(self):
+        response = self.client.get(reverse('export_api', kwargs={'kind': 'sequences'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_exportIsCachedWithSnapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        write_snapshot(path)
+        with self.settings(SNAPSHOT_DIR=path):
+            first = self.export(self.url, format='csv')
+            Protein.objects.all().delete()
+            self.assertEqual(self.export(self.url, format='csv'), first)
+        shutil.rmtree(os.path.dirname(path))
+
+    def test_exportOfSnapshotIsReadFromIt(self):
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        expected = {kind: self.export(reverse('export_api', kwargs={'kind': kind}), format='csv')
+                    for kind in ('proteins', 'organisms')}
+        DomainFactory.create(protein=self.proteins[0])
+        write_snapshot(path)
+        # Written after the snapshot, so missing from its exports like from its other endpoints
+        ProteinFactory.create(organism=self.proteins[0].organism)
+        with self.settings(SNAPSHOT_DIR=path):
+            self.assertEqual(self.export(self.url, format='csv'), expected['proteins'])
+            self.assertEqual(self.export(reverse('export_api', kwargs={'kind': 'organisms'}), format='csv'),
+                             expected['organisms'])
+            domains = list(csv.reader(io.StringIO(self.export(
+                reverse('export_api', kwargs={'kind': 'domains'}), format='csv', taxa=self.proteins[0].organism_id
+            ).decode())))
+            self.assertEqual(domains[1][1:3], [self.proteins[0].protein_id, str(Domain.objects.get().pfam_id)])
+            table = pq.read_table(io.BytesIO(self.export(self.url, format='parquet', taxa=self.proteins[0].organism_id)))
+            self.assertListEqual(table.column('protein_id').to_pylist(), [p.protein_id for p in self.proteins])
+        Domain.objects.all().delete()
+        Pfam.objects.all().delete()
+        shutil.rmtree(os.path.dirname(path))
+
+class FastaTest(TestCase):
+    databases = '__all__'
+
+    def tearDown(self):
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+
+    def test_readFastaJoinsSequenceLines(self):
+        lines = ['>A first\n', 'ACD\n', 'EF\n', '\n', '>B\n', 'GH\n']
+        self.assertListEqual(list(read_fasta(lines)), [('A first', 'ACDEF'), ('B', 'GH')])
+
+    def test_parseProteinIdFromUniprotHeader(self):
+        self.assertEqual(parse_protein_id('sp|P12345|NAME_HUMAN Some protein'), 'P12345')
+        self.assertEqual(parse_protein_id('A0A016S8J7 Ancylostoma'), 'A0A016S8J7')
+
+    def test_formatFastaWrapsSequence(self):
+        self.assertEqual(format_fasta('A', 'C' * 70), '>A\n' + 'C' * 60 + '\n' + 'C' * 10 + '\n')
+
+    def test_loadFastaCommandSavesSequences(self):
+        organism = OrganismFactory.create()
+        proteins = [ProteinFactory.create(organism=organism, length=4), ProteinFactory.create(organism=organism, length=2)]
+        SequenceFactory.create(protein=proteins[1], sequence='AA')
+        path = os.path.join(tempfile.mkdtemp(), 'sequences.fasta')
+        with open(path, 'w') as fasta_file:
+            fasta_file.write(format_fasta(proteins[0].protein_id, 'ACDE'))
+            fasta_file.write(format_fasta('sp|%s|NAME' % proteins[1].protein_id, 'WY'))
+            fasta_file.write(format_fasta('unknown', 'K'))
+
+        call_command('load_fasta', path, '--update', '--batch-size', 2, stdout=io.StringIO())
+        shutil.rmtree(os.path.dirname(path))
+
+        self.assertEqual(Sequence.objects.get(pk=proteins[0].pk).sequence, 'ACDE')
+        self.assertEqual(Sequence.objects.get(pk=proteins[1].pk).sequence, 'WY')
+        self.assertEqual(Sequence.objects.count(), 2)
+
+    def test_loadSequencesSkipsInvalidAndDuplicateRecords(self):
+        organism = OrganismFactory.create()
+        proteins = [ProteinFactory.create(organism=organism, length=4) for _ in range(4)]
+        records = [
+            (proteins[0].protein_id, 'ACDE'),
+            (proteins[0].protein_id, 'WWWW'),
+            (proteins[1].protein_id, 'acde'),
+            (proteins[2].protein_id, 'AXU*'),
+            (proteins[3].protein_id, 'ACDEF'),
+            ('unknown', 'K'),
+        ]
+        counts = load_sequences(records)
+        self.assertEqual(counts, {'created': 1, 'updated': 0, 'skipped': 1, 'invalid': 3, 'duplicates': 1})
+        self.assertEqual(list(Sequence.objects.values_list('protein_id', 'sequence')), [(proteins[0].pk, 'ACDE')])
+
+class OrganismSequencesApiTest(APITestCase):
+    databases = '__all__'
+
+    def tearDown(self):
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+
+    def test_organismSequencesStreamsFasta(self):
+        organism = OrganismFactory.create()
+        sequences = [SequenceFactory.create(protein=p) for p in ProteinFactory.create_batch(2, organism=organism)]
+        url = reverse('organism_sequences_api', kwargs={'taxa': organism.taxa_id})
+
+        response = self.client.get(url)
+        records = list(read_fasta(b''.join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(response['Content-Type'], 'text/x-fasta')
+        self.assertListEqual(
+            records,
+            [('%s OX=%d' % (s.protein_id, organism.taxa_id), s.sequence) for s in sequences]
+        )
+
+class PerformanceMiddlewareTest(APITestCase):
+    databases = '__all__'
+    protein = None
+
+    def setUp(self):
+        self.protein = ProteinFactory.create()
+        DomainFactory.create_batch(3, protein=self.protein)
+
+    def tearDown(self):
+        Domain.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def series(self, histogram, view):
+        counts, total = histogram.series.get(view, ([0], 0))
+        return counts[-1], total
+
+    def test_middlewareRecordsRequestMetrics(self):
+        requests, _ = self.series(REQUEST_DURATION, 'protein_detail_api')
+        queries, query_total = self.series(SQL_QUERIES, 'protein_detail_api')
+        _, serializer_time = self.series(SERIALIZER_DURATION, 'protein_detail_api')
+
+        self.client.get(reverse('protein_detail_api', kwargs={'pk': self.protein.protein_id}))
+
+        self.assertEqual(self.series(REQUEST_DURATION, 'protein_detail_api')[0], requests + 1)
+        self.assertGreater(self.series(SQL_QUERIES, 'protein_detail_api')[1], query_total)
+        self.assertGreater(self.series(SERIALIZER_DURATION, 'protein_detail_api')[1], serializer_time)
+
+    def test_metricsEndpointReturnsPrometheusText(self):
+        self.client.get(reverse('pfam_detail_api', kwargs={'pk': 'x'}))
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, '# TYPE proteinmap_request_duration_seconds histogram')
+        self.assertContains(response, 'proteinmap_sql_queries_count{view="pfam_detail_api"}')
+
+    def test_slowRequestIsLoggedWithQueries(self):
+        url = reverse('protein_detail_api', kwargs={'pk': self.protein.protein_id})
+        with self.settings(SLOW_REQUEST_SECONDS=0), self.assertLogs('proteinmap.performance') as logs:
+            self.client.get(url)
+        self.assertIn('protein_detail_api', logs.output[0])
+        self.assertIn('repeated query x3', logs.output[0])
+
+
+class SyntheticDatasetTest(TestCase):
+    databases = '__all__'
+
+    def test_generateInsertsConsistentDataset(self):
+        synthetic.generate(500, seed=1, batch_size=200)
+        organisms, pfams = synthetic.dataset_shape(500)
+
+        self.assertEqual(Organism.objects.count(), organisms)
+        self.assertEqual(Pfam.objects.count(), pfams)
+        self.assertEqual(Protein.objects.count(), 500)
+        self.assertEqual(Sequence.objects.count(), 500)
+        self.assertGreaterEqual(Domain.objects.count(), 500)
+
+        protein = Protein.objects.select_related('sequence').first()
+        self.assertEqual(len(protein.sequence.sequence), protein.length)
+        for domain in protein.domains.all():
+            self.assertTrue(1 <= domain.start <= domain.stop <= protein.length)
+
+    def test_generateIsReproducible(self):
+        synthetic.generate(50, seed=1)
+        first = list(Domain.objects.order_by('protein_id', 'start').values_list('protein_id', 'pfam_id', 'start'))
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+        synthetic.generate(50, seed=1)
+        second = list(Domain.objects.order_by('protein_id', 'start').values_list('protein_id', 'pfam_id', 'start'))
+        self.assertListEqual(first, second)
+
+
+class BenchmarkToolsTest(TestCase):
+    databases = '__all__'
+
+    def test_compareMarksRegressionsByDirection(self):
+        before = {'scenarios': {'detail': {'throughput': 100, 'p50_ms': 10, 'p99_ms': 20, 'peak_rss_mb': 50}}}
+        after = {'scenarios': {'detail': {'throughput': 80, 'p50_ms': 8, 'p99_ms': 30, 'peak_rss_mb': 51}}}
+        regressions = {measure: regression for _, measure, _, _, _, regression in compare.compare(before, after)}
+        self.assertEqual(regressions, {'throughput': True, 'p50_ms': False, 'p99_ms': True, 'peak_rss_mb': False})
+
+    def test_sampledKeysAreSpreadOverTheTable(self):
+        organism = OrganismFactory.create()
+        for i in range(100):
+            ProteinFactory.create(protein_id='K%03d' % i, organism=organism)
+        keys = run.sample_keys(Protein.objects.all(), 'protein_id', 10, random.Random(0))
+        self.assertEqual(len(set(keys)), 10)
+        self.assertGreater(max(keys), 'K050')
+        self.assertEqual(keys, run.sample_keys(Protein.objects.all(), 'protein_id', 10, random.Random(0)))
+
+class AdminTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.protein = ProteinFactory.create()
+        self.sequence = SequenceFactory.create(protein=self.protein, sequence='A' * 500)
+        DomainFactory.create_batch(2, protein=self.protein)
+        PfamFactory.create_batch(20)
+
+    def test_sequenceListShowsPreview(self):
+        response = self.client.get(reverse('admin:proteinmap_sequence_changelist'))
+        self.assertContains(response, 'A' * 50 + '…')
+        self.assertNotContains(response, 'A' * 51)
+        self.assertContains(response, '500')
+
+    def test_proteinChangeDoesNotListPfams(self):
+        response = self.client.get(reverse('admin:proteinmap_protein_change', args=[self.protein.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only the selected organism and pfams are rendered, the others are searched on demand
+        self.assertEqual(response.content.count(b'<option'), 3)
+
+    def test_listCountIsBounded(self):
+        # Reads are kept on the primary, where queries are captured, when replicas are set
+        with self.settings(DEBUG=True), use_primary(), CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:proteinmap_pfam_changelist'))
+        counts = [q['sql'] for q in queries.captured_queries if 'COUNT(' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT', counts[0])
+
+
+class JobsApiTest(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.protein = ProteinFactory.create(length=4)
+        with open(os.path.join(self.directory, 'sequences.fasta'), 'w') as fasta_file:
+            fasta_file.write(format_fasta(self.protein.protein_id, 'ACDE') + format_fasta('UNKNOWN', 'ACDE'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Job.objects.all().delete()
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+
+    def submit(self, kind, arguments):
+        with self.settings(JOB_DATA_DIR=self.directory):
+            return self.client.post(reverse('job_create_api'), {'kind': kind, 'arguments': arguments}, format='json')
+
+    def test_submitJobIsPending(self):
+        response = self.submit('load_fasta', {'path': 'sequences.fasta'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Job.PENDING)
+        self.assertEqual(response.data['arguments'], {'path': 'sequences.fasta', 'batch_size': 5000, 'update': False})
+
+    def test_submitInvalidJobReturnBadRequest(self):
+        self.assertEqual(self.submit('unknown', {}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.submit('load_fasta', {'path': '../etc/passwd'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.submit('export_snapshot', {}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_claimIsExclusive(self):
+        self.submit('load_fasta', {'path': 'sequences.fasta'})
+        job = jobs.claim('first')
+        self.assertEqual((job.status, job.worker), (Job.RUNNING, 'first'))
+        self.assertIsNone(jobs.claim('second'))
+
+    def test_workerRunsJobAndReportsProgress(self):
+        job_id = self.submit('load_fasta', {'path': 'sequences.fasta'}).data['id']
+        with self.settings(JOB_DATA_DIR=self.directory):
+            call_command('run_workers', processes=1, burst=True)
+
+        response = self.client.get(reverse('job_detail_api', kwargs={'pk': job_id}))
+        self.assertEqual(response.data['status'], Job.DONE)
+        self.assertEqual(response.data['progress'], 1)
+        self.assertEqual(response.data['result'],
+                         {'created': 1, 'updated': 0, 'skipped': 1, 'invalid': 0, 'duplicates': 0})
+        self.assertEqual(Sequence.objects.get(pk=self.protein.pk).sequence, 'ACDE')
+
+    def test_failedJobSavesError(self):
+        job_id = self.submit('load_fasta', {'path': 'sequences.fasta'}).data['id']
+        os.remove(os.path.join(self.directory, 'sequences.fasta'))
+        with self.settings(JOB_DATA_DIR=self.directory):
+            call_command('run_workers', processes=1, burst=True)
+
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('File not found', job.error)
+
+    def test_expiredLeaseIsFailedByNextClaim(self):
+        self.submit('load_fasta', {'path': 'sequences.fasta'})
+        job = jobs.claim('first')
+        Job.objects.filter(pk=job.pk).update(heartbeat=timezone.now() - timedelta(seconds=settings.JOB_LEASE + 1))
+        self.assertIsNone(jobs.claim('second'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('heartbeats', job.error)
+
+    def test_interruptedJobIsFailed(self):
+        self.submit('load_fasta', {'path': 'sequences.fasta'})
+        job = jobs.claim(jobs.worker_name())
+        with mock.patch.dict(jobs.JOBS, load_fasta=(mock.Mock(side_effect=KeyboardInterrupt),
+                                                    jobs.LoadFastaArguments)):
+            with self.settings(JOB_DATA_DIR=self.directory), self.assertRaises(KeyboardInterrupt):
+                jobs.run(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('KeyboardInterrupt', job.error)
+
+    def test_jobsOfStoppedWorkersAreFailed(self):
+        self.submit('load_fasta', {'path': 'sequences.fasta'})
+        job = jobs.claim(jobs.worker_name(1234))
+        self.assertEqual(jobs.fail_workers([jobs.worker_name(1234)]), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class CompressionTest(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.protein = ProteinFactory.create()
+        SequenceFactory.create(protein=self.protein, sequence='ACDEFGHIKLMNPQRSTVWY' * 100)
+        DomainFactory.create_batch(3, protein=self.protein)
+        self.url = reverse('protein_detail_api', kwargs={'pk': self.protein.protein_id})
+
+    def tearDown(self):
+        Domain.objects.all().delete()
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def test_negotiatePrefersHighestQuality(self):
+        self.assertEqual(compression.negotiate('gzip'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=1.0, deflate;q=0.5'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=0, identity'), None)
+        self.assertEqual(compression.negotiate(''), None)
+        self.assertEqual(compression.negotiate('*'), list(compression.ENCODINGS)[0])
+
+    def test_responseIsCompressedWithAcceptedEncoding(self):
+        identity = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+        self.assertLess(len(response.content), len(identity.content) / 5)
+
+    @skipUnless(compression.brotli and compression.zstandard, 'brotli and zstandard are not installed')
+    def test_responseIsCompressedWithBrotliAndZstd(self):
+        identity = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), identity.content)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(compression.zstandard.ZstdDecompressor().decompressobj().decompress(response.content), identity.content)
+
+    def test_cachedResponseSkipsView(self):
+        self.assertEqual(self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_writeInvalidatesCachedResponses(self):
+        self.client.get(self.url)
+        self.protein.length = 12345
+        self.protein.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['length'], 12345)
+
+    def test_writeKeepsCachedResponsesOfOtherEntities(self):
+        other = ProteinFactory.create(organism=OrganismFactory.create(taxa_id=self.protein.organism_id + 1))
+        other_url = reverse('protein_detail_api', kwargs={'pk': other.protein_id})
+        organism_url = reverse('organism_proteins_api', kwargs={'taxa': self.protein.organism_id})
+        for url in (self.url, other_url, organism_url):
+            self.client.get(url)
+
+        # Saving a pfam would replace the version of all the data, the domain reuses one
+        DomainFactory.create(protein=self.protein, pfam=self.protein.domains.first().pfam)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(organism_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(other_url)['X-Cache'], 'HIT')
+
+    def test_writeInvalidatesResponsesCachedByOtherWorkers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+        with self.settings(CACHES=shared):
+            self.client.get(self.url)
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+            # The write is made by another worker, with its own instance of the cache backend
+            with mock.patch.object(compression, 'cache', caches.create_connection('default')):
+                self.protein.length = 12345
+                self.protein.save()
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['length'], 12345)
+
+    def test_streamedResponseIsCompressed(self):
+        url = reverse('organism_sequences_api', kwargs={'taxa': self.protein.organism_id})
+        identity = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), identity)
+
+class OpenApiSchemaTest(APITestCase):
+    databases = '__all__'
+    schema_file = os.path.join(settings.BASE_DIR, 'openapi-schema.yml')
+
+    def test_schemaServedFromFile(self):
+        with self.settings(OPENAPI_SCHEMA_FILE=self.schema_file):
+            response = self.client.get(reverse('openapi-schema'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.oai.openapi')
+        with open(self.schema_file, 'rb') as schema_file:
+            self.assertEqual(response.content, schema_file.read())
+
+    def test_schemaGeneratedWithoutFile(self):
+        with self.settings(OPENAPI_SCHEMA_FILE=None):
+            response = self.client.get(reverse('openapi-schema'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, '/api/jobs/{id}:')
+
+    def test_schemaFileIsUpToDate(self):
+        output = io.StringIO()
+        call_command('generateschema', title='Protein map', description='By Rodrigo Chin',
+                     api_version='0.1.0', stdout=output)
+        with open(self.schema_file) as schema_file:
+            self.assertEqual(output.getvalue(), schema_file.read())
+
+    def test_apiOnlySettingsServeRequests(self):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.startup', '--child', '--path', '/openapi', 'midterm.settings_api'],
+            cwd=startup.PROJECT_DIR
+        )
+        self.assertEqual(json.loads(output.decode().strip().splitlines()[-1])['status'], 200)
+
+class SequenceFeaturesTest(APITestCase):
+    databases = '__all__'
+    protein = None
+
+    def setUp(self):
+        self.protein = ProteinFactory.create()
+        self.sequence = SequenceFactory.create(protein=self.protein, sequence='MKTAYIAKQRQISFVKSHFSRQXLEERLGLIEVQ')
+
+    def tearDown(self):
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+
+    def test_featuresMatchPerResidueComputation(self):
+        sequence = self.sequence.sequence
+        known = [a for a in sequence if a in settings.AMINOACIDS]
+        row = features.protein_features(self.protein.protein_id, sequence, window=5)
+
+        self.assertEqual(row['length'], len(sequence))
+        self.assertAlmostEqual(row['molecular_weight'],
+                               sum(features.RESIDUE_MASSES[a] for a in known) + features.WATER_MASS, places=2)
+        self.assertAlmostEqual(row['gravy'], sum(features.HYDROPATHY[a] for a in known) / len(known), places=4)
+        self.assertAlmostEqual(row['composition']['K'], sequence.count('K') / len(sequence), places=4)
+        self.assertEqual(len(row['hydropathy']['values']), len(sequence) - 4)
+        self.assertAlmostEqual(row['hydropathy']['values'][0],
+                               sum(features.HYDROPATHY[a] for a in sequence[:5]) / 5, places=3)
+
+    def test_isoelectricPointFollowsCharges(self):
+        basic, acidic, empty = features.feature_rows(['basic', 'acidic', 'empty'], ['KKRKK', 'DDEDD', ''])
+        self.assertGreater(basic['isoelectric_point'], 10)
+        self.assertLess(acidic['isoelectric_point'], 4)
+        self.assertIsNone(empty['isoelectric_point'])
+
+    def test_proteinFeaturesEndpoint(self):
+        url = reverse('protein_features_api', kwargs={'pk': self.protein.protein_id})
+        response = self.client.get(url, {'window': 7})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['protein_id'], self.protein.protein_id)
+        self.assertEqual(response.data['hydropathy']['window'], 7)
+        self.assertEqual(self.client.get(url, {'window': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        missing = reverse('protein_features_api', kwargs={'pk': 'missing'})
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_organismFeaturesEndpoint(self):
+        other = SequenceFactory.create(protein=ProteinFactory.create(organism=self.protein.organism))
+        url = reverse('organism_features_api', kwargs={'taxa': self.protein.organism_id})
+
+        rows = json.loads(b''.join(self.client.get(url).streaming_content))
+        self.assertEqual(sorted(row['protein_id'] for row in rows), sorted([self.protein.protein_id, other.protein_id]))
+        self.assertNotIn('hydropathy', rows[0])
+
+        table = list(csv.reader(io.StringIO(b''.join(self.client.get(url, {'format': 'csv'}).streaming_content).decode())))
+        self.assertEqual(table[0], features.COLUMNS + list(settings.AMINOACIDS))
+        self.assertEqual(len(table), 3)
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+class CooccurrenceTest(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.organism = OrganismFactory.create(taxa_id=1)
+        other = OrganismFactory.create(taxa_id=2)
+        self.pfams = PfamFactory.create_batch(3)
+        a, b, c = self.pfams
+        for organism, pfams in ((self.organism, [a, b, a]), (self.organism, [a, b, c]), (other, [a, c])):
+            protein = ProteinFactory.create(organism=organism)
+            for pfam in pfams:
+                DomainFactory.create(protein=protein, pfam=pfam)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Domain.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def cooccurring(self, pfam, **params):
+        with self.settings(COOCCURRENCE_DIR=self.directory):
+            response = self.client.get(reverse('cooccurring_pfams_api', kwargs={'pk': pfam.pfam_id}), params)
+        return [(row['pfam_id']['domain_id'], row['proteins']) for row in response.data]
+
+    def ranked(self, *counts):
+        """Expected `(pfam_id, proteins)` pairs, by decreasing count then pfam id."""
+        return sorted(((pfam.pfam_id, proteins) for pfam, proteins in counts), key=lambda item: (-item[1], item[0]))
+
+    def test_matrixMatchesDatabase(self):
+        cooccurrence.build_matrix(self.directory)
+        matrix = cooccurrence.Cooccurrence(self.directory)
+        for pfam in self.pfams:
+            for taxa in (None, 1, 2, 3):
+                self.assertEqual(matrix.cooccurring(pfam.pfam_id, taxa), cooccurrence.database_cooccurring(pfam.pfam_id, taxa))
+
+    def test_cooccurringEndpoint(self):
+        a, b, c = self.pfams
+        expected = self.ranked((b, 2), (c, 2))
+        self.assertEqual(self.cooccurring(a), expected)
+        call_command('build_cooccurrence', self.directory, stdout=io.StringIO())
+        self.assertEqual(self.cooccurring(a), expected)
+        self.assertEqual(self.cooccurring(a, taxa=1), self.ranked((b, 2), (c, 1)))
+        self.assertEqual(self.cooccurring(a, top=1), expected[:1])
+
+        url = reverse('cooccurring_pfams_api', kwargs={'pk': a.pfam_id})
+        self.assertEqual(self.client.get(url, {'top': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'taxa': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        missing = reverse('cooccurring_pfams_api', kwargs={'pk': 'missing'})
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+    def post_protein(self, *pfams):
+        """Create a protein of organism 2 with domains of the `pfams` through the API, logging it."""
+        data = dict(ProteinSerializerFactory.build(), taxonomy={'taxa_id': 2}, domains=[{
+            'description': 'Domain', 'start': 1, 'stop': 10,
+            'pfam_id': {'domain_id': pfam.pfam_id, 'domain_description': pfam.description}
+        } for pfam in pfams])
+        with self.settings(COOCCURRENCE_DIR=self.directory), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('protein_create_api'), data, format='json').status_code,
+                             status.HTTP_201_CREATED)
+
+    def test_insertedProteinUpdatesMatrix(self):
+        a, b, c = self.pfams
+        cooccurrence.build_matrix(self.directory)
+        self.post_protein(b, c)
+
+        self.assertEqual(self.cooccurring(c, taxa=2), self.ranked((a, 1), (b, 1)))
+        self.assertEqual(self.cooccurring(b), self.ranked((a, 2), (c, 2)))
+        cooccurrence.build_matrix(self.directory)
+        self.assertEqual(self.cooccurring(b), self.ranked((a, 2), (c, 2)))
+
+    def test_recordedProteinInvalidatesCachedResponses(self):
+        a, b, _ = self.pfams
+        entities = [('pfam', a.pfam_id), ('pfam', b.pfam_id), ('taxa', 2)]
+        versions = compression.versions(entities)
+        with self.settings(COOCCURRENCE_DIR=self.directory):
+            cooccurrence.record_protein(2, [a.pfam_id, b.pfam_id])
+        changed = [old != new for old, new in zip(versions, compression.versions(entities))]
+        self.assertEqual(changed, [False, True, True, True])
+
+    def test_proteinLoggedWhileBuildingIsCountedOnce(self):
+        a, b, c = self.pfams
+        read_domains = cooccurrence.read_domains
+
+        def insert_then_read(marks):
+            self.post_protein(b, c)
+            return read_domains(marks)
+
+        cooccurrence.build_matrix(self.directory)
+        with mock.patch('proteinmap.cooccurrence.read_domains', side_effect=insert_then_read):
+            cooccurrence.build_matrix(self.directory)
+        self.assertEqual(self.cooccurring(c, taxa=2), self.ranked((a, 1), (b, 1)))
+        self.assertEqual(self.cooccurring(b), self.ranked((a, 2), (c, 2)))
+
+        with self.settings(COOCCURRENCE_DIR=self.directory):
+            cooccurrence.record_protein(2, [a.pfam_id, b.pfam_id])
+        cooccurrence.build_matrix(self.directory)
+        self.assertEqual(self.cooccurring(b), self.ranked((a, 2), (c, 2)))
+
+    def test_buildJob(self):
+        with self.settings(COOCCURRENCE_DIR=self.directory):
+            response = self.client.post(reverse('job_create_api'), {'kind': 'build_cooccurrence'}, format='json')
+            call_command('run_workers', processes=1, burst=True)
+        self.assertEqual(Job.objects.get(pk=response.data['id']).result, {'pfams': 3, 'pairs': 6})
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class CoalescingTest(TestCase):
+    databases = '__all__'
+    factory = RequestFactory()
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.url = reverse('protein_detail_api', kwargs={'pk': 'A0A000'})
+
+    def view(self, request):
+        """Slow view counting its calls, behind the cache lookup of the middleware like on a real request."""
+        request.resolver_match = resolve(request.path_info)
+        cached = self.middleware.process_view(request, None, (), request.resolver_match.kwargs)
+        if cached is not None:
+            return cached
+        self.calls += 1
+        time.sleep(0.2)
+        return JsonResponse({'calls': self.calls})
+
+    def test_concurrentMissesRunViewOnce(self):
+        self.middleware = CompressionMiddleware(self.view)
+        with ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(lambda _: self.middleware(self.factory.get(self.url)), range(5)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(r['X-Cache'] for r in responses), ['HIT'] * 4 + ['MISS'])
+        self.assertEqual({json.loads(r.content)['calls'] for r in responses}, {1})
+
+    @override_settings(COALESCE_TIMEOUT=0)
+    def test_coalescingCanBeDisabled(self):
+        self.middleware = CompressionMiddleware(self.view)
+        with ThreadPoolExecutor(3) as executor:
+            list(executor.map(lambda _: self.middleware(self.factory.get(self.url)), range(3)))
+        self.assertEqual(self.calls, 3)
+
+    @override_settings(COALESCE_TIMEOUT=0.1)
+    def test_flightNeverLandedExpires(self):
+        group = coalescing.SingleFlight()
+        self.assertIsNotNone(group.join('key'))
+        start = time.monotonic()
+        self.assertIsNone(group.join('key'))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertIsNotNone(group.join('key'))
+
+    def test_leaderWaitsForOtherProcess(self):
+        cache.add(coalescing.FLIGHT_PREFIX + 'key', True)
+        threading.Timer(0.1, cache.set, ('key', 'response')).start()
+        flight = coalescing.SingleFlight().join('key')
+        self.assertFalse(flight.shared)
+        self.assertEqual(cache.get('key'), 'response')
+
+    def test_asyncRequestsAreCoalesced(self):
+        group = coalescing.SingleFlight()
+
+        async def leader():
+            flight = await group.ajoin('key')
+            await asyncio.sleep(0.1)
+            flight.land()
+            return flight
+
+        async def requests():
+            return await asyncio.gather(leader(), group.ajoin('key'), group.ajoin('key'))
+
+        self.assertEqual([flight is None for flight in asyncio.run(requests())], [False, True, True])
+        self.assertIsNone(cache.get(coalescing.FLIGHT_PREFIX + 'key'))
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class ThrottlingTest(APITestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        throttling._stores.clear()
+        self.protein = ProteinFactory.create()
+        self.url = reverse('protein_detail_api', kwargs={'pk': self.protein.protein_id})
+
+    def tearDown(self):
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+
+    @override_settings(THROTTLE_RATES={'protein_detail': '2/m'})
+    def test_endpointRateIsPerClient(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_200_OK)
+        url = reverse('pfam_detail_api', kwargs={'pk': 'x'})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(THROTTLE_RATES={'read': '1/m', 'write': '5/m'})
+    def test_scopeDefaultsToRequestMethod(self):
+        url = reverse('domain_coverage_api', kwargs={'protein_id': self.protein.protein_id})
+        self.client.get(url)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(reverse('protein_create_api'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(THROTTLE_RATES={'protein_detail': '2/m'}, RESPONSE_CACHE_TIMEOUT=300)
+    def test_cachedResponsesAreThrottled(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotIn('X-Cache', response)
+
+    def test_tokensAreRefilledWithTime(self):
+        store = throttling.MemoryBucketStore()
+        self.assertEqual(store.take('key', 2, 1.0, 100.0), 0)
+        self.assertEqual(store.take('key', 2, 1.0, 100.0), 0)
+        self.assertEqual(store.take('key', 2, 1.0, 100.5), 0.5)
+        self.assertEqual(store.take('key', 2, 1.0, 101.0), 0)
+
+    @override_settings(THROTTLE_RATES={'protein_detail': '1/m'},
+                       THROTTLE_BUCKET_STORE='proteinmap.throttling.CacheBucketStore')
+    def test_bucketsCanBeSharedThroughCache(self):
+        self.client.get(self.url)
+        self.assertIsNotNone(cache.get(throttling.BUCKET_PREFIX + 'protein_detail:127.0.0.1'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(THROTTLE_RATES={'protein_detail': '1/m'})
+    async def test_asyncViewIsThrottled(self):
+        view = async_api.ProteinDetail.as_view()
+        request = AsyncRequestFactory().get('/')
+        await view(request, pk=self.protein.protein_id)
+        response = await view(request, pk=self.protein.protein_id)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('throttled', json.loads(response.content)['detail'])
+
+class QueryApiTest(APITestCase):
+    databases = '__all__'
+    url = reverse('query_api')
+
+    def setUp(self):
+        self.organism = OrganismFactory.create()
+        self.proteins = sorted(ProteinFactory.create_batch(3, organism=self.organism), key=lambda p: p.protein_id)
+        for protein in self.proteins:
+            DomainFactory.create_batch(2, protein=protein)
+        SequenceFactory.create(protein=self.proteins[0])
+
+    def tearDown(self):
+        Domain.objects.all().delete()
+        Sequence.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def query(self, text):
+        return self.client.post(self.url, {'query': text}, format='json')
+
+    def test_nestedQueryLoadsEachLevelOnce(self):
+        text = '{ organism(taxa_id: %d) { genus proteins { protein_id length domains { start pfam { pfam_id } } } } }'
+        # Reads are kept on the primary, where queries are captured, when replicas are set
+        with use_primary(), self.assertNumQueries(4):
+            response = self.query(text % self.organism.taxa_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        organism = response.data['data']['organism']
+        self.assertEqual(organism['genus'], self.organism.genus)
+        self.assertListEqual([p['protein_id'] for p in organism['proteins']], [p.protein_id for p in self.proteins])
+        domains = Domain.objects.filter(protein=self.proteins[0]).order_by('pk')
+        self.assertListEqual(organism['proteins'][0]['domains'], [
+            {'start': d.start, 'pfam': {'pfam_id': d.pfam_id}} for d in domains
+        ])
+
+    def test_queryFromGetParameterWithAliasesAndPagination(self):
+        text = 'query { first: organism(taxa_id: %d) { proteins(limit: 1, offset: 1) { protein_id } } ' \
+               'other: protein(protein_id: "%s") { sequence organism { taxa_id } } }'
+        response = self.client.get(self.url, {'query': text % (self.organism.taxa_id, self.proteins[0].protein_id)})
+        self.assertEqual(response.data['data']['first'], {'proteins': [{'protein_id': self.proteins[1].protein_id}]})
+        self.assertEqual(response.data['data']['other'], {
+            'sequence': self.proteins[0].sequence.sequence, 'organism': {'taxa_id': self.organism.taxa_id}
+        })
+
+    def test_missingObjectIsNull(self):
+        response = self.query('{ pfam(pfam_id: "missing") { pfam_id } }')
+        self.assertEqual(response.data, {'data': {'pfam': None}})
+
+    def test_paginationPerParentInOneQuery(self):
+        other = ProteinFactory.create_batch(2, organism=OrganismFactory.create(taxa_id=self.organism.taxa_id + 1))
+        relation = query.RELATIONS['Organism']['proteins']
+        keys = sorted([self.organism.taxa_id, other[0].organism_id])
+        with use_primary(), self.assertNumQueries(1):
+            rows = query.fetch(relation, keys, ['organism_id', 'protein_id'], {'limit': 1}, query.Cost())
+        self.assertEqual([row['organism_id'] for row in rows], keys)
+
+    def test_invalidQueriesReturnErrors(self):
+        for text, message in [
+            ('', 'A query is required.'),
+            ('{ organism { genus } }', "Field 'organism' requires the argument 'taxa_id'."),
+            ('{ organism(taxa_id: "1") { genus } }', "Argument 'taxa_id' of field 'organism' must be an integer."),
+            ('{ organism(taxa_id: 1) { name } }', "Unknown field 'name' on type Organism."),
+            ('{ organism(taxa_id: 1) { proteins } }', "Field 'proteins' of type Protein must have a selection."),
+            ('{ organism(taxa_id: 1) { genus }', 'Expected name, found end of query.'),
+            ('{ organism(taxa_id: 1) { genus genus } }', "Field or alias 'genus' is selected more than once."),
+            ('{ a: pfam(pfam_id: "x") { pfam_id } a: protein(protein_id: "x") { length } }',
+             "Field or alias 'a' is selected more than once."),
+        ]:
+            response = self.query(text)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'errors': [{'message': message}]})
+
+    def test_depthAndCostAreLimited(self):
+        text = '{ protein(protein_id: "x") { %s protein_id %s } }'
+        nested = 'domains { protein { ' * 3, '} } ' * 3
+        response = self.query(text % nested)
+        self.assertEqual(response.data['errors'][0]['message'], 'Query depth exceeds the maximum of 5.')
+
+        with mock.patch('proteinmap.query.MAX_COST', 5):
+            response = self.query('{ organism(taxa_id: %d) { proteins { domains { id } } } }' % self.organism.taxa_id)
+        self.assertEqual(response.data['errors'][0]['message'], 'Query cost exceeds the maximum of 5.')
+
+        # Different selections do not share their relations, each one is a planned query
+        count = query.max_queries()
+        fields = ('p%d: protein(protein_id: "x") { d%d: domains { id } }' % (i, i) for i in range(count))
+        text = '{ %s }' % ' '.join(fields)
+        with use_primary(), self.assertNumQueries(0):
+            response = self.query(text)
+        self.assertEqual(response.data['errors'][0]['message'],
+                         'Query needs more than the maximum of %d SQL queries.' % count)
+
+    def test_rootFieldsOfOneTypeAreLoadedTogether(self):
+        first, second, third = self.proteins
+        text = '{ a: protein(protein_id: "%s") { domains { id } } b: protein(protein_id: "%s") { domains { id } } ' \
+               'c: protein(protein_id: "%s") { length } d: protein(protein_id: "missing") { length } }'
+        with use_primary(), self.assertNumQueries(2):
+            response = self.query(text % (first.protein_id, second.protein_id, third.protein_id))
+        data = response.data['data']
+        self.assertEqual(list(data), ['a', 'b', 'c', 'd'])
+        for alias, protein in (('a', first), ('b', second)):
+            self.assertEqual(data[alias], {'domains': [{'id': d.id} for d in protein.domains.order_by('pk')]})
+        self.assertEqual(data['c'], {'length': third.length})
+        self.assertIsNone(data['d'])
+
+class TaxonomyTest(APITestCase):
+    databases = '__all__'
+    nodes = [(1, 1, 'no rank'), (10, 1, 'phylum'), (11, 10, 'species'), (12, 10, 'genus'), (13, 12, 'species'),
+             (20, 1, 'phylum'), (21, 20, 'species'), (30, 1, 'phylum'), (31, 30, 'species')]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.nodes_path = os.path.join(self.directory, 'nodes.dmp')
+        self.names_path = os.path.join(self.directory, 'names.dmp')
+        with open(self.nodes_path, 'w') as nodes_file:
+            nodes_file.writelines('%d\t|\t%d\t|\t%s\t|\t\t|\n' % node for node in self.nodes)
+        with open(self.names_path, 'w') as names_file:
+            for taxa, _, _ in self.nodes:
+                names_file.write('%d\t|\tTaxon %d\t|\t\t|\tscientific name\t|\n' % (taxa, taxa))
+                names_file.write('%d\t|\tsynonym %d\t|\t\t|\tsynonym\t|\n' % (taxa, taxa))
+
+        self.proteins = {}
+        for taxa in (11, 13, 21):
+            organism = OrganismFactory.create(taxa_id=taxa)
+            self.proteins[taxa] = ProteinFactory.create(organism=organism)
+            DomainFactory.create(protein=self.proteins[taxa])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Taxon.objects.all().delete()
+        Domain.objects.all().delete()
+        Protein.objects.all().delete()
+        Organism.objects.all().delete()
+        Pfam.objects.all().delete()
+
+    def load(self, *options):
+        output = io.StringIO()
+        call_command('load_taxonomy', self.nodes_path, self.names_path, *options, stdout=output)
+        return output.getvalue()
+
+    def test_loadNumbersNestedIntervals(self):
+        self.assertEqual(self.load(), 'Loaded 9 taxonomy nodes, covering 3 organisms\n')
+        intervals = dict((t, (l, r)) for t, l, r in Taxon.objects.values_list('taxa_id', 'lft', 'rgt'))
+        self.assertEqual(intervals[1], (1, 18))
+        self.assertEqual(intervals[10], (2, 9))
+        self.assertEqual(intervals[13], (6, 7))
+        taxon = Taxon.objects.get(pk=12)
+        self.assertEqual((taxon.name, taxon.rank, taxon.parent_id), ('Taxon 12', 'genus', 10))
+        self.assertIsNone(Taxon.objects.get(pk=1).parent_id)
+
+    def test_pruneKeepsOrganismsAndAncestors(self):
+        self.assertEqual(self.load('--prune'), 'Loaded 7 taxonomy nodes, covering 3 organisms\n')
+        self.assertFalse(Taxon.objects.filter(pk__in=[30, 31]).exists())
+
+    def test_higherRankListsOrganismsBelow(self):
+        self.load()
+        response = self.client.get(reverse('organism_proteins_api', kwargs={'taxa': 10}))
+        self.assertCountEqual([p['protein_id'] for p in response.data],
+                              [self.proteins[11].protein_id, self.proteins[13].protein_id])
+        response = self.client.get(reverse('organism_pfams_api', kwargs={'taxa': 1}))
+        self.assertEqual(len(response.data), 3)
+        response = self.client.get(reverse('organism_proteins_api', kwargs={'taxa': 13}))
+        self.assertEqual([p['protein_id'] for p in response.data], [self.proteins[13].protein_id])
+
+    def test_descendantsAreSelectedWithOneRangePredicate(self):
+        self.load()
+        # Reads are kept on the primary, where queries are captured, when replicas are set
+        with use_primary(), CaptureQueriesContext(connection) as queries:
+            list(Protein.objects.filter(taxonomy.organism_filter(10)))
+        self.assertEqual(len(queries), 2)
+        self.assertIn('BETWEEN 2 AND 9', queries[1]['sql'])
+
+    def test_higherRankStreamsSequencesFeaturesAndExports(self):
+        self.load()
+        for taxa in (11, 13, 21):
+            SequenceFactory.create(protein=self.proteins[taxa], sequence='ACDE')
+        below = sorted([self.proteins[11].protein_id, self.proteins[13].protein_id])
+
+        response = self.client.get(reverse('organism_sequences_api', kwargs={'taxa': 10}))
+        records = read_fasta(io.StringIO(b''.join(response.streaming_content).decode()))
+        self.assertEqual(sorted(records), sorted([('%s OX=11' % self.proteins[11].protein_id, 'ACDE'),
+                                                  ('%s OX=13' % self.proteins[13].protein_id, 'ACDE')]))
+
+        response = self.client.get(reverse('organism_features_api', kwargs={'taxa': 10}))
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(sorted(row['protein_id'] for row in rows), below)
+
+        response = self.client.get(reverse('export_api', kwargs={'kind': 'proteins'}), {'taxa': 10})
+        table = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(sorted(row['protein_id'] for row in table), below)
+        self.assertEqual(sorted(row['taxa_id'] for row in table), ['11', '13'])
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=300)
+    def test_proteinBelowInvalidatesCachedHigherRankListing(self):
+        self.load()
+        url = reverse('organism_proteins_api', kwargs={'taxa': 10})
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        protein = ProteinFactory.create(organism=self.proteins[13].organism)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(protein.protein_id, [p['protein_id'] for p in response.data])
+
+    def test_snapshotHigherRankListsOrganismsBelow(self):
+        self.load()
+        urls = [reverse(name, kwargs={'taxa': taxa}) for name in ('organism_proteins_api', 'organism_pfams_api')
+                for taxa in (1, 10, 12, 13, 30, 99)]
+        expected = [self.client.get(url).data for url in urls]
+        export = reverse('export_api', kwargs={'kind': 'domains'})
+        exported = b''.join(self.client.get(export, {'taxa': 10}).streaming_content).decode().splitlines()
+        self.assertEqual(len(exported), 3)
+        path = os.path.join(self.directory, 'snapshot')
+        write_snapshot(path)
+        with self.settings(SNAPSHOT_DIR=path):
+            for url, data in zip(urls, expected):
+                self.assertCountEqual(self.client.get(url).data, data)
+            response = self.client.get(export, {'taxa': 10})
+            self.assertCountEqual(b''.join(response.streaming_content).decode().splitlines(), exported)
+            response = async_to_sync(async_api.OrganismProteins.as_view())(AsyncRequestFactory().get('/'), taxa=10)
+        proteins = [p['protein_id'] for p in json.loads(response.content)]
+        self.assertEqual(proteins, [self.proteins[11].protein_id, self.proteins[13].protein_id])
+
+    def test_organismWithoutTaxonomyIsListed(self):
+        response = self.client.get(reverse('organism_proteins_api', kwargs={'taxa': 21}))
+        self.assertEqual([p['protein_id'] for p in response.data], [self.proteins[21].protein_id])
+
+    async def test_asyncHigherRankListsOrganismsBelow(self):
+        await sync_to_async(self.load)()
+        response = await async_api.OrganismProteins.as_view()(AsyncRequestFactory().get('/'), taxa=20)
+        data = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(data, [{'protein_id': self.proteins[21].protein_id}])
+
+@override_settings(DATABASE_SHARDS=['shard0', 'shard1'])
+class ShardingTest(TransactionTestCase):
+    """Runs against two SQLite shards in temporary files, registered as databases for this test case only."""
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        for alias in ('shard0', 'shard1'):
+            connections.settings[alias] = dict(connections.settings['default'], CONN_MAX_AGE=0,
+                                               NAME=os.path.join(cls.directory, alias + '.sqlite3'))
+        super().setUpClass()
+        for alias in ('shard0', 'shard1'):
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in ('shard0', 'shard1'):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        # Taxa 2 lives on shard0 and taxa 3 on shard1
+        self.organisms = [OrganismFactory.create(taxa_id=2), OrganismFactory.create(taxa_id=3)]
+        self.pfam = PfamFactory.create()
+        # Factories create on the database of their options, built instances are saved through the routers
+        self.proteins = []
+        for organism in self.organisms:
+            protein = ProteinFactory.build(organism=organism, length=100)
+            protein.save()
+            SequenceFactory.build(protein=protein).save()
+            DomainFactory.build(protein=protein, pfam=self.pfam, start=1, stop=50).save()
+            self.proteins.append(protein)
+
+    def shard_protein_ids(self, alias):
+        return list(Protein.objects.using(alias).values_list('protein_id', flat=True))
+
+    def test_proteinsAreSavedOnTheShardOfTheirOrganism(self):
+        self.assertEqual(shard_for(2), 'shard0')
+        self.assertEqual(self.shard_protein_ids('shard0'), [self.proteins[0].protein_id])
+        self.assertEqual(self.shard_protein_ids('shard1'), [self.proteins[1].protein_id])
+        self.assertEqual(Domain.objects.using('shard1').get().protein_id, self.proteins[1].protein_id)
+        self.assertFalse(Protein.objects.using('default').exists())
+
+    def test_referenceRowsAreCopiedToEveryShard(self):
+        for alias in ('shard0', 'shard1'):
+            self.assertEqual(Organism.objects.using(alias).count(), 2)
+            self.assertTrue(Pfam.objects.using(alias).filter(pk=self.pfam.pk).exists())
+        self.organisms[0].genus = 'Renamed'
+        self.organisms[0].save()
+        self.assertEqual(Organism.objects.using('shard1').get(pk=2).genus, 'Renamed')
+        self.organisms[1].delete()
+        self.assertFalse(Organism.objects.using('shard1').filter(pk=3).exists())
+        self.assertEqual(self.shard_protein_ids('shard1'), [])
+
+    def test_readsFindProteinsOnTheirShard(self):
+        protein = self.proteins[1]
+        response = self.client.get(reverse('protein_detail_api', kwargs={'pk': protein.protein_id}))
+        self.assertEqual(response.data['sequence'], protein.sequence.sequence)
+        self.assertEqual(len(response.data['domains']), 1)
+        response = self.client.get(reverse('domain_coverage_api', kwargs={'protein_id': protein.protein_id}))
+        self.assertEqual(json.loads(response.content), 0.49)
+        response = self.client.get(reverse('protein_detail_api', kwargs={'pk': 'x'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_organismListQueriesOnlyItsShard(self):
+        with CaptureQueriesContext(connections['shard0']) as queries:
+            response = self.client.get(reverse('organism_proteins_api', kwargs={'taxa': 3}))
+        self.assertEqual([p['protein_id'] for p in response.data], [self.proteins[1].protein_id])
+        self.assertEqual(len(queries), 0)
+
+    def test_createIsRoutedAndDuplicatesAreRejectedAcrossShards(self):
+        data = dict(ProteinSerializerFactory.build(), taxonomy={'taxa_id': 3}, domains=[{
+            'description': 'Domain', 'start': 1, 'stop': 10,
+            'pfam_id': {'domain_id': self.pfam.pfam_id, 'domain_description': self.pfam.description}
+        }])
+        response = self.client.post(reverse('protein_create_api'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(data['protein_id'], self.shard_protein_ids('shard1'))
+
+        data['protein_id'] = self.proteins[0].protein_id
+        response = self.client.post(reverse('protein_create_api'), data, content_type='application/json')
+        self.assertContains(response, 'already exists', status_code=status.HTTP_400_BAD_REQUEST)
+
+    def test_fanOutAndMergeReadEveryShard(self):
+        ids = [p.protein_id for p in self.proteins]
+        self.assertEqual(sharding.fan_out(self.shard_protein_ids), [[ids[0]], [ids[1]]])
+        rows = sharding.merge(lambda alias: Protein.objects.using(alias).values_list('protein_id', flat=True).iterator())
+        self.assertCountEqual(list(rows), ids)
+        response = self.client.get(reverse('export_api', kwargs={'kind': 'proteins'}), {'format': 'csv'})
+        self.assertEqual(b''.join(response.streaming_content).count(b'\n'), 3)
+
+    def test_higherRankStreamsReadEveryShard(self):
+        Taxon.objects.create(taxa_id=1, name='root', rank='no rank', lft=1, rgt=6)
+        Taxon.objects.create(taxa_id=2, name='first', rank='species', parent_id=1, lft=2, rgt=3)
+        Taxon.objects.create(taxa_id=3, name='second', rank='species', parent_id=1, lft=4, rgt=5)
+        ids = sorted(p.protein_id for p in self.proteins)
+
+        response = self.client.get(reverse('organism_sequences_api', kwargs={'taxa': 1}))
+        self.assertEqual(b''.join(response.streaming_content).count(b'>'), 2)
+        response = self.client.get(reverse('organism_features_api', kwargs={'taxa': 1}))
+        self.assertEqual(sorted(row['protein_id'] for row in json.loads(b''.join(response.streaming_content))), ids)
+        response = self.client.get(reverse('export_api', kwargs={'kind': 'domains'}), {'taxa': 1})
+        self.assertEqual(b''.join(response.streaming_content).count(b'\n'), 3)
+
+    def test_syncShardsCopiesBulkLoadsAndReservesIdRanges(self):
+        Taxon.objects.bulk_create([Taxon(taxa_id=1, name='root', rank='no rank', lft=1, rgt=2)])
+        output = io.StringIO()
+        call_command('sync_shards', stdout=output)
+        self.assertIn('1 taxon', output.getvalue())
+        self.assertEqual(Taxon.objects.using('shard1').get().name, 'root')
+        domain = DomainFactory.build(protein=self.proteins[1], pfam=self.pfam, start=1, stop=10)
+        domain.save()
+        self.assertGreaterEqual(domain.pk, 2 * sharding.SHARD_ID_RANGE)
+
+class WriteSerializationTest(APITestCase):
+    databases = '__all__'
+
+    def concurrent_writers(self, threads=4):
+        """Greatest number of threads inside `serialized_writes()` at the same time."""
+        lock = threading.Lock()
+        inside = []
+        overlap = [0]
+
+        def write():
+            with serialized_writes('default'):
+                with lock:
+                    inside.append(1)
+                    overlap[0] = max(overlap[0], len(inside))
+                time.sleep(0.02)
+                with lock:
+                    inside.pop()
+
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(lambda _: write(), range(threads)))
+        return overlap[0]
+
+    @override_settings(SERIALIZE_WRITES=True)
+    def test_serializedWritesDoNotOverlap(self):
+        self.assertEqual(self.concurrent_writers(), 1)
+
+    def test_writesAreNotSerializedByDefault(self):
+        self.assertGreater(self.concurrent_writers(), 1)
+
+    @override_settings(SERIALIZE_WRITES=True)
+    def test_proteinCreateIsSerialized(self):
+        data = ProteinSerializerFactory.build()
+        for domain in data['domains']:
+            PfamFactory.create(pk=domain['pfam_id']['domain_id'])
+        OrganismFactory.create(pk=data['organism']['taxa_id'])
+        response = self.client.post(reverse('protein_create_api'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_lockedDatabaseReturnsServiceUnavailable(self):
+        with mock.patch.object(ProteinSerializer, 'create', side_effect=OperationalError('database is locked')):
+            data = ProteinSerializerFactory.build()
+            for domain in data['domains']:
+                PfamFactory.create(pk=domain['pfam_id']['domain_id'])
+            OrganismFactory.create(pk=data['organism']['taxa_id'])
+            response = self.client.post(reverse('protein_create_api'), data, format='json')
+        self.assertContains(response, 'database is locked', status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+class LoadTestPlanTest(TestCase):
+    databases = '__all__'
+
+    def test_planMixesRealKeysWithZipfianPopularity(self):
+        synthetic.generate(200, seed=1)
+        requests = load.plan({'protein_detail': 3, 'protein_create': 1}, 400, 100, 1.1, seed=0)
+        details = [path for kind, _, path, _ in requests if kind == 'protein_detail']
+        creates = [json.loads(body) for kind, _, _, body in requests if kind == 'protein_create']
+        self.assertEqual(len(details) + len(creates), 400)
+        self.assertGreater(len(creates), 50)
+
+        protein_ids = set(Protein.objects.values_list('protein_id', flat=True))
+        self.assertTrue(all(path.split('/')[3] in protein_ids for path in details))
+        self.assertEqual(len({payload['protein_id'] for payload in creates}), len(creates))
+        # The most popular of 100 keys gets about a fifth of the requests, instead of 1% when uniform
+        self.assertGreater(max(details.count(path) for path in details), len(details) / 10)
+        self.assertEqual(requests, load.plan({'protein_detail': 3, 'protein_create': 1}, 400, 100, 1.1, seed=0))
+
 # end of code I wrote
\ No newline at end of file
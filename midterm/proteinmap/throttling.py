@@ -0,0 +1,126 @@
+# I wrote this code
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+# Seconds of each period of a rate such as `100/s` or `1000/m`
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Buckets kept by `MemoryBucketStore`, the least recently used clients are forgotten past it
+MAX_BUCKETS = 100000
+
+# Prefix of the cache keys of the buckets of `CacheBucketStore`
+BUCKET_PREFIX = 'proteinmap:throttle:'
+
+
+def parse_rate(rate):
+    """Returns the `(capacity, tokens per second)` of a rate `<requests>/<period>`, None when the rate is None."""
+    if rate is None:
+        return None
+    requests, period = rate.split('/')
+    return int(requests), int(requests) / PERIODS[period[0]]
+
+def fill(bucket, capacity, refill, now):
+    """Tokens of a `(tokens, time)` bucket refilled until `now`, a missing bucket is full."""
+    if bucket is None:
+        return capacity
+    tokens, updated = bucket
+    return min(capacity, tokens + (now - updated) * refill)
+
+class MemoryBucketStore:
+    """
+    Token buckets in the memory of the process, each worker limits its own requests.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, capacity, refill, now):
+        """Take a token from the bucket `key`, returns 0 when taken, otherwise the seconds until one is available."""
+        with self.lock:
+            tokens = fill(self.buckets.pop(key, None), capacity, refill, now)
+            wait = 0 if tokens >= 1 else (1 - tokens) / refill
+            self.buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            if len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return wait
+
+class CacheBucketStore:
+    """
+    Token buckets on the default cache, shared by all the workers when the cache backend is shared (e.g. Redis).
+
+    Rational:
+        a bucket is read and written back without a lock, concurrent requests of the same client
+        on different workers may both take the last token, which lets a few more requests through
+        than the rate but never blocks a request on another worker.
+    """
+    def take(self, key, capacity, refill, now):
+        key = BUCKET_PREFIX + key
+        tokens = fill(cache.get(key), capacity, refill, now)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill
+        cache.set(key, (tokens - 1 if wait == 0 else tokens, now), int(capacity / refill) + 1)
+        return wait
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_bucket_store():
+    """Returns the store of the `THROTTLE_BUCKET_STORE` setting (a dotted path), shared by the whole process."""
+    with _stores_lock:
+        store = _stores.get(settings.THROTTLE_BUCKET_STORE)
+        if store is None:
+            store = _stores[settings.THROTTLE_BUCKET_STORE] = import_string(settings.THROTTLE_BUCKET_STORE)()
+    return store
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle limiting the requests of each client to every endpoint with a token bucket.
+
+    Rational:
+        the rate of a view is the one of its `throttle_scope` on the `THROTTLE_RATES` setting,
+        or of the `read` or `write` scope by request method, and a scope without rate is not throttled.
+        A rate `N/period` lets bursts of `N` requests through, and refills `N` tokens per period,
+        so a client polling steadily is never throttled while a burst after a cache flush is spread.
+        Clients are identified by address (`get_ident()` honors the `NUM_PROXIES` setting of DRF).
+    """
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope in settings.THROTTLE_RATES:
+            return scope
+        return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = parse_rate(settings.THROTTLE_RATES.get(scope))
+        if rate is None:
+            return True
+        key = '%s:%s' % (scope, self.get_ident(request))
+        self.wait_seconds = get_bucket_store().take(key, *rate, time.time())
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+def throttled_response(request, scope):
+    """
+    Returns the 429 response of the DRF views when the client of a plain Django view exceeded the rate of `scope`,
+    None when the request is allowed.
+    """
+    throttle = TokenBucketThrottle()
+    if throttle.allow_request(request, SimpleNamespace(throttle_scope=scope)):
+        return None
+    response = JsonResponse({'detail': Throttled(throttle.wait()).detail}, status=429)
+    response.headers['Retry-After'] = str(math.ceil(throttle.wait()))
+    return response
+
+# end of code I wrote
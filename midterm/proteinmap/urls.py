@@ -1,11 +1,13 @@
 # I wrote this code
 
+from django.conf import settings
 from django.urls import path, re_path
 from django.views.generic import RedirectView, TemplateView
-from rest_framework.schemas import get_schema_view
 
+from . import api, async_api
 
-from . import api
+# Read endpoints are served by the async-native views when running under ASGI
+read_api = async_api if settings.ASYNC_API else api
 
 urlpatterns = [
     # Redirect home path to the swagger endpoint
@@ -19,18 +21,24 @@ urlpatterns = [
         extra_context={'schema_url':'openapi-schema'}
     ), name='swagger-ui'),
     # OpenAPI specification endpoint
-    path('openapi', get_schema_view(
-        title="Protein map",
-        description="By Rodrigo Chin",
-        version="0.1.0"
-    ), name='openapi-schema'),
+    path('openapi', api.openapi_schema, name='openapi-schema'),
+    # Prometheus metrics endpoint
+    path('metrics', api.metrics, name='metrics'),
     # REST API endpoints
     path('api/protein/', api.ProteinCreate.as_view(), name='protein_create_api'),
-    path('api/protein/<str:pk>/', api.ProteinDetail.as_view(), name='protein_detail_api'),
-    path('api/pfam/<str:pk>/', api.PfamDetail.as_view(), name='pfam_detail_api'),
-    path('api/proteins/<str:taxa>', api.OrganismProteins.as_view(), name='organism_proteins_api'),
-    path('api/pfams/<str:taxa>', api.OrganismPfams.as_view(), name='organism_pfams_api'),
-    path('api/coverage/<str:protein_id>', api.domain_coverage, name='domain_coverage_api'),
+    path('api/protein/<str:pk>/', read_api.ProteinDetail.as_view(), name='protein_detail_api'),
+    path('api/protein/<str:pk>/features', api.sequence_features, name='protein_features_api'),
+    path('api/pfam/<str:pk>/cooccurring', api.cooccurring_pfams, name='cooccurring_pfams_api'),
+    path('api/pfam/<str:pk>/', read_api.PfamDetail.as_view(), name='pfam_detail_api'),
+    path('api/proteins/<int:taxa>.fasta', api.organism_sequences, name='organism_sequences_api'),
+    path('api/proteins/<int:taxa>/features', api.organism_features, name='organism_features_api'),
+    path('api/proteins/<str:taxa>', read_api.OrganismProteins.as_view(), name='organism_proteins_api'),
+    path('api/pfams/<str:taxa>', read_api.OrganismPfams.as_view(), name='organism_pfams_api'),
+    path('api/query', api.Query.as_view(), name='query_api'),
+    path('api/coverage/<str:protein_id>', read_api.domain_coverage, name='domain_coverage_api'),
+    path('api/export/<str:kind>', api.export_table, name='export_api'),
+    path('api/jobs', api.JobCreate.as_view(), name='job_create_api'),
+    path('api/jobs/<int:pk>', api.JobDetail.as_view(), name='job_detail_api'),
 ]
 
 # end of code I wrote
\ No newline at end of file
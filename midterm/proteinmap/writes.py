@@ -0,0 +1,81 @@
+# I wrote this code
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Seconds a client should wait before retrying a write which failed on a locked database
+LOCKED_RETRY_AFTER = 1
+
+# Lock of each database for the threads of this process, with its lock file `(pid, alias): (lock, file)`
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def lock_path(alias):
+    """Lock file of a database: next to a SQLite file, else in the temporary directory."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        return connection.settings_dict['NAME'] + '.lock'
+    return os.path.join(tempfile.gettempdir(), 'proteinmap-%s.lock' % alias)
+
+def get_lock(alias):
+    # Keyed by process, since a lock file opened before a fork would be shared with the child
+    key = (os.getpid(), alias)
+    with _locks_lock:
+        if key not in _locks:
+            _locks[key] = (threading.Lock(), open(lock_path(alias), 'a') if fcntl is not None else None)
+        return _locks[key]
+
+@contextmanager
+def serialized_writes(alias):
+    """
+    Context manager running its block alone among the writers of the database `alias`, in every thread
+    and worker process of the host, when the `SERIALIZE_WRITES` setting is True. Else it does nothing.
+
+    Rational:
+        SQLite has a single writer, and a transaction which reads before writing fails with `database is locked`
+        without waiting when another writer commits in between. Writers queue on a thread lock, then on an
+        `flock()` of a lock file shared by the worker processes (a single lock per process, since `flock()` is
+        held by the open file of the process, not by a thread), so their transactions never overlap.
+    """
+    if not settings.SERIALIZE_WRITES:
+        yield
+        return
+    lock, lock_file = get_lock(alias)
+    with lock:
+        if lock_file is None:
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def is_database_locked(exception):
+    return isinstance(exception, OperationalError) and 'database is locked' in str(exception)
+
+def exception_handler(exception, context):
+    """
+    REST framework exception handler answering writes which failed on a locked database
+    with a `503` response to retry, instead of a server error.
+    """
+    if is_database_locked(exception):
+        return Response({'detail': 'database is locked'}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={'Retry-After': str(LOCKED_RETRY_AFTER)})
+    return drf_exception_handler(exception, context)
+
+# end of code I wrote
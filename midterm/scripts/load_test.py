@@ -0,0 +1,124 @@
+# I wrote this code
+
+"""
+Concurrent load test for a running server, used to compare the WSGI and ASGI deployments.
+
+Each client keeps one HTTP/1.1 keep-alive connection open and requests the given
+paths round-robin until the total number of requests is reached.
+Results are printed as JSON (throughput and latency percentiles in milliseconds).
+
+    gunicorn midterm.wsgi --workers 1 --threads 8 --bind 127.0.0.1:8000
+    uvicorn midterm.asgi:application --workers 1 --port 8001
+    python scripts/load_test.py http://127.0.0.1:8000 --path /api/protein/A0A016S8J7/ --path /api/proteins/53326
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+async def read_body(reader, headers):
+    """Read a response body delimited either by `Content-Length` or chunked encoding."""
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+
+    body = b''
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                return body
+            body += chunk[:-2]
+    return body + await reader.read()
+
+async def request(reader, writer, host, path, method='GET', body=None):
+    """
+    Send a request on an open connection, with a JSON `body` if given.
+    Returns its status code, whether the server closes the connection, and the response body.
+    """
+    head = '%s %s HTTP/1.1\r\nHost: %s\r\nAccept: application/json\r\n' % (method, path, host)
+    if body is not None:
+        head += 'Content-Type: application/json\r\nContent-Length: %d\r\n' % len(body)
+    writer.write(head.encode() + b'\r\n' + (body or b''))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    content = await read_body(reader, headers)
+    return status, headers.get('connection') == 'close', content
+
+async def client(url, paths, jobs, latencies, errors):
+    """Run requests from the shared `jobs` counter until it is exhausted, reconnecting when needed."""
+    connection = None
+    while jobs:
+        index = jobs.pop()
+        if connection is None:
+            connection = await asyncio.open_connection(url.hostname, url.port or 80)
+
+        start = time.perf_counter()
+        try:
+            status, close, _ = await request(*connection, url.netloc, paths[index % len(paths)])
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            status, close = None, True
+        latencies.append(time.perf_counter() - start)
+
+        if status is None or status >= 500:
+            errors.append(status)
+        if close:
+            connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(base_url, paths, concurrency, total):
+    url = urlsplit(base_url)
+    jobs = list(range(total))
+    latencies = []
+    errors = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(url, paths, jobs, latencies, errors) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'url': base_url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent HTTP load test for the protein map API.')
+    parser.add_argument('url', nargs='+', help='Base URL of each server to test, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', required=True, help='Request path, can be repeated')
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of concurrent connections')
+    parser.add_argument('--requests', type=int, default=5000, help='Total number of requests per server')
+    args = parser.parse_args()
+
+    for base_url in args.url:
+        print(json.dumps(asyncio.run(run(base_url, args.path, args.concurrency, args.requests))))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of code I wrote
@@ -9,7 +9,7 @@ sys.path.append('../midterm')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'midterm.settings')
 django.setup()
 
-from proteinmap.models import *
+from proteinmap.models import Domain, Organism, Pfam, Protein, Sequence
 
 
 """